@@ -1,12 +1,21 @@
 import os
+import json
 import pandas as pd
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, current_app, Response, stream_with_context, g
 from flask_cors import CORS
 from pydantic import BaseModel, Field
 from loguru import logger
 import time
 from dotenv import load_dotenv
-from rag.utils import init_vector_store, answer_question, process_news_pipeline
+from rag.utils import answer_question, process_news_pipeline
+from rag.rag_context import init_rag_context
+from rag.answer_cache import get_answer_cache
+from rag.jobs import JobManager, FileJobManager
+from rag.pipeline_service import run_pipeline_job
+from rag.serving import preload_shared_state, sync_published_state, readiness
+from rag.article_store import get_article_store
+from rag.columnar_store import load_frame
+from rag.metrics import begin_request, end_request, render_metrics, SamplingProfiler, profile_path
 from config import Config
 from datetime import datetime
 
@@ -20,6 +29,8 @@ class ChatRequest(BaseModel):
 class ProcessNewsRequest(BaseModel):
     news_csv_path: str = None
     highlights_csv_path: str = None
+    incremental: bool = None
+    streaming: bool = None
 
 # Create Blueprint for API routes
 api_bp = Blueprint("api", __name__, url_prefix="/api")
@@ -42,41 +53,133 @@ def chat():
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({"error": "Failed to process request"}), 500
 
+@api_bp.route("/chat/stream", methods=["GET", "POST"])
+def chat_stream():
+    """Answer a question as Server-Sent Events
+    
+    Emits a `sources` event as soon as retrieval finishes, one `token` event per
+    generated token and a final `done` event with the full answer. GET takes the
+    question as a query parameter so the endpoint works with EventSource.
+    """
+    try:
+        data = request.json if request.method == "POST" else {"question": request.args.get("question", "")}
+        chat_request = ChatRequest(**data)
+    except Exception as e:
+        logger.error(f"Invalid chat stream request: {str(e)}")
+        return jsonify({"error": "Bad request"}), 400
+    
+    def generate():
+        start_time = time.time()
+        try:
+            for event, payload in answer_question(chat_request.question, stream=True):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            logger.info(f"Question streamed in {time.time() - start_time:.2f}s: {chat_request.question}")
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Failed to process request'})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_bp.route("/chat/cache", methods=["GET"])
+def chat_cache_stats():
+    return jsonify(get_answer_cache().stats())
+
+# Single background worker for pipeline runs; under gunicorn the pipeline process runs them
+job_manager = FileJobManager() if Config.MULTIPROCESS_SERVING else JobManager(run_pipeline_job)
+
+@api_bp.before_app_request
+def sync_shared_state():
+    # Pick up articles and highlights published by the pipeline process
+    if Config.MULTIPROCESS_SERVING:
+        sync_published_state()
+
+@api_bp.before_app_request
+def start_request_metrics():
+    g.trace = begin_request() if Config.METRICS_ENABLED else None
+    g.profiler = None
+    if Config.PROFILING_ENABLED and (request.args.get("profile") or request.headers.get("X-Profile")):
+        g.profiler = SamplingProfiler().start()
+
+@api_bp.after_app_request
+def finish_request_metrics(response):
+    trace, profiler = g.get("trace"), g.get("profiler")
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    method = request.method
+    if trace is not None and trace.spans:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if profiler is not None:
+        path = profile_path(endpoint)
+        response.headers["X-Profile-Path"] = path
+    
+    # Streamed responses are still being generated here, so finish once the body is sent
+    def finish():
+        if trace is not None:
+            end_request(trace, endpoint, method, response.status_code)
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(path)
+            logger.info(f"Wrote request profile to {path}")
+    
+    response.call_on_close(finish)
+    return response
+
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@api_bp.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok"})
+
+@api_bp.route("/ready", methods=["GET"])
+def ready():
+    is_ready, checks = readiness()
+    return jsonify({"ready": is_ready, "checks": checks}), 200 if is_ready else 503
+
 @api_bp.route("/process", methods=["POST"])
 def process_news():
     try:
         # Validate request
         data = request.json or {}
-        news_csv_path = data.get("news_csv_path", Config.NEWS_CSV_PATH)
-        highlights_csv_path = data.get("highlights_csv_path", Config.HIGHLIGHTS_CSV_PATH)
-        
-        # Process news
-        start_time = time.time()
-        df, highlights_df = process_news_pipeline(
-            news_csv_path=news_csv_path,
-            highlights_csv_path=highlights_csv_path
-        )
+        params = {
+            "news_csv_path": data.get("news_csv_path", Config.NEWS_CSV_PATH),
+            "highlights_csv_path": data.get("highlights_csv_path", Config.HIGHLIGHTS_CSV_PATH),
+            "incremental": data.get("incremental", None),
+            "streaming": data.get("streaming", None)
+        }
         
-        logger.info(f"News processed in {time.time() - start_time:.2f}s")
+        # Enqueue the run; identical active runs are coalesced
+        job, coalesced = job_manager.submit(params)
         
         return jsonify({
-            "message": "News processed successfully",
-            "articles_count": len(df),
-            "highlights_count": len(highlights_df),
-            "categories": df["predicted_category"].value_counts().to_dict()
-        })
+            "message": "News processing queued",
+            "job_id": job.id,
+            "status": job.status,
+            "coalesced": coalesced
+        }), 202
     
     except Exception as e:
         logger.error(f"Error in process endpoint: {str(e)}")
         return jsonify({"error": f"Failed to process news: {str(e)}"}), 500
 
+@api_bp.route("/process/<job_id>", methods=["GET"])
+def process_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @api_bp.route("/highlights", methods=["GET"])
 def get_highlights():
     try:
         category = request.args.get("category", None)
         
-        # Load highlights
-        highlights_df = pd.read_csv(Config.HIGHLIGHTS_CSV_PATH)
+        # Load highlights, skipping the full article text
+        highlights_df = load_frame(Config.HIGHLIGHTS_CSV_PATH, exclude=["text"])
         
         # Filter by category if requested
         if category:
@@ -101,47 +204,9 @@ def get_articles():
         
         logger.info(f"Articles request - category: {category}, page: {page}, page_size: {page_size}, q: {q}")
         
-        # Load articles from classified_articles.csv
-        logger.info(f"Loading articles from {Config.CLASSIFIED_ARTICLES_CSV_PATH}")
-        try:
-            articles_df = pd.read_csv(Config.CLASSIFIED_ARTICLES_CSV_PATH)
-            logger.info(f"Loaded {len(articles_df)} articles from classified articles file")
-        except FileNotFoundError:
-            # Try with classified_articles.csv instead
-            logger.info("File not found, trying with classified_articles.csv instead")
-            articles_df = pd.read_csv("datasets/classified_articles.csv")
-            logger.info(f"Loaded {len(articles_df)} articles from fallback file")
-        
-        # Examine a sample to debug
-        logger.info(f"Sample article: {articles_df.iloc[0].to_dict()}")
-        
-        # Load original news dataset for additional fields
-        logger.info(f"Loading original news from {Config.NEWS_CSV_PATH}")
-        news_df = pd.read_csv(Config.NEWS_CSV_PATH)
-        logger.info(f"Loaded {len(news_df)} news items from original file")
-        
-        # Ensure ID columns are proper strings for matching
-        articles_df['id'] = articles_df['id'].astype(str)
-        news_df['id'] = news_df.index.astype(str)
-        
-        # For debugging, check the IDs
-        logger.info(f"Article IDs format: {type(articles_df['id'].iloc[0])}, News IDs format: {type(news_df['id'].iloc[0])}")
-        logger.info(f"Article ID sample: {articles_df['id'].iloc[0]}, News ID sample: {news_df['id'].iloc[0]}")
-        
-        # Merge the dataframes
-        merged_df = pd.merge(
-            articles_df,
-            news_df,
-            left_on='id',
-            right_on='id',
-            how='left',
-            suffixes=('', '_orig')
-        )
-        
-        logger.info(f"Merged dataset has {len(merged_df)} rows")
-        
-        if len(merged_df) == 0:
-            logger.error("Merged dataset is empty - merge failed!")
+        store = get_article_store()
+        if len(store) == 0:
+            logger.error("Article store is empty - merge failed!")
             # Return empty articles but don't fail
             return jsonify({
                 "articles": [],
@@ -149,117 +214,29 @@ def get_articles():
                 "error": "No articles found after merging datasets"
             })
         
-        # Handle possible missing columns gracefully
-        required_cols = ['Author', 'news_card_image', 'Link', 'Publication', 
-                         'news_summary', 'Date Published', 'text', 'predicted_category', 
-                         'Title']
-        
-        for col in required_cols:
-            if col not in merged_df.columns:
-                logger.warning(f"Column {col} not found in merged dataframe, creating empty column")
-                merged_df[col] = ""
-        
-        # Prepare field mappings with safe access
-        author = merged_df.get('Author', '').fillna('')
-        merged_df['author'] = author.replace('nil', '')
-        
-        merged_df['urlToImage'] = merged_df.get('news_card_image', '').fillna('')
-        merged_df['url'] = merged_df.get('Link', '').fillna('')
-        merged_df['publication'] = merged_df.get('Publication', '').fillna('')
-        
-        # Handle description field - replace 'nil' with empty string
-        news_summary = merged_df.get('news_summary', '').fillna('')
-        merged_df['description'] = news_summary.replace('nil', '')
-        
-        # Convert date format to ISO format for proper frontend display
-        try:
-            # Set a fixed date for all articles (May 10, 2025)
-            fixed_date = pd.Timestamp('2025-05-10T12:00:00Z')
-            merged_df['publishedAt'] = fixed_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-            
-        except Exception as e:
-            logger.error(f"Error setting fixed date: {str(e)}")
-            # Fallback to the original value
-            merged_df['publishedAt'] = merged_df.get('Date Published', '').fillna('')
-        
-        merged_df['content'] = merged_df.get('text', '').fillna('')
-        merged_df['category'] = merged_df.get('predicted_category', '').fillna('general')
-        
-        # Filter by category if requested
-        if category and category != 'general':
-            merged_df = merged_df[merged_df["predicted_category"] == category]
-            logger.info(f"Filtered to {len(merged_df)} articles for category {category}")
-        
-        # Filter by search query if provided
-        if q:
-            q = q.lower()
-            merged_df = merged_df[
-                merged_df["Title"].str.lower().str.contains(q, na=False) | 
-                merged_df["news_summary"].str.lower().str.contains(q, na=False)
-            ]
-            logger.info(f"Filtered to {len(merged_df)} articles for search query '{q}'")
-        
-        # Count total results before pagination
-        total_results = len(merged_df)
-        
-        # Paginate results
-        start_idx = (page - 1) * page_size
-        end_idx = min(start_idx + page_size, len(merged_df))
-        
-        # Validate pagination indices
-        if start_idx >= len(merged_df):
-            logger.warning(f"Pagination start index {start_idx} exceeds dataset size {len(merged_df)}")
-            paginated_df = pd.DataFrame(columns=merged_df.columns)
-        else:
-            paginated_df = merged_df.iloc[start_idx:end_idx]
-        
-        logger.info(f"Returning page {page} with {len(paginated_df)} articles (indices {start_idx}:{end_idx})")
-        
-        # Convert to list of dicts with proper article structure
-        articles = []
-        for _, row in paginated_df.iterrows():
-            # Debug output to understand the data structure 
-            logger.info(f"Processing article row: {row['id']} - {row['Title']}")
-            try:
-                article = {
-                    'id': str(row['id']),
-                    'title': str(row['Title']),
-                    'description': str(row['description']),
-                    'content': str(row['content']),
-                    'source': {
-                        'id': str(row['publication']),
-                        'name': str(row['publication'])
-                    },
-                    'author': str(row['author']),
-                    'url': str(row['url']),
-                    'urlToImage': str(row['urlToImage']),
-                    'publishedAt': str(row['publishedAt']),
-                    'category': str(row['category'])
-                }
-                articles.append(article)
-                
-                # Log successful conversion for debugging
-                if len(articles) == 1:
-                    logger.info(f"First article converted successfully: {article}")
-            except Exception as e:
-                logger.error(f"Error converting article {row['id']}: {str(e)}")
-                # Continue processing other articles
-        
-        result = {
-            "articles": articles,
-            "totalResults": total_results
-        }
-        
-        # Log the first article for debugging
-        if articles:
-            logger.info(f"First article example: {articles[0]}")
-        
-        return jsonify(result)
+        # Slice the pre-serialised articles for the requested page
+        body = store.render_page(category=category, page=page, page_size=page_size, q=q)
+        return current_app.response_class(body, mimetype="application/json")
     
     except Exception as e:
         logger.error(f"Error in articles endpoint: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to get articles: {str(e)}"}), 500
 
+@api_bp.route("/articles/<article_id>/related", methods=["GET"])
+def get_related_articles(article_id):
+    try:
+        limit = min(max(int(request.args.get("limit", Config.RELATED_ARTICLES_LIMIT)), 0), 50)
+        same_story = request.args.get("sameStory", "false").lower() in ("true", "1", "t")
+        
+        body = get_article_store().render_related(article_id, limit=limit, same_story=same_story)
+        if body is None:
+            return jsonify({"error": "Article not found"}), 404
+        return current_app.response_class(body, mimetype="application/json")
+    
+    except Exception as e:
+        logger.error(f"Error in related articles endpoint: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Failed to get related articles: {str(e)}"}), 500
+
 # Error handlers
 @api_bp.errorhandler(400)
 def bad_request(error):
@@ -279,6 +256,14 @@ def create_app(config=Config):
     # Register blueprints
     app.register_blueprint(api_bp)
     
+    # Under gunicorn the pipeline process prepares the data; the master only preloads what workers share
+    if config.MULTIPROCESS_SERVING:
+        try:
+            preload_shared_state()
+        except Exception as e:
+            logger.error(f"Failed to preload shared state: {str(e)}")
+        return app
+    
     # Initialize data on startup - this replaces the deprecated before_first_request
     with app.app_context():
         try:
@@ -287,9 +272,12 @@ def create_app(config=Config):
                 logger.info("Running initial news processing...")
                 process_news_pipeline()
             
-            # Initialize vector store 
+            # Load the article store once so requests never touch the CSVs
+            get_article_store()
+            
+            # Initialize vector store and the warm RAG context used by /api/chat
             logger.info("Initializing vector store...")
-            init_vector_store()
+            init_rag_context()
             logger.info("Vector store initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize: {str(e)}")
@@ -0,0 +1,93 @@
+"""Benchmark the clustering engines on synthetic article embeddings
+
+Embeddings are drawn around random topic centres on the unit sphere, with a
+share of unrelated articles as noise. For each corpus size every engine is
+timed, and quality is reported as the adjusted Rand index (ARI) against the
+exact engine (the original UMAP + HDBSCAN output) and against the true topics.
+
+Usage:
+    python benchmarks/bench_clustering.py --sizes 1000 10000 100000 --exact-max 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from rag.clustering import NewsClustering, ENGINES
+
+def synthetic_embeddings(n, dim, articles_per_topic=100, noise_share=0.1, spread=0.6, seed=0):
+    """Unit vectors clustered around topic centres
+
+    Returns:
+        tuple: (float32 embeddings, true topic per article with -1 for noise)
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = max(n // articles_per_topic, 5)
+    centres = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+
+    labels = rng.integers(0, n_topics, n)
+    labels[rng.random(n) < noise_share] = -1
+    embeddings = rng.standard_normal((n, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+    topical = labels >= 0
+    embeddings[topical] += centres[labels[topical]]
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings, labels
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--exact-max", type=int, default=None,
+                        help="Skip the exact engine above this size (it is the reference, so ARI vs exact is then omitted)")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Pay numba's JIT compilation before timing anything
+    warmup, _ = synthetic_embeddings(500, args.dim, seed=1)
+    for engine in ("exact", "fast"):
+        NewsClustering(engine=engine).fit_transform(warmup)
+
+    results = []
+    for n in args.sizes:
+        embeddings, truth = synthetic_embeddings(n, args.dim)
+        reference = None
+        for engine in args.engines:
+            if engine == "exact" and args.exact_max is not None and n > args.exact_max:
+                print(f"n={n:>7} {engine:>8}: skipped")
+                continue
+
+            start = time.perf_counter()
+            clusters = NewsClustering(engine=engine).fit_transform(embeddings)
+            seconds = time.perf_counter() - start
+            if engine == "exact":
+                reference = clusters
+
+            result = {
+                "n": n,
+                "engine": engine,
+                "seconds": round(seconds, 2),
+                "clusters": int(len(np.unique(clusters[clusters >= 0]))),
+                "noise_share": round(float((clusters < 0).mean()), 3),
+                "ari_vs_truth": round(adjusted_rand_score(truth, clusters), 3),
+                "ari_vs_exact": round(adjusted_rand_score(reference, clusters), 3) if reference is not None else None
+            }
+            results.append(result)
+            print(f"n={n:>7} {engine:>8}: {seconds:8.2f}s  clusters={result['clusters']:>5}  "
+                  f"ARI vs exact={result['ari_vs_exact']}  ARI vs truth={result['ari_vs_truth']}")
+
+    print(f"auto engine thresholds: fast > {Config.CLUSTERING_FAST_THRESHOLD}, "
+          f"sampled > {Config.CLUSTERING_SAMPLE_THRESHOLD} (sample size {Config.CLUSTERING_SAMPLE_SIZE})")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measure prompt context size and grounding with and without the context builder
+
+Retrieves k articles for questions generated from the processed articles (see
+eval_retrieval.py) and compares the plain concatenation of their text with the
+context built under each token budget. Reported per budget:
+
+- tokens: mean and p95 prompt context tokens
+- build ms: context build time with a cold and a warm snippet cache
+- source kept: share of questions whose source article (or a duplicate), when retrieved, still contributes
+- best sentence kept: share of questions whose sentence most similar to the question is still in the context
+
+Usage:
+    python benchmarks/bench_context.py --queries 200 --k 5 --budgets 100 200 400 1500
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.context_builder import ContextBuilder, count_tokens, _strip_title
+from rag.retriever import get_retriever
+from rag.vector_store import get_langchain_embeddings
+from eval_retrieval import make_queries, duplicate_groups
+
+def best_sentence(builder, question_embedding, passages):
+    """Normalised text of the retrieved sentence most similar to the question"""
+    units = [builder.cache.get(passage['id'], _strip_title(passage['text'], passage['title'])) for passage in passages]
+    builder._embed_sentences(units)
+    best, best_score = None, -np.inf
+    for article in units:
+        if article.embeddings is None:
+            continue
+        scores = article.embeddings @ np.asarray(question_embedding, dtype=np.float32)
+        j = int(np.argmax(scores))
+        if scores[j] > best_score:
+            best, best_score = article.keys[j], scores[j]
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[100, 200, 400, 1500])
+    args = parser.parse_args()
+
+    retriever = get_retriever()
+    groups = duplicate_groups(retriever.store)
+    embeddings = get_langchain_embeddings()
+    queries = make_queries(retriever.store, "summary", args.queries)
+    vectors = embeddings.embed_documents([text for text, _ in queries])
+
+    retrieved = []
+    for (text, position), vector in zip(queries, vectors):
+        positions = retriever.retrieve(text, vector, args.k)
+        passages = [{
+            "id": retriever.store.ids[p],
+            "title": retriever.store.records[p]['title'],
+            "text": retriever.store.records[p]['content'],
+            "group": retriever.clusters.get(retriever.store.ids[p])
+        } for p in positions]
+        retrieved.append((vector, position, positions, passages))
+
+    plain = [count_tokens("".join(f"{p['title']}. {p['text']}\n\n" for p in passages))
+             for _, _, _, passages in retrieved]
+    print(f"{len(queries)} questions, k={args.k}")
+    print(f"{'budget':>8} {'mean tok':>9} {'p95 tok':>8} {'cold ms':>8} {'warm ms':>8} {'source kept':>12} {'best sentence kept':>19}")
+    print(f"{'plain':>8} {np.mean(plain):9.0f} {np.percentile(plain, 95):8.0f}")
+
+    reference = ContextBuilder(embeddings)
+    best = [best_sentence(reference, vector, passages) for vector, _, _, passages in retrieved]
+
+    for budget in args.budgets:
+        builder = ContextBuilder(embeddings, max_tokens=budget)
+        tokens, kept_source, source_retrieved, kept_best = [], 0, 0, 0
+        timings = {"cold": [], "warm": []}
+        for run in ("cold", "warm"):
+            for (vector, position, positions, passages), sentence in zip(retrieved, best):
+                start = time.perf_counter()
+                context, used = builder.build(vector, passages)
+                timings[run].append((time.perf_counter() - start) * 1000)
+                if run == "warm":
+                    tokens.append(count_tokens(context))
+                    source = groups[position]
+                    if any(groups[p] == source for p in positions):
+                        source_retrieved += 1
+                        kept_source += any(groups[positions[i]] == source for i in used)
+                    kept_best += sentence is not None and sentence in ' '.join(context.lower().split())
+        print(f"{budget:>8} {np.mean(tokens):9.0f} {np.percentile(tokens, 95):8.0f} "
+              f"{np.median(timings['cold']):8.2f} {np.median(timings['warm']):8.2f} "
+              f"{kept_source / max(source_retrieved, 1):12.3f} {kept_best / len(retrieved):19.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measure local embedding throughput
+
+Embeds the bundled articles (replicated to --texts texts) with the local ONNX
+provider at each thread count and reports texts per second and per core.
+Length bucketing is compared with plain input-order batches of the same size.
+
+Usage:
+    EMBEDDING_PROVIDER=onnx python benchmarks/bench_embeddings.py --texts 5000 --threads 1 2 4
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag.embedding_providers as providers
+from rag.embedding_providers import OnnxEmbeddingProvider
+
+def fixed_batches(lengths, batch_tokens, max_batch_size=256):
+    """Input-order batches of the size length bucketing would use on average, for comparison"""
+    batch_size = max(min(batch_tokens // max(int(lengths.mean()), 1), max_batch_size), 1)
+    return [np.arange(start, min(start + batch_size, len(lengths))) for start in range(0, len(lengths), batch_size)]
+
+def throughput(provider, texts):
+    provider.embed(texts[:64])
+    start = time.perf_counter()
+    provider.embed(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--source", default="datasets/classified_articles.csv")
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.source)['text'].fillna('').astype(str).tolist()
+    texts = (texts * (args.texts // len(texts) + 1))[:args.texts]
+    np.random.default_rng(0).shuffle(texts)
+
+    for threads in sorted(set(args.threads)):
+        provider = OnnxEmbeddingProvider(threads=threads)
+        rate = throughput(provider, texts)
+        print(f"threads={threads:>2}  bucketed: {rate:8.0f} texts/s  ({rate / threads:6.0f} per core)")
+
+        bucketing = providers.length_buckets
+        providers.length_buckets = fixed_batches
+        try:
+            rate = throughput(provider, texts)
+        finally:
+            providers.length_buckets = bucketing
+        print(f"threads={threads:>2}  unsorted: {rate:8.0f} texts/s  ({rate / threads:6.0f} per core)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measure the cold start of the API process and guard it against regressions
+
+Imports a module (by default `app`, which every API worker loads) in a fresh
+interpreter run with `python -X importtime` and reports:
+
+- import seconds: wall time of the import
+- peak RSS after the import
+- the modules with the largest cumulative import time
+- heavy modules that must stay off the serving path (clustering,
+  classification, LangChain, chromadb) but were imported anyway
+
+Exits with status 1 when a forbidden module is imported or a limit is
+exceeded, so it can run in CI.
+
+Usage:
+    python benchmarks/bench_import.py --max-seconds 3 --max-rss-mb 250
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages only the pipeline or the first chat request may load
+FORBIDDEN = ["umap", "hdbscan", "numba", "sklearn", "scipy", "chromadb", "langchain",
+             "langchain_core", "langchain_openai", "langchain_community", "langchain_text_splitters",
+             "tiktoken", "onnxruntime", "tokenizers", "openai"]
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+MEASURE = """
+import json, resource, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def measure(module):
+    """Import a module in a fresh interpreter, returning its timings and the importtime records"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    # Importing app adds a log file to the working directory, so run somewhere disposable
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", MEASURE, module],
+                                cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us),
+                            "depth": len(indent) // 2})
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, records
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--max-rss-mb", type=float, default=None)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    seconds = sorted(timings["seconds"] for timings, _ in runs)[len(runs) // 2]
+    rss_mb = max(timings["rss_mb"] for timings, _ in runs)
+    records = runs[-1][1]
+
+    imported = {record["module"].split(".")[0] for record in records}
+    forbidden = sorted(name for name in FORBIDDEN if name in imported)
+
+    print(f"import {args.module}: {seconds:.2f} s (median of {len(runs)}), peak RSS {rss_mb:.0f} MB, "
+          f"{len(records)} modules")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in sorted(records, key=lambda r: -r["cumulative_us"])[:args.top]:
+        print(f"{record['cumulative_us'] / 1000:14.1f} {record['self_us'] / 1000:9.1f}  "
+              f"{'  ' * record['depth']}{record['module']}")
+
+    failures = []
+    if forbidden:
+        failures.append(f"heavy modules imported: {', '.join(forbidden)}")
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        failures.append(f"import took {seconds:.2f} s, limit {args.max_seconds} s")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.0f} MB, limit {args.max_rss_mb} MB")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"module": args.module, "seconds": seconds, "rss_mb": rss_mb, "modules": len(records),
+                       "forbidden": forbidden, "failures": failures}, f, indent=2)
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Measure the memory of article embeddings in each representation the pipeline has used
+
+Reports, for --articles articles of --dim dimensions:
+
+- the size of the embeddings as lists of Python floats (what the LangChain
+  embeddings return), as a float32 matrix and in the float16 and int8
+  storage types, with the time to turn them into the clustering input
+- the peak memory and time of embedding --articles texts through the
+  embedding cache the old way (lists per batch, converted and stacked) and
+  through `embed_matrix` and the batch runner's preallocated matrix
+
+Lists are measured on --sample articles and scaled, as a full list copy of
+100k articles takes several GB. Each embedding path runs at full size in a
+fresh interpreter: once under tracemalloc for its peak allocation and once
+untraced for its time, as tracing slows every float allocation. Embedding
+uses the offline hash provider.
+
+Usage:
+    python benchmarks/bench_memory.py --articles 100000 --dim 1536
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.embedding_matrix import as_matrix, normalize_rows, encode_embeddings
+from rag.embedding_providers import ProviderEmbeddings
+from rag.embedding_cache import CachedEmbeddings, use_memory_caches
+from rag.async_pipeline import AsyncBatchRunner, make_batches, run_async
+from rag.metrics import MeteredEmbeddings
+from fakes import HashEmbeddingProvider
+from synthetic_news import generate_news
+
+MB = 2 ** 20
+
+def traced(fn):
+    """Run fn and return its result, the bytes it still holds and its peak traced allocation"""
+    tracemalloc.start()
+    try:
+        result = fn()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, held, peak
+
+def representations(matrix, scale):
+    """Size of each representation and the time to get the clustering input from it, scaled"""
+    lists, list_bytes, _ = traced(matrix.tolist)
+    start = time.perf_counter()
+    np.asarray(lists, dtype=np.float32)
+    list_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    features = as_matrix(matrix)
+    matrix_seconds = time.perf_counter() - start
+    assert np.shares_memory(features, matrix)
+
+    rows = [{"representation": "list of floats", "mb": list_bytes * scale / MB,
+             "to_clustering_s": list_seconds * scale}]
+    rows.append({"representation": "float32 matrix", "mb": matrix.nbytes * scale / MB,
+                 "to_clustering_s": matrix_seconds * scale})
+    for dtype in ("float16", "int8"):
+        rows.append({"representation": f"{dtype} storage",
+                     "mb": encode_embeddings(matrix, dtype).nbytes * scale / MB, "to_clustering_s": None})
+    return rows
+
+def embed(path, texts, dim):
+    """Embed texts through the cache with lists ("lists") or with matrices ("matrix")"""
+    use_memory_caches()
+    provider = HashEmbeddingProvider(dim=dim)
+    embeddings = CachedEmbeddings(MeteredEmbeddings(ProviderEmbeddings(provider)), model_name=f"bench-{path}")
+    if path == "lists":
+        # Before: every batch came back as lists, was converted, then the batches were stacked
+        return np.vstack([np.asarray(embeddings.embed_documents(texts[start:end]), dtype=np.float32)
+                          for start, end in make_batches(texts)])
+    return normalize_rows(run_async(AsyncBatchRunner(embeddings).embed(texts)))
+
+def measure(path, texts_path, dim, traced_run):
+    """Embed the texts once and print the peak traced allocation or the time as JSON"""
+    with open(texts_path) as f:
+        texts = json.load(f)
+    if traced_run:
+        _, _, peak = traced(lambda: embed(path, texts, dim))
+        print(json.dumps({"peak_mb": peak / MB}))
+    else:
+        start = time.perf_counter()
+        embed(path, texts, dim)
+        print(json.dumps({"seconds": time.perf_counter() - start}))
+
+def embedding_peaks(texts, dim):
+    """Peak memory and time of embedding texts with lists and with matrices, each in a fresh interpreter"""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, "texts.json")
+        with open(texts_path, "w") as f:
+            json.dump(texts, f)
+        for path in ("lists", "matrix"):
+            row = {"path": path}
+            for traced_run in ("1", "0"):
+                out = subprocess.run([sys.executable, __file__, "--measure", path, texts_path, str(dim), traced_run],
+                                     capture_output=True, text=True, check=True)
+                row.update(json.loads(out.stdout.strip().splitlines()[-1]))
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--sample", type=int, default=2000, help="Articles the representations are measured on")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--measure", nargs=4, metavar=("PATH", "TEXTS", "DIM", "TRACED"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        path, texts_path, dim, traced_run = args.measure
+        measure(path, texts_path, int(dim), traced_run == "1")
+        return
+
+    rng = np.random.default_rng(0)
+    matrix = normalize_rows(rng.standard_normal((args.sample, args.dim)).astype(np.float32))
+    sizes = representations(matrix, args.articles / args.sample)
+    print(f"{args.articles} articles x {args.dim} dimensions")
+    for row in sizes:
+        conversion = f"{row['to_clustering_s']:8.3f} s" if row["to_clustering_s"] is not None else ""
+        print(f"{row['representation']:>16}: {row['mb']:9.1f} MB  {conversion}")
+
+    texts = generate_news(args.articles)["Title"].tolist()
+    peaks = embedding_peaks(texts, args.dim)
+    print(f"Embedding {args.articles} texts")
+    for row in peaks:
+        print(f"{row['path']:>16}: {row['peak_mb']:9.1f} MB peak  {row['seconds']:8.1f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"articles": args.articles, "dim": args.dim, "representations": sizes,
+                       "embedding": peaks}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
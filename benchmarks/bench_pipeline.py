@@ -0,0 +1,292 @@
+"""End-to-end benchmark of the news pipeline and the API, fully offline
+
+For each corpus size a synthetic news CSV is generated (see synthetic_news.py)
+and, in a fresh interpreter with its own working directory, Chroma store and
+embedding cache:
+
+1. process_news_pipeline runs with the hash embedding provider (see fakes.py)
+2. the RAG context is built with a canned chat model
+3. each API endpoint is called --requests times through the Flask test client
+
+Reported per size:
+
+- pipeline: wall time, articles per second, and per stage the time and RSS
+  when it ends, plus the nested spans recorded by rag.metrics (embed, ...).
+  The "imports" stage is the pipeline's lazy import of its dependencies
+- counters: embedding calls, texts and tokens, cache lookups, LLM calls
+- endpoints: mean, p50 and p95 latency and sequential requests per second,
+  and the mean time of each request span (embed, vector_search, generate, ...)
+- peak RSS of the whole run
+
+Results are written as JSON (by default to benchmarks/results/<commit>.json)
+so runs of different commits can be diffed with --diff.
+
+Usage:
+    python benchmarks/bench_pipeline.py --rows 1000 10000 100000 --requests 50
+    python benchmarks/bench_pipeline.py --diff benchmarks/results/abc1234.json benchmarks/results/def5678.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def rss_mb():
+    """Current resident set size (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values, q):
+    import numpy as np
+    return float(np.percentile(values, q)) if values else None
+
+def span_totals(snapshot):
+    """Total time and count per span, and the counters other than HTTP ones, from a metrics snapshot"""
+    spans = {dict(labels)["stage"]: {"count": values[-1], "seconds": round(values[-2], 4)}
+             for name, labels, values in snapshot["histograms"] if name == "rag_stage_duration_seconds"}
+    counters = {name + "".join(f"{{{key}={value}}}" for key, value in labels): value
+                for name, labels, value in snapshot["counters"] if not name.startswith("rag_http")}
+    return {"spans": spans, "counters": counters}
+
+def endpoint_requests(store_titles, store_ids, requests):
+    """Calls to make per endpoint, as (method, path, JSON body), with varying queries"""
+    words = [word for title in store_titles for word in title.split() if len(word) > 4] or ["news"]
+    return {
+        "GET /api/articles": [("GET", "/api/articles?page=1", None)] * requests,
+        "GET /api/articles?category": [("GET", f"/api/articles?category=sports&page={i % 5 + 1}", None)
+                                       for i in range(requests)],
+        "GET /api/articles?q": [("GET", f"/api/articles?q={words[i % len(words)]}", None) for i in range(requests)],
+        "GET /api/highlights": [("GET", "/api/highlights", None)] * requests,
+        "GET /api/articles/<id>/related": [("GET", f"/api/articles/{store_ids[i % len(store_ids)]}/related", None)
+                                           for i in range(requests)],
+        "POST /api/chat": [("POST", "/api/chat", {"question": f"What is the latest on {store_titles[i % len(store_titles)]}?"})
+                           for i in range(requests)],
+        "POST /api/chat (cached)": [("POST", "/api/chat", {"question": f"What is the latest on {store_titles[0]}?"})] * requests,
+        "GET /api/chat/stream": [("GET", f"/api/chat/stream?question=news about {words[i % len(words)]}", None)
+                                 for i in range(requests)]
+    }
+
+def measure(rows, args):
+    """Run the pipeline and the endpoints once and print the results as JSON"""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from fakes import register_hash_provider, fake_chat_model
+    from synthetic_news import generate_news
+    from config import Config
+
+    register_hash_provider(dim=args.dim, delay=args.embedding_delay)
+    os.makedirs(os.path.dirname(Config.NEWS_CSV_PATH), exist_ok=True)
+    generate_news(rows, seed=args.seed).to_csv(Config.NEWS_CSV_PATH, index=False)
+    baseline_rss = rss_mb()
+
+    from rag.utils import process_news_pipeline
+    from rag.metrics import get_registry
+
+    # Stage boundaries with the RSS when each stage ends; the pipeline's own imports come before the first
+    marks = [("imports", time.perf_counter(), rss_mb())]
+    def progress(stage):
+        marks.append((stage, time.perf_counter(), rss_mb()))
+
+    start = marks[0][1]
+    process_news_pipeline(progress=progress)
+    seconds = time.perf_counter() - start
+    marks.append((None, time.perf_counter(), rss_mb()))
+    pipeline_spans = span_totals(get_registry().snapshot())
+    stages = {stage: {"seconds": round(marks[i + 1][1] - started, 4), "rss_mb": round(marks[i + 1][2], 1)}
+              for i, (stage, started, _) in enumerate(marks[:-1])}
+
+    from flask import Flask
+    from rag.rag_context import init_rag_context
+    from rag.article_store import get_article_store
+    import app as api
+
+    start = time.perf_counter()
+    init_rag_context(llm=fake_chat_model(args.llm_delay))
+    rag_context_seconds = time.perf_counter() - start
+    get_registry().reset()
+
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(api.api_bp)
+    client = flask_app.test_client()
+    store = get_article_store()
+    sampled = range(0, len(store), max(len(store) // 200, 1))
+    titles = [store.records[position]['title'] for position in sampled]
+    ids = [store.ids[position] for position in sampled]
+
+    endpoints = {}
+    for name, calls in endpoint_requests(titles, ids, args.requests).items():
+        Config.ANSWER_CACHE_ENABLED = name != "POST /api/chat"
+        latencies, errors = [], 0
+        for method, path, body in calls:
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            response.close()
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 400
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "requests_per_second": round(len(latencies) / (sum(latencies) / 1000), 1)
+        }
+
+    request_spans = span_totals(get_registry().snapshot())
+
+    print(json.dumps({
+        "rows": rows,
+        "articles": len(store),
+        "pipeline": {
+            "seconds": round(seconds, 3),
+            "articles_per_second": round(rows / seconds, 1),
+            "stages": stages,
+            "spans": pipeline_spans["spans"],
+            "counters": pipeline_spans["counters"]
+        },
+        "rag_context_seconds": round(rag_context_seconds, 3),
+        "endpoints": endpoints,
+        "request_spans": request_spans["spans"],
+        "request_counters": request_spans["counters"],
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }))
+
+def run_size(rows, args):
+    """Measure one corpus size in a fresh interpreter and working directory"""
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as workdir:
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]),
+            EMBEDDING_PROVIDER="hash",
+            OPENAI_API_KEY="offline",
+            VECTOR_STORE_PATH=os.path.join(workdir, "chroma"),
+            EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+            PIPELINE_STATE_DIR=os.path.join(workdir, "datasets", "pipeline_state"),
+            MULTIPROCESS_SERVING="false",
+            METRICS_ENABLED="true"
+        )
+        command = [sys.executable, os.path.abspath(__file__), "--measure", str(rows),
+                   "--requests", str(args.requests), "--dim", str(args.dim), "--seed", str(args.seed),
+                   "--embedding-delay", str(args.embedding_delay), "--llm-delay", str(args.llm_delay)]
+        result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Benchmark of {rows} rows failed:\n{result.stderr[-3000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_run(run):
+    pipeline = run["pipeline"]
+    print(f"\n{run['rows']} rows: pipeline {pipeline['seconds']:.2f} s ({pipeline['articles_per_second']:.0f} articles/s), "
+          f"RAG context {run['rag_context_seconds']:.2f} s, peak RSS {run['peak_rss_mb']:.0f} MB")
+    print(f"{'stage':>20} {'seconds':>9} {'RSS MB':>8}")
+    for stage, values in pipeline["stages"].items():
+        print(f"{stage:>20} {values['seconds']:9.3f} {values['rss_mb']:8.0f}")
+    for name, values in pipeline["spans"].items():
+        if name not in pipeline["stages"] and name != "pipeline":
+            print(f"{'  span ' + name:>20} {values['seconds']:9.3f}   x{values['count']}")
+    print(f"{'endpoint':>30} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>8} {'errors':>7}")
+    for name, values in run["endpoints"].items():
+        print(f"{name:>30} {values['mean_ms']:9.2f} {values['p50_ms']:9.2f} {values['p95_ms']:9.2f} "
+              f"{values['requests_per_second']:8.1f} {values['errors']:7d}")
+    print("request spans: " + ", ".join(f"{name} {values['seconds'] * 1000 / values['count']:.2f} ms"
+                                        for name, values in run["request_spans"].items()))
+
+def flatten(value, prefix=""):
+    """Numeric leaves of a result tree, keyed on their path"""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}/{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+def diff(base_path, new_path, threshold):
+    """Print the metrics that changed by more than threshold (a fraction) between two result files"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{base['meta']['commit']} -> {new['meta']['commit']}")
+    base_runs = {run["rows"]: flatten(run) for run in base["runs"]}
+    for run in new["runs"]:
+        if run["rows"] not in base_runs:
+            continue
+        old_values = base_runs[run["rows"]]
+        print(f"\n{run['rows']} rows")
+        for key, value in flatten(run).items():
+            old = old_values.get(key)
+            if old is None or old == value:
+                continue
+            change = (value - old) / abs(old) if old else float("inf")
+            if abs(change) >= threshold:
+                print(f"  {key:<60} {old:>12g} -> {value:<12g} {change:+.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=50, help="Calls per endpoint")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension of the hash provider")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-delay", type=float, default=0.0, help="Simulated seconds per embedding call")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Simulated seconds per streamed chunk")
+    parser.add_argument("--output", default=None, help="Results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--diff", nargs=2, metavar=("BASE", "NEW"), help="Compare two results files and exit")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Smallest relative change shown by --diff")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.diff:
+        diff(*args.diff, args.threshold)
+        return
+    if args.measure:
+        measure(args.measure, args)
+        return
+
+    commit = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("diff", "measure", "output")}
+        },
+        "runs": []
+    }
+    for rows in args.rows:
+        run = run_size(rows, args)
+        results["runs"].append(run)
+        print_run(run)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare loading the classified articles from CSV and from the Arrow store
+
+The classified articles are replicated up to --rows rows and saved both ways.
+Each load runs in a fresh interpreter so peak RSS reflects that load alone.
+
+Usage:
+    python benchmarks/bench_storage.py --rows 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LISTING_EXCLUDE = ["text"]
+
+def rss_mb():
+    """Current resident set size (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(mode, csv_path):
+    """Load the table once and print load time and RSS growth as JSON"""
+    import pandas as pd
+    from rag.columnar_store import load_frame, read_arrow_table, columnar_path
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if mode == "csv":
+        table = pd.read_csv(csv_path)
+    elif mode == "csv-projected":
+        table = pd.read_csv(csv_path, usecols=lambda col: col not in LISTING_EXCLUDE)
+    elif mode == "arrow":
+        table = load_frame(csv_path)
+    elif mode == "arrow-projected":
+        table = load_frame(csv_path, exclude=LISTING_EXCLUDE)
+    elif mode == "arrow-mmap":
+        # Arrow table only, no conversion to pandas
+        table = read_arrow_table(columnar_path(csv_path))
+    seconds = time.perf_counter() - start
+    print(json.dumps({"mode": mode, "rows": len(table), "seconds": round(seconds, 4),
+                      "rss_delta_mb": round(rss_mb() - baseline, 1)}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--source", default="datasets/classified_articles.csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "CSV"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    import pandas as pd
+    from rag.columnar_store import save_frame, columnar_path, columnar_enabled
+
+    if not columnar_enabled():
+        sys.exit("Arrow storage is unavailable: install pyarrow and set STORAGE_FORMAT=arrow")
+
+    source = pd.read_csv(args.source)
+    df = pd.concat([source] * (args.rows // len(source) + 1), ignore_index=True).iloc[:args.rows]
+    df['id'] = range(len(df))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "classified_articles.csv")
+        save_frame(df, csv_path)
+        print(f"{len(df)} rows: CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, "
+              f"Arrow {os.path.getsize(columnar_path(csv_path)) / 1e6:.1f} MB")
+
+        results = []
+        for mode in ["csv", "csv-projected", "arrow", "arrow-projected", "arrow-mmap"]:
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run([sys.executable, __file__, "--measure", mode, csv_path],
+                                     capture_output=True, text=True, check=True)
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            best = min(runs, key=lambda r: r["seconds"])
+            results.append(best)
+            print(f"{mode:>16}: {best['seconds'] * 1000:9.1f} ms  RSS +{best['rss_delta_mb']:7.1f} MB")
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Offline recall@k evaluation of the chat retrievers
+
+Runs against the processed articles, search index and news_articles collection
+left by the last pipeline run, with the configured embedding provider. Queries
+are generated from the articles themselves:
+
+- title: a question wrapping the article title
+- summary: the first sentence of the article summary (articles without one are skipped)
+- entity: a question naming one of the words found in the most articles, like
+  a brand the corpus is full of, with only stop words around it
+
+A query counts as a hit at k when its source article, or a duplicate of it, is
+among the top k results; for entity queries any article containing the word
+is a source. Recall and latency are reported for BM25 only,
+vector only, reciprocal rank fusion of both, and fusion followed by reranking.
+
+Usage:
+    python benchmarks/eval_retrieval.py --queries 200 --k 1 5 10
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from rag.columnar_store import load_frame
+from rag.retriever import get_retriever, detect_category, reciprocal_rank_fusion
+from rag.search_index import STOP_WORDS
+from rag.vector_store import get_langchain_embeddings
+
+def entity_queries(store, n):
+    """(query text, store positions) pairs for the words in the most articles, stop words aside"""
+    index = store.search_index
+    doc_freq = np.diff(index.term_offsets)
+    queries = []
+    for term_id in np.argsort(-doc_freq, kind='stable'):
+        term = index.terms[term_id]
+        if term in STOP_WORDS or not term.isalpha():
+            continue
+        lo, hi = index.term_offsets[term_id], index.term_offsets[term_id + 1]
+        queries.append((f"What did {term} do?", index.post_docs[lo:hi].tolist()))
+        if len(queries) == n:
+            break
+    return queries
+
+def make_queries(store, kind, n, seed=0):
+    """(query text, store positions of its sources) pairs for a random sample of articles"""
+    if kind == "entity":
+        return entity_queries(store, n)
+    rng = np.random.default_rng(seed)
+    queries = []
+    for position in rng.permutation(len(store)):
+        record = store.records[position]
+        if kind == "title":
+            text = f"What is the latest on {record['title']}?"
+        else:
+            text = re.split(r'(?<=[.!?])\s', record['description'].strip())[0]
+            if len(text.split()) < 5:
+                continue
+        queries.append((text, [int(position)]))
+        if len(queries) == n:
+            break
+    return queries
+
+def duplicate_groups(store):
+    """Group id per store position; duplicates of the same story share one"""
+    groups = np.arange(len(store))
+    try:
+        articles = load_frame(Config.CLASSIFIED_ARTICLES_CSV_PATH, columns=['id', 'duplicate_of'])
+    except Exception:
+        return groups
+    if 'duplicate_of' not in articles.columns:
+        return groups
+    canonical = dict(zip(articles['id'].astype(str), articles['duplicate_of']))
+    for position, article_id in enumerate(store.ids):
+        target = canonical.get(article_id)
+        if target is not None and target == target and str(target) in store.positions:
+            groups[position] = store.positions[str(target)]
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--kinds", nargs="+", default=["title", "summary", "entity"],
+                        choices=["title", "summary", "entity"])
+    args = parser.parse_args()
+
+    retriever = get_retriever()
+    store = retriever.store
+    groups = duplicate_groups(store)
+    embeddings = get_langchain_embeddings()
+    depth = max(max(args.k), Config.RETRIEVAL_CANDIDATES)
+
+    for kind in args.kinds:
+        queries = make_queries(store, kind, args.queries)
+        if not queries:
+            continue
+        vectors = embeddings.embed_documents([text for text, _ in queries])
+
+        methods = {
+            "bm25": lambda q, e, c: retriever.lexical(q, c, depth),
+            "vector": lambda q, e, c: retriever.vector(e, c, depth)[0],
+            "rrf": lambda q, e, c: [d for d, _ in reciprocal_rank_fusion(
+                [retriever.lexical(q, c), retriever.vector(e, c)[0]])],
+            "rrf+rerank": lambda q, e, c: retriever.retrieve(q, e, k=max(args.k))
+        }
+
+        print(f"\n{kind} queries ({len(queries)})")
+        print(f"{'method':>12} " + " ".join(f"{'R@' + str(k):>7}" for k in args.k) + "   p50 ms   p95 ms")
+        for name, method in methods.items():
+            hits = {k: 0 for k in args.k}
+            latencies = []
+            for (text, positions), vector in zip(queries, vectors):
+                start = time.perf_counter()
+                results = method(text, vector, detect_category(text))
+                latencies.append((time.perf_counter() - start) * 1000)
+                sources = set(groups[positions].tolist())
+                for k in args.k:
+                    hits[k] += any(groups[p] in sources for p in results[:k])
+            recall = " ".join(f"{hits[k] / len(queries):7.3f}" for k in args.k)
+            print(f"{name:>12} {recall}  {np.percentile(latencies, 50):7.2f}  {np.percentile(latencies, 95):7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Local stand-in for the OpenAI embeddings endpoint
+
+Serves POST /v1/embeddings with deterministic, hash-seeded unit vectors so the
+pipeline can be exercised offline. Inputs may be strings or token id arrays
+(LangChain sends token ids). An optional per-request delay simulates network
+latency, which makes the effect of PIPELINE_MAX_CONCURRENCY visible.
+
+Usage:
+    python benchmarks/fake_embedding_server.py --port 8089 --delay 0.2
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=fake python -c "from rag.utils import process_news_pipeline; process_news_pipeline()"
+"""
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def fake_embedding(value, dim):
+    """Deterministic unit vector for a string or token id list"""
+    seed = int(hashlib.sha1(json.dumps(value).encode("utf-8")).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def make_handler(dim, delay):
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            inputs = body["input"]
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            if delay:
+                time.sleep(delay)
+            EmbeddingHandler.requests_served += 1
+
+            payload = json.dumps({
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(value, dim)}
+                         for i, value in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+def serve(port=8089, dim=1536, delay=0.0):
+    """Start the fake server and return it (call serve_forever or shutdown on it)"""
+    return ThreadingHTTPServer(("127.0.0.1", port), make_handler(dim, delay))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering each request")
+    args = parser.parse_args()
+    server = serve(args.port, args.dim, args.delay)
+    print(f"Fake embedding server listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,67 @@
+"""Deterministic offline stand-ins for the OpenAI embeddings and chat models
+
+HashEmbeddingProvider plugs into rag.embedding_providers as the "hash"
+provider (run with EMBEDDING_PROVIDER=hash), so the pipeline, vector store
+and chat all embed through it without network access. A text's vector is
+the normalised sum of hash-seeded vectors of its words: texts sharing words
+get similar vectors, which keeps classification, clustering and retrieval
+doing realistic work. fake_chat_model answers with canned completions.
+"""
+import re
+import time
+import zlib
+import threading
+from functools import partial
+import numpy as np
+from rag.embedding_providers import EmbeddingProvider, PROVIDERS
+
+WORD = re.compile(r"\w+")
+
+CANNED_ANSWERS = [
+    "Here is a summary of today's headlines based on the articles provided.",
+    "According to the latest reports, the story is still developing and more details are expected soon.",
+    "I don't know the answer to that based on today's news."
+]
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """Bag-of-words embeddings built from hash-seeded word vectors
+
+    Args:
+        dim: Embedding dimension
+        delay: Seconds to sleep per call, to simulate the latency of a remote API
+    """
+
+    def __init__(self, dim=1536, delay=0.0):
+        self.dim = dim
+        self.delay = delay
+        self.name = f"hash-bow-{dim}"
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _word_vector(self, word):
+        vector = self._words.get(word)
+        if vector is None:
+            seed = zlib.crc32(word.encode("utf-8"))
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            with self._lock:
+                self._words[word] = vector
+        return vector
+
+    def embed(self, texts):
+        if self.delay:
+            time.sleep(self.delay)
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = WORD.findall(str(text).lower()) or [str(text)]
+            vector = np.sum([self._word_vector(word) for word in words], axis=0)
+            embeddings[i] = vector / max(np.linalg.norm(vector), 1e-12)
+        return embeddings
+
+def register_hash_provider(dim=1536, delay=0.0):
+    """Make the hash provider available as EMBEDDING_PROVIDER=hash"""
+    PROVIDERS["hash"] = partial(HashEmbeddingProvider, dim=dim, delay=delay)
+
+def fake_chat_model(delay=0.0):
+    """Chat model cycling through canned answers, streamed one character per chunk with an optional delay per chunk"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    return FakeListChatModel(responses=CANNED_ANSWERS, sleep=delay or None)
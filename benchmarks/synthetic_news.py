@@ -0,0 +1,152 @@
+"""Generate a synthetic news CSV shaped like "Aggregated News Dataset - Sheet1.csv"
+
+Articles are written about stories: each story belongs to a category, has a
+few key terms and is covered by several publications with differently worded
+titles, so clustering finds real groups. A share of the rows are syndicated
+copies of an earlier article (same title and summary, another publication)
+for the duplicate detection, a share have "nil" summaries like the scraped
+data, and some titles carry the category's priority keywords so highlights
+have something to rank. Output is deterministic for a given seed.
+
+Usage:
+    python benchmarks/synthetic_news.py --rows 10000 --output datasets/synthetic_10k.csv
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+COLUMNS = ["Date Scraped", "Title", "news_summary", "news_card_image", "Date Published", "Link",
+           "Publication", "Author"]
+
+# Subjects and words used in each category's stories
+VOCABULARY = {
+    "sports": {
+        "subjects": ["the swans", "the matildas", "the wallabies", "the kangaroos", "the socceroos", "collingwood",
+                     "the broncos", "the storm", "the diamonds", "the boomers", "the wildcats", "the crows"],
+        "words": ["match", "athletes", "teams", "coach", "season", "final", "win", "goal", "try", "round",
+                  "premiership", "captain", "injury", "ladder", "clash", "stadium", "fans", "sporting", "event"]
+    },
+    "finance": {
+        "subjects": ["the asx", "the reserve bank", "westpac", "bhp", "the big four banks", "qantas", "wesfarmers",
+                     "the treasurer", "woolworths", "fortescue", "the aussie dollar", "rio tinto"],
+        "words": ["markets", "stocks", "economy", "business", "shares", "profit", "investors", "rates",
+                  "quarter", "growth", "prices", "trading", "billion", "deal", "forecast", "revenue", "financial"]
+    },
+    "politics": {
+        "subjects": ["the prime minister", "the opposition leader", "the premier", "the senate", "the greens",
+                     "the coalition", "the treasurer", "the foreign minister", "the teals", "parliament"],
+        "words": ["government", "policies", "election", "policy", "vote", "minister", "campaign", "bill",
+                  "seat", "party", "political", "reform", "budget", "voters", "leadership", "inquiry"]
+    },
+    "lifestyle": {
+        "subjects": ["melbourne cafes", "a sydney chef", "bondi", "the royal family", "a byron bay retreat",
+                     "tasmanian wineries", "a perth family", "the great barrier reef", "a brisbane designer"],
+        "words": ["health", "travel", "food", "culture", "lifestyle", "recipe", "home", "holiday", "wellness",
+                  "fashion", "diet", "garden", "wine", "restaurant", "trend", "beauty", "weekend"]
+    },
+    "music": {
+        "subjects": ["kylie minogue", "tame impala", "the wiggles", "taylor swift", "flume", "sia",
+                     "midnight oil", "troye sivan", "amyl and the sniffers", "the kid laroi", "g flip"],
+        "words": ["music", "artists", "albums", "concerts", "industry", "single", "tour", "band", "song",
+                  "festival", "stage", "fans", "chart", "record", "release", "gig", "singer"]
+    }
+}
+
+VERBS = ["announces", "faces", "slams", "reveals", "wins", "loses", "backs", "delays", "confirms", "rejects",
+         "unveils", "denies", "tops", "defends", "cuts", "plans"]
+FILLER = ["after", "amid", "ahead of", "despite", "over", "following", "in", "with"]
+PUBLICATIONS = ["7news.com.au", "abc news", "sydney morning herald - national", "the guardian australia",
+                "news.com.au", "the age - business", "sbs news", "the australian", "9news.com.au", "crikey"]
+AUTHORS = ["derek fung", "murray wenzel", "jane doe", "sam nguyen", "olivia smith", "nil", "aap", "liam brown"]
+
+def _story(rng, category):
+    vocabulary = VOCABULARY[category]
+    keywords = Config.PRIORITY_KEYWORDS.get(category, [])
+    return {
+        "category": category,
+        "subject": rng.choice(vocabulary["subjects"]),
+        # Key terms first, then the words left for variation between articles
+        "terms": rng.sample(vocabulary["words"], len(vocabulary["words"])),
+        # Some stories are big news and carry a priority keyword in every title
+        "keyword": rng.choice(keywords) if keywords and rng.random() < 0.15 else None
+    }
+
+def _article(rng, story):
+    """Title and summary of one article about a story"""
+    terms, rest = story["terms"][:4], story["terms"][4:]
+    extra = rng.sample(rest, 5)
+    title = (f"{story['subject']} {rng.choice(VERBS)} {terms[0]} {terms[1]} "
+             f"{rng.choice(FILLER)} {extra[0]} {terms[2]}")
+    if story["keyword"]:
+        title = f"{story['keyword']}: {title}" if rng.random() < 0.5 else f"{title} {story['keyword']}"
+    summary = (f"{story['subject']} and the {terms[3]} are at the centre of a {extra[1]} {terms[0]} story, "
+               f"with {terms[1]} and {terms[2]} expected to follow. "
+               f"the {' '.join(extra[2:])} continues this week.")
+    return title, summary
+
+def generate_news(rows, seed=0, articles_per_story=4, duplicate_share=0.08, nil_share=0.05,
+                  scraped=date(2025, 5, 12)):
+    """Synthetic scraped news
+
+    Args:
+        rows: Number of articles
+        seed: Random seed
+        articles_per_story: Mean number of articles covering the same story
+        duplicate_share: Share of rows that are syndicated copies of an earlier row
+        nil_share: Share of rows with a "nil" summary
+
+    Returns:
+        DataFrame: Articles with the columns of the scraped dataset
+    """
+    rng = random.Random(seed)
+    categories = list(VOCABULARY)
+    stories = [_story(rng, rng.choice(categories)) for _ in range(max(rows // articles_per_story, 1))]
+    # A few stories get most of the coverage
+    weights = 1.0 / np.arange(1, len(stories) + 1) ** 0.6
+    picks = np.random.default_rng(seed).choice(len(stories), size=rows, p=weights / weights.sum())
+
+    records = []
+    for i, pick in enumerate(picks):
+        if records and rng.random() < duplicate_share:
+            record = dict(rng.choice(records))
+            record["Publication"] = rng.choice(PUBLICATIONS)
+        else:
+            title, summary = _article(rng, stories[pick])
+            record = {
+                "Title": title,
+                "news_summary": "nil" if rng.random() < nil_share else summary,
+                "Publication": rng.choice(PUBLICATIONS),
+                "Author": rng.choice(AUTHORS)
+            }
+        slug = "-".join(record["Title"].replace(":", "").split()[:8])
+        published = scraped - timedelta(days=rng.randrange(3))
+        records.append({
+            **record,
+            "Date Scraped": scraped.isoformat(),
+            "news_card_image": f"https://images.example.com/{i}/card.jpg",
+            "Date Published": published.strftime("%d/%m/%Y"),
+            "Link": f"https://news.example.com/{record['Publication'].split()[0]}/{slug}-{i}"
+        })
+    return pd.DataFrame(records, columns=COLUMNS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    df = generate_news(args.rows, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df)} articles to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,45 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent
 DATASETS_DIR = BASE_DIR / "datasets"
 CHROMA_DIR = BASE_DIR / "chroma_db"
+EMBEDDING_CACHE_DIR = BASE_DIR / "embedding_cache"
+MODELS_DIR = BASE_DIR / "models"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
 
 class Config:
     """Application configuration"""
     # API Keys
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Optional override, e.g. to point the pipeline at a local fake embedding server
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
     
     # Data paths
     NEWS_CSV_PATH = 'datasets/Aggregated News Dataset - Sheet1.csv'
     CLASSIFIED_ARTICLES_CSV_PATH = 'datasets/classified_articles.csv'
     HIGHLIGHTS_CSV_PATH = 'datasets/daily_highlights.csv'
+    SEARCH_INDEX_PATH = 'datasets/classified_articles.index.npz'
+    EMBEDDINGS_PATH = 'datasets/article_embeddings.arrow'
+    ANN_INDEX_PATH = 'datasets/article_embeddings.ann'
+    RELATED_ARTICLES_PATH = 'datasets/related_articles.npy'
+    
+    # Storage of pipeline outputs: "arrow" (memory-mapped, needs pyarrow) or "csv"
+    STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "arrow").lower()
+    # Keep writing the CSV files alongside the Arrow ones for compatibility
+    CSV_EXPORT = os.getenv("CSV_EXPORT", "True").lower() in ("true", "1", "t")
     
     # Vector store
-    VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", str(CHROMA_DIR))
+    # Each embedding provider gets its own store since their vectors are not comparable
+    VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH",
+                                  str(CHROMA_DIR if EMBEDDING_PROVIDER == "openai" else CHROMA_DIR / EMBEDDING_PROVIDER))
+    HIGHLIGHTS_COLLECTION = "highlights"
+    
+    # Chat model
+    LLM_TEMPERATURE = 0.1
+    
+    # Semantic answer cache for /api/chat
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+    ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 900))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
     
     # Categories
     NEWS_CATEGORIES = {
@@ -51,15 +77,149 @@ class Config:
                 "breakup", "collaboration", "lyrics decoded", "canceled", "viral hit"]
     }
     
+    # Embedding settings
+    # Provider: "openai" (remote API) or "onnx" (local CPU model, works offline)
+    EMBEDDING_PROVIDER = EMBEDDING_PROVIDER
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 500))
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 50000))
+    # Type of the saved article embeddings and pipeline state: "float32", "float16" (half the
+    # size) or "int8" (a quarter); the pipeline itself always works on float32
+    EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower()
+    
+    # Local ONNX embedding model
+    LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    LOCAL_EMBEDDING_MODEL_PATH = os.getenv("LOCAL_EMBEDDING_MODEL_PATH",
+                                           str(MODELS_DIR / LOCAL_EMBEDDING_MODEL / "model.int8.onnx"))
+    LOCAL_EMBEDDING_TOKENIZER_PATH = os.getenv("LOCAL_EMBEDDING_TOKENIZER_PATH",
+                                               str(MODELS_DIR / LOCAL_EMBEDDING_MODEL / "tokenizer.json"))
+    LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", 256))
+    # Padded tokens per ONNX batch; batches are bucketed by sequence length
+    LOCAL_EMBEDDING_BATCH_TOKENS = int(os.getenv("LOCAL_EMBEDDING_BATCH_TOKENS", 8192))
+    LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", os.cpu_count() or 1))
+    
+    # Concurrency of the async pipeline runner
+    PIPELINE_MAX_CONCURRENCY = int(os.getenv("PIPELINE_MAX_CONCURRENCY", 4))
+    PIPELINE_UPSERT_CONCURRENCY = int(os.getenv("PIPELINE_UPSERT_CONCURRENCY", 1))
+    
+    # Embedding cache (shared by the pipeline, vector store and chat)
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+    EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", str(EMBEDDING_CACHE_DIR))
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 100000))
+    EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", 10000))
+    EMBEDDING_CACHE_FLUSH_EVERY = int(os.getenv("EMBEDDING_CACHE_FLUSH_EVERY", 1000))
+    
     # UMAP & HDBSCAN parameters
     UMAP_N_COMPONENTS = 5
     UMAP_RANDOM_STATE = 42
     HDBSCAN_MIN_CLUSTER_SIZE = 15
     
+    # Near-duplicate detection before classification (MinHash + LSH over word shingles)
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "True").lower() in ("true", "1", "t")
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+    DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", 3))
+    DEDUP_NUM_PERM = 128
+    DEDUP_BANDS = 32
+    
+    # Clustering engine: "auto" picks one by corpus size, or force "exact", "fast" or "sampled"
+    CLUSTERING_ENGINE = os.getenv("CLUSTERING_ENGINE", "auto").lower()
+    CLUSTERING_FAST_THRESHOLD = int(os.getenv("CLUSTERING_FAST_THRESHOLD", 5000))
+    CLUSTERING_SAMPLE_THRESHOLD = int(os.getenv("CLUSTERING_SAMPLE_THRESHOLD", 50000))
+    CLUSTERING_SAMPLE_SIZE = int(os.getenv("CLUSTERING_SAMPLE_SIZE", 20000))
+    # Pre-reduction before UMAP on the fast paths: "pca", "random" or "none"
+    CLUSTERING_PRE_REDUCTION = os.getenv("CLUSTERING_PRE_REDUCTION", "pca").lower()
+    CLUSTERING_PRE_COMPONENTS = int(os.getenv("CLUSTERING_PRE_COMPONENTS", 50))
+    CLUSTERING_N_JOBS = int(os.getenv("CLUSTERING_N_JOBS", -1))
+    CLUSTERING_PREDICT_BATCH_SIZE = int(os.getenv("CLUSTERING_PREDICT_BATCH_SIZE", 10000))
+    
+    # Incremental processing
+    INCREMENTAL_PROCESSING = os.getenv("INCREMENTAL_PROCESSING", "False").lower() in ("true", "1", "t")
+    PIPELINE_STATE_DIR = os.getenv("PIPELINE_STATE_DIR", str(DATASETS_DIR / "pipeline_state"))
+    INCREMENTAL_REFIT_THRESHOLD = float(os.getenv("INCREMENTAL_REFIT_THRESHOLD", 0.2))
+    
+    # Streaming ingest for inputs larger than memory: the news CSV is read in chunks and the
+    # embeddings spill to a memory-mapped file, which clustering reads in one go
+    STREAMING_INGEST = os.getenv("STREAMING_INGEST", "False").lower() in ("true", "1", "t")
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 10000))
+    INGEST_EMBEDDINGS_PATH = os.path.join(PIPELINE_STATE_DIR, "ingest_embeddings.npy")
+    # The search index is built in memory over every title and summary, so it is skipped above this
+    STREAMING_SEARCH_INDEX_MAX_ROWS = int(os.getenv("STREAMING_SEARCH_INDEX_MAX_ROWS", 1000000))
+    
+    # Article search (BM25 over Title and news_summary)
+    SEARCH_BM25_K1 = 1.2
+    SEARCH_BM25_B = 0.75
+    SEARCH_MAX_PREFIX_EXPANSIONS = 50
+    # Share of the documents a word's postings may add to the candidates when ranking chat questions;
+    # stop words in more documents than this are skipped
+    SEARCH_MAX_DF_RATIO = float(os.getenv("SEARCH_MAX_DF_RATIO", 0.05))
+    
+    # Hybrid retrieval for chat: BM25 and vector search over all articles, fused with
+    # reciprocal rank fusion and reranked locally
+    HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "True").lower() in ("true", "1", "t")
+    RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 30))
+    RRF_K = 60
+    # Weight of the share of question words found in the title, next to cosine similarity
+    RERANK_TITLE_WEIGHT = float(os.getenv("RERANK_TITLE_WEIGHT", 0.3))
+    
+    # Approximate nearest neighbour index (IVF-PQ) over the article embeddings, serving chat
+    # vector search and related articles in process instead of querying Chroma
+    ANN_INDEX_ENABLED = os.getenv("ANN_INDEX_ENABLED", "True").lower() in ("true", "1", "t")
+    # Inverted lists (0 picks about the square root of the number of articles) and lists probed per query
+    ANN_NLIST = int(os.getenv("ANN_NLIST", 0))
+    ANN_NPROBE = int(os.getenv("ANN_NPROBE", 16))
+    # Product quantisation: one-byte codes per article (0 picks one per 16 dimensions)
+    ANN_PQ_SUBVECTORS = int(os.getenv("ANN_PQ_SUBVECTORS", 0))
+    ANN_TRAIN_SIZE = int(os.getenv("ANN_TRAIN_SIZE", 20000))
+    ANN_KMEANS_ITERATIONS = 10
+    # Candidates rescored with the full embeddings per result, where those are at hand
+    ANN_REFINE_FACTOR = int(os.getenv("ANN_REFINE_FACTOR", 10))
+    RELATED_ARTICLES_LIMIT = int(os.getenv("RELATED_ARTICLES_LIMIT", 5))
+    # Related articles precomputed per article: the most similar ones from its story cluster,
+    # topped up from its ANN list outside the cluster (0 disables the precomputed lists)
+    RELATED_ARTICLES_NEIGHBOURS = int(os.getenv("RELATED_ARTICLES_NEIGHBOURS", 10))
+    # Stories larger than this are split by ANN list before their neighbours are searched
+    RELATED_MAX_GROUP_SIZE = int(os.getenv("RELATED_MAX_GROUP_SIZE", 5000))
+    
+    # Prompt context for chat answers: token budget, counted with the chat model's encoding
+    CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "True").lower() in ("true", "1", "t")
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1500))
+    CONTEXT_TOKEN_ENCODING = os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+    # Sentences at least this similar to one kept from the same cluster are dropped
+    CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", 0.92))
+    CONTEXT_SNIPPET_CACHE_SIZE = int(os.getenv("CONTEXT_SNIPPET_CACHE_SIZE", 5000))
+    
     # Highlights settings
     HIGHLIGHTS_PER_CATEGORY = 5
     
+    # Highlight score weights: a title hit for the article's own category outranks everything,
+    # then each weighted keyword hit, then cluster size
+    HIGHLIGHT_PRIORITY_WEIGHT = 1000
+    HIGHLIGHT_KEYWORD_WEIGHT = 10
+    # Weight of a keyword hit in the summary relative to one in the title
+    HIGHLIGHT_SUMMARY_WEIGHT = 0.5
+    
     # Flask settings
     DEBUG = os.getenv("FLASK_DEBUG", "False").lower() in ("true", "1", "t")
     PORT = int(os.getenv("PORT", 8000))
+    
+    # Production serving (gunicorn, see gunicorn.conf.py): request workers share the state
+    # published by a separate pipeline process instead of building it themselves
+    MULTIPROCESS_SERVING = os.getenv("MULTIPROCESS_SERVING", "False").lower() in ("true", "1", "t")
+    PUBLISHED_STATE_PATH = os.path.join(PIPELINE_STATE_DIR, "published.json")
+    PIPELINE_LOCK_PATH = os.path.join(PIPELINE_STATE_DIR, "pipeline.lock")
+    JOBS_DIR = os.path.join(PIPELINE_STATE_DIR, "jobs")
+    # Seconds between checks for newly published state in a request worker
+    STATE_CHECK_INTERVAL = float(os.getenv("STATE_CHECK_INTERVAL", 1.0))
+    # Seconds between checks for queued jobs in the pipeline process
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+    
+    # Instrumentation: Prometheus metrics on /api/metrics, and sampling profiles of single
+    # requests asked for with ?profile=1 or an X-Profile header when profiling is enabled
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1", "t")
+    METRICS_DIR = os.path.join(PIPELINE_STATE_DIR, "metrics")
+    # Seconds between metrics snapshots written by each process of the multi-process server
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5.0))
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ("true", "1", "t")
+    PROFILE_DIR = os.getenv("PROFILE_DIR", str(DATASETS_DIR / "profiles"))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") 
\ No newline at end of file
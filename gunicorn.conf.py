@@ -0,0 +1,60 @@
+"""Gunicorn settings for production serving
+
+The app is loaded once in the master (preload_app), which reads the article
+store and search index; workers fork from it and share that memory
+copy-on-write. Pipeline runs, including the initial processing, happen in a
+separate pipeline process started here, which publishes new articles and
+highlights for the workers to pick up. Each worker serves requests on a
+thread pool, so throughput scales with the number of workers and cores.
+"""
+import gc
+import os
+import multiprocessing
+
+# Read by config.py, so it must be set before the app is imported
+os.environ.setdefault("MULTIPROCESS_SERVING", "true")
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+# Recycle workers now and then; a new worker forks from the preloaded master
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+# Set to false when the pipeline process runs in its own container (python -m rag.pipeline_service)
+embedded_pipeline = os.getenv("EMBEDDED_PIPELINE", "True").lower() in ("true", "1", "t")
+
+_pipeline_process = None
+
+def on_starting(server):
+    # Metrics snapshots of the previous run's processes would be summed into this run's
+    from rag.metrics import clear_shared_metrics
+    clear_shared_metrics()
+
+def when_ready(server):
+    global _pipeline_process
+    # Keep the preloaded objects out of garbage collection so their pages stay shared after forking
+    gc.freeze()
+
+    if embedded_pipeline:
+        # Spawned rather than forked: the pipeline process opens Chroma, which does not survive a fork
+        from rag.pipeline_service import run_pipeline_service
+        context = multiprocessing.get_context("spawn")
+        _pipeline_process = context.Process(target=run_pipeline_service, name="pipeline", daemon=True)
+        _pipeline_process.start()
+        server.log.info(f"Started pipeline process (pid {_pipeline_process.pid})")
+
+def post_fork(server, worker):
+    from rag.serving import init_worker
+    init_worker()
+
+def on_exit(server):
+    if _pipeline_process is not None and _pipeline_process.is_alive():
+        _pipeline_process.terminate()
+        _pipeline_process.join(timeout=10)
@@ -0,0 +1,382 @@
+import os
+import json
+import mmap
+import struct
+import numpy as np
+from loguru import logger
+from config import Config
+
+MAGIC = b"RAGIVFPQ"
+# Arrays in the index file start on cache-line boundaries so they can be viewed in place
+ALIGNMENT = 64
+ARRAY_NAMES = ('centroids', 'codebooks', 'list_offsets', 'codes', 'rows', 'slots', 'category_bits',
+               'slot_clusters', 'cluster_ids', 'cluster_offsets', 'cluster_slots')
+# Rows handled at once while training and encoding, bounding the memory of a build
+BATCH_SIZE = 4096
+# Centroids per sub-vector codebook, so each code fits in one byte
+CODEBOOK_SIZE = 256
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _default_subvectors(dim):
+    """Largest divisor of dim giving sub-vectors of at least 16 dimensions"""
+    m = max(dim // 16, 1)
+    while dim % m:
+        m -= 1
+    return m
+
+def row_norms(matrix):
+    """Euclidean norm of each row, computed a batch at a time"""
+    norms = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), BATCH_SIZE):
+        chunk = np.asarray(matrix[start:start + BATCH_SIZE], dtype=np.float32)
+        norms[start:start + BATCH_SIZE] = np.sqrt(np.einsum('ij,ij->i', chunk, chunk))
+    return norms
+
+def _nearest(data, centroids):
+    """Index of the nearest centroid (squared Euclidean distance) of each row"""
+    sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), BATCH_SIZE):
+        chunk = data[start:start + BATCH_SIZE]
+        labels[start:start + BATCH_SIZE] = np.argmin(sq_norms - 2.0 * chunk @ centroids.T, axis=1)
+    return labels
+
+def _kmeans(data, k, rng, spherical=False, iterations=Config.ANN_KMEANS_ITERATIONS):
+    """Lloyd's k-means from k distinct random rows; empty clusters keep their previous centroid
+
+    With `spherical`, centroids are renormalised after each step so the
+    nearest centroid of a unit vector is the one with the largest inner product.
+    """
+    centroids = np.array(data[np.sort(rng.choice(len(data), k, replace=False))], dtype=np.float32)
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(k, dtype=np.int64)
+        for start in range(0, len(data), BATCH_SIZE):
+            chunk = data[start:start + BATCH_SIZE]
+            labels = _nearest(chunk, centroids)
+            # Cluster sums as a one-hot product, which stays in BLAS
+            onehot = np.zeros((len(chunk), k), dtype=np.float32)
+            onehot[np.arange(len(chunk)), labels] = 1.0
+            sums += onehot.T @ chunk
+            counts += np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+class ANNIndex:
+    """IVF-PQ approximate nearest neighbour index over article embeddings
+
+    Unit-normalised embeddings are assigned to the nearest of `n_lists` coarse
+    centroids, and each one's residual to its centroid is product-quantised
+    into `m` one-byte codes, one per sub-vector. The inner product of a query
+    with an article is then its similarity to the article's list centroid plus
+    `m` lookups in a table computed once per query, so a search scores the
+    codes of the probed lists without touching the float32 embeddings.
+
+    Slots are grouped by list: `list_offsets[l]:list_offsets[l + 1]` are the
+    slots of list `l`, and `rows[s]` is the row position in
+    classified_articles.csv of the article in slot `s`. Only canonical
+    articles are indexed; `slots[row]` maps every row, duplicates included,
+    to the slot of its canonical copy (-1 if it has no embedding).
+
+    Searches can be filtered by category, with one bitmap over the slots per
+    category, and by cluster, whose slots are listed in
+    `cluster_slots[cluster_offsets[c]:cluster_offsets[c + 1]]` for the c-th
+    entry of `cluster_ids` and scored exhaustively since clusters are small.
+    """
+
+    def __init__(self, centroids, codebooks, list_offsets, codes, rows, slots, categories, category_bits,
+                 slot_clusters, cluster_ids, cluster_offsets, cluster_slots, nprobe=Config.ANN_NPROBE):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.list_offsets = list_offsets
+        self.codes = codes
+        self.rows = rows
+        self.slots = slots
+        self.categories = list(categories)
+        self.category_ids = {category: i for i, category in enumerate(self.categories)}
+        self.category_bits = category_bits
+        self.slot_clusters = slot_clusters
+        self.cluster_ids = cluster_ids
+        self.cluster_offsets = cluster_offsets
+        self.cluster_slots = cluster_slots
+        self.nprobe = nprobe
+
+        self.n_lists = len(centroids)
+        self.dim = centroids.shape[1]
+        self.m = codebooks.shape[0]
+        self.n_rows = len(slots)
+        # Offset of each sub-vector's codebook in the flattened lookup table
+        self._code_offsets = np.arange(self.m, dtype=np.int64) * codebooks.shape[1]
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, embeddings, categories, clusters, canonical=None, n_lists=Config.ANN_NLIST,
+              n_subvectors=Config.ANN_PQ_SUBVECTORS, train_size=Config.ANN_TRAIN_SIZE, seed=0):
+        """Train an index on a sample of the embeddings and encode all of them
+
+        Args:
+            embeddings: Matrix with one row per article
+            categories: Category of each article
+            clusters: Cluster label of each article (-1 for noise)
+            canonical: Row position of each article's canonical copy (if None, every row is canonical)
+            n_lists: Number of inverted lists (0 picks about the square root of the number of articles)
+            n_subvectors: One-byte codes per article (0 picks one per 16 dimensions)
+            train_size: Number of articles sampled to train the centroids and codebooks
+            seed: Random seed of the sampling and k-means initialisation
+
+        Returns:
+            ANNIndex: Index over the canonical articles with an embedding
+        """
+        n_rows, dim = embeddings.shape
+        own = np.arange(n_rows)
+        canonical = own if canonical is None else np.asarray(canonical)
+        norms = row_norms(embeddings)
+        indexed = np.flatnonzero((canonical == own) & (norms > 0))
+
+        m = n_subvectors or _default_subvectors(dim)
+        if dim % m:
+            raise ValueError(f"{dim}-dimensional embeddings cannot be split into {m} sub-vectors")
+        dsub = dim // m
+
+        # Train the coarse centroids and the residual codebooks on a sample
+        rng = np.random.default_rng(seed)
+        sample = indexed if len(indexed) <= train_size else np.sort(rng.choice(indexed, train_size, replace=False))
+        train = np.asarray(embeddings[sample], dtype=np.float32) / norms[sample, None]
+        if len(train):
+            n_lists = max(1, min(n_lists or int(np.sqrt(len(indexed))), len(train) // 32))
+            centroids = _kmeans(train, n_lists, rng, spherical=True)
+            residuals = train - centroids[_nearest(train, centroids)]
+            ksub = min(CODEBOOK_SIZE, len(train))
+            codebooks = np.stack([
+                _kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), ksub, rng)
+                for j in range(m)
+            ])
+        else:
+            n_lists = 0
+            centroids = np.zeros((0, dim), dtype=np.float32)
+            codebooks = np.zeros((m, 0, dsub), dtype=np.float32)
+
+        # Encode every indexed article, a batch at a time
+        lists = np.empty(len(indexed), dtype=np.int64)
+        codes = np.empty((len(indexed), m), dtype=np.uint8)
+        for start in range(0, len(indexed), BATCH_SIZE):
+            batch = indexed[start:start + BATCH_SIZE]
+            vectors = np.asarray(embeddings[batch], dtype=np.float32) / norms[batch, None]
+            lists[start:start + len(batch)] = _nearest(vectors, centroids)
+            residuals = vectors - centroids[lists[start:start + len(batch)]]
+            for j in range(m):
+                codes[start:start + len(batch), j] = _nearest(residuals[:, j * dsub:(j + 1) * dsub], codebooks[j])
+
+        # Group the slots by list
+        order = np.argsort(lists, kind='stable')
+        codes = codes[order]
+        rows = indexed[order].astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))]).astype(np.int64)
+        slot_of_row = np.full(n_rows, -1, dtype=np.int32)
+        slot_of_row[rows] = np.arange(len(rows), dtype=np.int32)
+        slots = np.where(canonical >= 0, slot_of_row[np.maximum(canonical, 0)], -1).astype(np.int32)
+
+        # One bitmap over the slots per category
+        slot_categories = np.asarray(categories).astype(str)[rows]
+        names = sorted(set(slot_categories.tolist()))
+        category_bits = np.zeros((len(names), (len(rows) + 7) // 8), dtype=np.uint8)
+        for i, name in enumerate(names):
+            category_bits[i] = np.packbits(slot_categories == name, bitorder='little')
+
+        # Slots of each cluster, noise left out
+        slot_clusters = np.nan_to_num(np.asarray(clusters, dtype=np.float64), nan=-1).astype(np.int32)[rows]
+        clustered = np.flatnonzero(slot_clusters >= 0)
+        cluster_slots = clustered[np.argsort(slot_clusters[clustered], kind='stable')].astype(np.int32)
+        cluster_ids, counts = np.unique(slot_clusters[cluster_slots], return_counts=True)
+        cluster_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        logger.info(f"Built ANN index over {len(rows)} articles: {n_lists} lists, {m} bytes of codes per article")
+        return cls(centroids, codebooks, list_offsets, codes, rows, slots, names, category_bits,
+                   slot_clusters, cluster_ids.astype(np.int32), cluster_offsets, cluster_slots)
+
+    def save(self, path):
+        """Persist the index as one file of aligned arrays, replacing any previous one atomically
+
+        A JSON header gives the dtype, shape and offset of each array so `load`
+        can map them in place.
+        """
+        header = {"categories": self.categories, "arrays": {}}
+        offset = 0
+        for name in ARRAY_NAMES:
+            array = getattr(self, name)
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _aligned(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+            for name in ARRAY_NAMES:
+                f.seek(data_start + header["arrays"][name]["offset"])
+                np.ascontiguousarray(getattr(self, name)).tofile(f)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved ANN index to {path}")
+
+    @classmethod
+    def load(cls, path, nprobe=Config.ANN_NPROBE):
+        """Memory-map an index saved with `save`
+
+        The arrays are read-only views of the mapped file, so processes serving
+        the same index share its pages, and a newer file swapped in by `save`
+        leaves the mapping of a loaded index intact.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an ANN index")
+            (header_size,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_size))
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data_start = _aligned(len(MAGIC) + 8 + header_size)
+
+        arrays = {}
+        for name in ARRAY_NAMES:
+            spec = header["arrays"][name]
+            dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+            count = int(np.prod(shape))
+            if count:
+                arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                             offset=data_start + spec["offset"]).reshape(shape)
+            else:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+        return cls(categories=header["categories"], nprobe=nprobe, **arrays)
+
+    def _list_slots(self, lists):
+        """Slots of the given lists, concatenated"""
+        starts = self.list_offsets[lists]
+        sizes = self.list_offsets[lists + 1] - starts
+        output_starts = np.cumsum(sizes) - sizes
+        return np.repeat(starts - output_starts, sizes) + np.arange(sizes.sum())
+
+    def cluster_members(self, cluster):
+        """Slots of the articles in a cluster"""
+        i = np.searchsorted(self.cluster_ids, cluster)
+        if i == len(self.cluster_ids) or self.cluster_ids[i] != cluster:
+            return self.cluster_slots[:0].astype(np.int64)
+        return self.cluster_slots[self.cluster_offsets[i]:self.cluster_offsets[i + 1]].astype(np.int64)
+
+    def lists_of(self, rows):
+        """Inverted list of each row's canonical article, or -1 if it is not indexed"""
+        slots = self.slots[rows]
+        return np.where(slots >= 0, np.searchsorted(self.list_offsets, slots, side='right') - 1, -1)
+
+    def cluster_of(self, row):
+        """Cluster of a row's canonical article, or -1 if it is not indexed or noise"""
+        slot = self.slots[row]
+        return int(self.slot_clusters[slot]) if slot >= 0 else -1
+
+    def vector(self, row):
+        """Approximate unit embedding of a row's canonical article, decoded from its codes
+
+        Returns:
+            ndarray: The embedding, or None if the article is not indexed
+        """
+        slot = self.slots[row]
+        if slot < 0:
+            return None
+        list_id = np.searchsorted(self.list_offsets, slot, side='right') - 1
+        return self.centroids[list_id] + self.codebooks[np.arange(self.m), self.codes[slot]].reshape(-1)
+
+    def _filter(self, slots, category, exclude_slot):
+        if category is not None:
+            if category not in self.category_ids:
+                return slots[:0]
+            bits = self.category_bits[self.category_ids[category]]
+            slots = slots[((bits[slots >> 3] >> (slots & 7)) & 1).astype(bool)]
+        if exclude_slot >= 0:
+            slots = slots[slots != exclude_slot]
+        return slots
+
+    def _top(self, slots, coarse, table, k):
+        """Rows of the k best scoring slots and their scores, best first"""
+        if len(slots) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        lists = np.searchsorted(self.list_offsets, slots, side='right') - 1
+        scores = coarse[lists] + table[self.codes[slots] + self._code_offsets].sum(axis=1)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return self.rows[slots[top]].astype(np.int64), scores[top]
+
+    def search(self, query, k=10, category=None, cluster=None, exclude=None, nprobe=None, refine=None):
+        """Approximate nearest articles to a query embedding by cosine similarity
+
+        Args:
+            query: Query embedding
+            k: Number of articles to return
+            category: Only return articles of this category
+            cluster: Only return articles of this cluster
+            exclude: Row whose canonical article is left out, e.g. the one related articles are looked up for
+            nprobe: Lists to probe (if None, use the index's default); more are probed
+                while the filters leave fewer than k articles
+            refine: Optional embedding matrix with one row per article; the best
+                k * Config.ANN_REFINE_FACTOR candidates are then rescored exactly from it
+
+        Returns:
+            tuple: (row positions, cosine similarities, approximate unless refined), best first
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(query))
+        if len(self.rows) == 0 or norm == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = query / norm
+        exclude_slot = int(self.slots[exclude]) if exclude is not None else -1
+
+        # Similarity of the query to every list centroid and to every codebook entry
+        coarse = self.centroids @ query
+        table = np.einsum('jcd,jd->jc', self.codebooks, query.reshape(self.m, -1)).ravel()
+
+        n_candidates = k * Config.ANN_REFINE_FACTOR if refine is not None else k
+        if cluster is not None:
+            slots = self._filter(self.cluster_members(cluster), category, exclude_slot)
+        else:
+            slots = self._probe(coarse, category, exclude_slot, n_candidates, nprobe)
+        rows, scores = self._top(slots, coarse, table, n_candidates)
+        if refine is None or len(rows) == 0:
+            return rows, scores
+
+        vectors = np.asarray(refine[rows], dtype=np.float32)
+        scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        top = np.argsort(-scores, kind='stable')[:k]
+        return rows[top], scores[top]
+
+    def _probe(self, coarse, category, exclude_slot, k, nprobe):
+        """Filtered slots of the lists nearest to the query, probing more lists until k are found"""
+        ranked = np.argsort(-coarse)
+        probed, nprobe = 0, min(nprobe or self.nprobe, self.n_lists)
+        found, n_found = [], 0
+        while True:
+            slots = self._filter(self._list_slots(ranked[probed:nprobe]), category, exclude_slot)
+            found.append(slots)
+            n_found += len(slots)
+            if n_found >= k or nprobe == self.n_lists:
+                break
+            probed, nprobe = nprobe, min(nprobe * 2, self.n_lists)
+        return np.concatenate(found)
+
+def load_ann_index(path=None):
+    """Load the ANN index saved by the pipeline
+
+    Returns:
+        ANNIndex: The index, or None if it is disabled, missing or unreadable
+    """
+    if path is None:
+        path = Config.ANN_INDEX_PATH
+    if not Config.ANN_INDEX_ENABLED or not os.path.exists(path):
+        return None
+    try:
+        return ANNIndex.load(path)
+    except Exception as e:
+        logger.warning(f"Could not load ANN index from {path}: {str(e)}")
+        return None
@@ -0,0 +1,128 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from loguru import logger
+from config import Config
+from .metrics import inc
+
+class SemanticAnswerCache:
+    """Cache of chat answers keyed on the question embedding
+
+    A lookup hits when a cached question of the same highlights generation has
+    cosine similarity of at least `threshold` with the new question. Entries
+    expire after `ttl` seconds and the least recently used entry is evicted
+    once `max_entries` is reached.
+    """
+
+    def __init__(self, threshold=Config.ANSWER_CACHE_SIMILARITY, ttl=Config.ANSWER_CACHE_TTL,
+                 max_entries=Config.ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._generations = None
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now):
+        """Drop entries past their TTL"""
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self):
+        """Stacked unit vectors of the cached questions, rebuilt only after changes"""
+        if self._matrix is None and self._entries:
+            self._keys = list(self._entries)
+            self._matrix = np.vstack([self._entries[key]["embedding"] for key in self._keys])
+            self._generations = np.array([self._entries[key]["generation"] for key in self._keys])
+        return self._matrix
+
+    def lookup(self, embedding, generation):
+        """Find a cached answer for a question
+
+        Args:
+            embedding: Question embedding
+            generation: Generation of the highlights the answer must come from
+
+        Returns:
+            dict or None: Copy of the cached answer, or None on a miss
+        """
+        with self._lock:
+            self._expire(time.time())
+            matrix = self._similarity_matrix()
+            if matrix is not None:
+                scores = np.where(self._generations == generation, matrix @ self._normalize(embedding), -np.inf)
+                best = int(scores.argmax())
+                entry = self._entries[self._keys[best]]
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(self._keys[best])
+                    self.hits += 1
+                    self.latency_saved += entry["latency"]
+                    inc("rag_answer_cache_lookups_total", result="hit")
+                    return copy.deepcopy(entry["result"])
+            self.misses += 1
+            inc("rag_answer_cache_lookups_total", result="miss")
+            return None
+
+    def store(self, embedding, generation, result, latency):
+        """Cache an answer
+
+        Args:
+            embedding: Question embedding
+            generation: Generation of the highlights the answer came from
+            result: Answer dict returned to the client
+            latency: Seconds it took to produce the answer
+        """
+        with self._lock:
+            self._entries[self._next_key] = {
+                "embedding": self._normalize(embedding),
+                "generation": generation,
+                "result": copy.deepcopy(result),
+                "latency": latency,
+                "created_at": time.time()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after new highlights are published"""
+        with self._lock:
+            if self._entries:
+                logger.info(f"Invalidating {len(self._entries)} cached chat answers")
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        """Return hit ratio and latency saved"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3)
+        }
+
+_answer_cache = SemanticAnswerCache()
+
+def get_answer_cache():
+    """Get the process-wide semantic answer cache"""
+    return _answer_cache
@@ -0,0 +1,273 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import Config
+from .search_index import InvertedIndex
+from .columnar_store import load_frame, load_embeddings
+from .ann_index import load_ann_index
+from .neighbours import load_related
+from .metrics import span
+
+# Publication date shown for every article (May 10, 2025)
+FIXED_PUBLISHED_AT = pd.Timestamp('2025-05-10T12:00:00Z').strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# Columns of the classified articles needed to serve them
+ARTICLE_COLUMNS = ['id', 'Title', 'news_summary', 'news_card_image', 'Date Published', 'Link',
+                   'Publication', 'Author', 'text', 'predicted_category', 'fingerprint']
+
+def load_merged_articles(articles_path=None, news_path=None):
+    """Load classified articles and merge them with the original news dataset
+
+    Args:
+        articles_path: Path to classified articles CSV (if None, use Config.CLASSIFIED_ARTICLES_CSV_PATH)
+        news_path: Path to original news CSV (if None, use Config.NEWS_CSV_PATH)
+
+    Returns:
+        DataFrame: Merged articles with the fields served by the API
+    """
+    if articles_path is None:
+        articles_path = Config.CLASSIFIED_ARTICLES_CSV_PATH
+
+    if news_path is None:
+        news_path = Config.NEWS_CSV_PATH
+
+    logger.info(f"Loading articles from {articles_path}")
+    articles_df = load_frame(articles_path, columns=ARTICLE_COLUMNS)
+
+    # Only the columns the classified articles lack are taken from the original news
+    news_columns = pd.read_csv(news_path, nrows=0).columns
+    missing = [col for col in news_columns if col not in articles_df.columns]
+    logger.info(f"Loading original news from {news_path}")
+    news_df = pd.read_csv(news_path, usecols=missing) if missing else pd.DataFrame(index=pd.RangeIndex(0))
+
+    # Ensure ID columns are proper strings for matching
+    articles_df['id'] = articles_df['id'].astype(str)
+    news_df['id'] = news_df.index.astype(str)
+
+    merged_df = pd.merge(
+        articles_df,
+        news_df,
+        left_on='id',
+        right_on='id',
+        how='left',
+        suffixes=('', '_orig')
+    )
+
+    # Handle possible missing columns gracefully
+    required_cols = ['Author', 'news_card_image', 'Link', 'Publication',
+                     'news_summary', 'Date Published', 'text', 'predicted_category',
+                     'Title']
+
+    for col in required_cols:
+        if col not in merged_df.columns:
+            logger.warning(f"Column {col} not found in merged dataframe, creating empty column")
+            merged_df[col] = ""
+
+    merged_df['author'] = merged_df['Author'].fillna('').replace('nil', '')
+    merged_df['urlToImage'] = merged_df['news_card_image'].fillna('')
+    merged_df['url'] = merged_df['Link'].fillna('')
+    merged_df['publication'] = merged_df['Publication'].fillna('')
+    merged_df['description'] = merged_df['news_summary'].fillna('').replace('nil', '')
+    merged_df['publishedAt'] = FIXED_PUBLISHED_AT
+    merged_df['content'] = merged_df['text'].fillna('')
+    merged_df['category'] = merged_df['predicted_category'].fillna('general')
+
+    return merged_df.reset_index(drop=True)
+
+def article_record(row):
+    """Build the API representation of one merged article row"""
+    return {
+        'id': str(row['id']),
+        'title': str(row['Title']),
+        'description': str(row['description']),
+        'content': str(row['content']),
+        'source': {
+            'id': str(row['publication']),
+            'name': str(row['publication'])
+        },
+        'author': str(row['author']),
+        'url': str(row['url']),
+        'urlToImage': str(row['urlToImage']),
+        'publishedAt': str(row['publishedAt']),
+        'category': str(row['category'])
+    }
+
+class ArticleStore:
+    """Resident, read-only view of the processed articles served by /api/articles
+
+    Articles are merged and normalised once. Each article's JSON is serialised
+    up front, and a per-category array of row offsets is kept so a page
+    request is a slice of that index joined into the response body.
+    """
+
+    def __init__(self, merged_df, search_index=None, ann_index=None, embeddings=None, related_rows=None):
+        self.records = [article_record(row) for row in merged_df.to_dict(orient='records')]
+        self.fragments = [json.dumps(record) for record in self.records]
+        self.ids = [record['id'] for record in self.records]
+        self.positions = {article_id: i for i, article_id in enumerate(self.ids)}
+
+        # Vector store entries are keyed on the fingerprint, shared by exact copies
+        self.fingerprints = (merged_df['fingerprint'].astype(str).tolist() if 'fingerprint' in merged_df.columns
+                             else list(self.ids))
+        self.fingerprint_positions = {}
+        for i, fingerprint in enumerate(self.fingerprints):
+            self.fingerprint_positions.setdefault(fingerprint, i)
+
+        categories = merged_df['predicted_category'].to_numpy()
+        self.all_offsets = np.arange(len(self.records), dtype=np.int32)
+        self.category_offsets = {
+            category: np.flatnonzero(categories == category).astype(np.int32)
+            for category in pd.unique(categories)
+        }
+
+        # Inverted index for the `q` filter, rebuilt if the persisted one is stale
+        if search_index is None or search_index.n_docs != len(self.records):
+            search_index = InvertedIndex.build(merged_df)
+        self.search_index = search_index
+
+        # ANN index and embeddings saved by the pipeline, ignored if they were built for other articles
+        if ann_index is not None and ann_index.n_rows != len(self.records):
+            logger.warning(f"ANN index covers {ann_index.n_rows} articles, not {len(self.records)}; ignoring it")
+            ann_index = None
+        self.ann_index = ann_index
+        self.embeddings = embeddings if embeddings is not None and len(embeddings) == len(self.records) else None
+        self.related_rows = related_rows if related_rows is not None and len(related_rows) == len(self.records) else None
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def load(cls, articles_path=None, news_path=None, index_path=None):
+        """Build a store from the processed articles and search index on disk"""
+        if index_path is None:
+            index_path = Config.SEARCH_INDEX_PATH
+
+        search_index = None
+        if os.path.exists(index_path):
+            try:
+                search_index = InvertedIndex.load(index_path)
+            except Exception as e:
+                logger.warning(f"Could not load search index from {index_path}: {str(e)}")
+
+        _, embeddings = load_embeddings()
+        store = cls(load_merged_articles(articles_path, news_path), search_index, load_ann_index(), embeddings,
+                    load_related())
+        logger.info(f"Article store loaded with {len(store)} articles")
+        return store
+
+    def offsets(self, category=None, q=None):
+        """Row offsets matching a category and search query
+
+        Without a query the offsets are in file order; with one they are
+        ranked by BM25 score.
+        """
+        if category and category != 'general':
+            offsets = self.category_offsets.get(category, self.all_offsets[:0])
+        else:
+            offsets = self.all_offsets
+
+        if q:
+            candidates = offsets if category and category != 'general' else None
+            offsets = self.search_index.search(q, candidates=candidates)
+        return offsets
+
+    def page(self, category=None, page=1, page_size=10, q=None):
+        """Select one page of articles
+
+        Args:
+            category: Category to filter by ('general' or None for all)
+            page: 1-based page number
+            page_size: Number of articles per page
+            q: Optional search query
+
+        Returns:
+            tuple: (list of JSON fragments for the page, total number of matches)
+        """
+        offsets = self.offsets(category, q)
+        start_idx = max(page - 1, 0) * page_size
+        return [self.fragments[i] for i in offsets[start_idx:start_idx + page_size]], len(offsets)
+
+    def render_page(self, category=None, page=1, page_size=10, q=None):
+        """Render one page as the /api/articles JSON body"""
+        fragments, total_results = self.page(category, page, page_size, q)
+        return '{"articles": [' + ', '.join(fragments) + '], "totalResults": ' + str(total_results) + '}'
+
+    def related(self, article_id, limit=Config.RELATED_ARTICLES_LIMIT, same_story=False):
+        """Store positions of the articles most similar to one, best first
+
+        Read from the neighbours precomputed by the pipeline when they cover
+        the limit, otherwise looked up in the ANN index and refined with the
+        saved embeddings. Duplicates of the article are never returned.
+
+        Args:
+            article_id: Id of the article
+            limit: Maximum number of related articles
+            same_story: Only return articles from the article's cluster
+
+        Returns:
+            list: Store positions, or None if the article is unknown
+        """
+        position = self.positions.get(article_id)
+        if position is None:
+            return None
+        index = self.ann_index
+        if self.related_rows is not None and limit <= self.related_rows.shape[1]:
+            rows = self.related_rows[position]
+            rows = rows[rows >= 0]
+            if same_story and index is not None:
+                cluster = index.cluster_of(position)
+                rows = rows[index.slot_clusters[index.slots[rows]] == cluster] if cluster >= 0 else rows[:0]
+            return rows[:limit].tolist()
+
+        if index is None:
+            return []
+        query = self.embeddings[position] if self.embeddings is not None else index.vector(position)
+        cluster = index.cluster_of(position) if same_story else None
+        if query is None or cluster == -1:
+            return []
+        with span("vector_search"):
+            rows, _ = index.search(query, limit, cluster=cluster, exclude=position, refine=self.embeddings)
+        return rows.tolist()
+
+    def render_related(self, article_id, limit=Config.RELATED_ARTICLES_LIMIT, same_story=False):
+        """Render the articles related to one as a /api/articles JSON body, or None if it is unknown"""
+        positions = self.related(article_id, limit, same_story)
+        if positions is None:
+            return None
+        fragments = [self.fragments[i] for i in positions]
+        return '{"articles": [' + ', '.join(fragments) + '], "totalResults": ' + str(len(fragments)) + '}'
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_article_store():
+    """Get the process-wide article store, loading it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArticleStore.load()
+    return _store
+
+def article_store_loaded():
+    """Whether this process holds an article store"""
+    return _store is not None
+
+def reload_article_store(articles_path=None, news_path=None):
+    """Rebuild the article store and swap it in atomically
+
+    Requests already holding the previous store keep reading from it.
+    """
+    global _store
+    store = ArticleStore.load(articles_path, news_path)
+    with _store_lock:
+        _store = store
+    return store
+
+def refresh_article_store():
+    """Reload the article store if this process has already loaded one"""
+    if _store is not None:
+        reload_article_store()
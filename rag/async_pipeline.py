@@ -0,0 +1,163 @@
+import asyncio
+from functools import lru_cache
+import numpy as np
+from loguru import logger
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+from config import Config
+from .embedding_matrix import aembed_matrix
+
+@lru_cache(maxsize=1)
+def _token_counter():
+    """Return a function counting tokens the way the embedding API does"""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(Config.EMBEDDING_MODEL)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        # Roughly four characters per token for English text
+        return lambda text: len(text) // 4 + 1
+
+def make_batches(texts, batch_tokens=Config.EMBEDDING_BATCH_TOKENS, max_batch_size=Config.EMBEDDING_BATCH_SIZE):
+    """Split texts into consecutive batches under a token budget
+
+    Args:
+        texts: List of text strings
+        batch_tokens: Maximum number of tokens per batch
+        max_batch_size: Maximum number of texts per batch
+
+    Returns:
+        list: (start, end) index pairs, one per batch
+    """
+    count_tokens = _token_counter()
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        n = count_tokens(text)
+        if i > start and (tokens + n > batch_tokens or i - start >= max_batch_size):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+class AsyncBatchRunner:
+    """Run embedding and vector store calls as bounded-concurrency asyncio batches
+
+    Texts are split into token-budgeted batches. Up to `max_concurrency`
+    embedding requests and `upsert_concurrency` upserts are in flight at once,
+    each batch retried with the same policy the pipeline uses elsewhere. In
+    `embed_and_upsert` a batch is upserted as soon as it is embedded, so
+    embedding of later batches overlaps upserts of earlier ones.
+    """
+
+    def __init__(self, embeddings=None, max_concurrency=Config.PIPELINE_MAX_CONCURRENCY,
+                 upsert_concurrency=Config.PIPELINE_UPSERT_CONCURRENCY,
+                 batch_tokens=Config.EMBEDDING_BATCH_TOKENS, max_batch_size=Config.EMBEDDING_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.max_concurrency = max_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.batch_tokens = batch_tokens
+        self.max_batch_size = max_batch_size
+
+    @staticmethod
+    async def _with_retry(fn, *args, **kwargs):
+        """Await fn with the pipeline retry policy"""
+        async for attempt in AsyncRetrying(stop=stop_after_attempt(3),
+                                           wait=wait_exponential(multiplier=1, min=2, max=10),
+                                           reraise=True):
+            with attempt:
+                return await fn(*args, **kwargs)
+
+    async def _embed_batch(self, semaphore, texts):
+        async with semaphore:
+            return await self._with_retry(aembed_matrix, self.embeddings, texts)
+
+    async def _upsert_batch(self, semaphore, collection, **payload):
+        async with semaphore:
+            await self._with_retry(asyncio.to_thread, collection.upsert, **payload)
+
+    async def embed(self, texts):
+        """Embed texts concurrently
+
+        Batches are written into one matrix as they arrive, so at most the
+        batches in flight exist besides it.
+
+        Returns:
+            np.ndarray: float32 matrix with one row per text, in input order
+        """
+        batches = make_batches(texts, self.batch_tokens, self.max_batch_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        matrix = np.empty((0, 0), dtype=np.float32)
+
+        async def embed_into(start, end):
+            nonlocal matrix
+            vectors = await self._embed_batch(semaphore, texts[start:end])
+            if not matrix.size:
+                matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            matrix[start:end] = vectors
+
+        await asyncio.gather(*(embed_into(start, end) for start, end in batches))
+        logger.info(f"Embedded {len(texts)} texts in {len(batches)} batches")
+        return matrix
+
+    async def upsert(self, collection, ids, embeddings, documents=None, metadatas=None):
+        """Upsert precomputed embeddings in batches of at most `max_batch_size`"""
+        semaphore = asyncio.Semaphore(self.upsert_concurrency)
+        tasks = []
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            payload = {"ids": ids[start:end], "embeddings": embeddings[start:end]}
+            if documents is not None:
+                payload["documents"] = documents[start:end]
+            if metadatas is not None:
+                payload["metadatas"] = metadatas[start:end]
+            tasks.append(self._upsert_batch(semaphore, collection, **payload))
+        await asyncio.gather(*tasks)
+        logger.info(f"Upserted {len(ids)} records to {collection.name} in {len(tasks)} batches")
+
+    async def embed_and_upsert(self, collection, ids, texts, metadatas=None, documents=None):
+        """Embed texts and upsert each batch as soon as its embeddings arrive
+
+        Args:
+            collection: ChromaDB collection
+            ids: Record ids
+            texts: Texts to embed
+            metadatas: Optional metadata per record
+            documents: Documents to store (if None, the texts are stored)
+
+        Returns:
+            np.ndarray: float32 matrix of the embeddings, in input order
+        """
+        documents = texts if documents is None else documents
+        embed_semaphore = asyncio.Semaphore(self.max_concurrency)
+        upsert_semaphore = asyncio.Semaphore(self.upsert_concurrency)
+
+        matrix = np.empty((0, 0), dtype=np.float32)
+
+        async def process(start, end):
+            nonlocal matrix
+            vectors = await self._embed_batch(embed_semaphore, texts[start:end])
+            payload = {"ids": ids[start:end], "embeddings": vectors, "documents": documents[start:end]}
+            if metadatas is not None:
+                payload["metadatas"] = metadatas[start:end]
+            await self._upsert_batch(upsert_semaphore, collection, **payload)
+            if not matrix.size:
+                matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            matrix[start:end] = vectors
+
+        batches = make_batches(texts, self.batch_tokens, self.max_batch_size)
+        await asyncio.gather(*(process(start, end) for start, end in batches))
+        logger.info(f"Embedded and upserted {len(ids)} records to {collection.name} in {len(batches)} batches")
+        return matrix
+
+def run_async(coro):
+    """Run a coroutine from synchronous pipeline code"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    raise RuntimeError("run_async cannot be used from inside a running event loop; await the coroutine instead")
@@ -1,15 +1,22 @@
+import numpy as np
 import pandas as pd
 from loguru import logger
 from langchain_openai import OpenAIEmbeddings
 from tenacity import retry, stop_after_attempt, wait_exponential
+from config import Config
+from .async_pipeline import AsyncBatchRunner, run_async
+from .embedding_matrix import embed_matrix, normalize_rows
+from .metrics import span
 from .vector_store import init_categories_collection, get_langchain_embeddings
 
 class NewsClassifier:
     """Classify news articles into predefined categories using embeddings"""
     
-    def __init__(self):
+    def __init__(self, batch_size=Config.EMBEDDING_BATCH_SIZE):
         self.embeddings = get_langchain_embeddings()
         self.categories_collection = init_categories_collection()
+        self.batch_size = batch_size
+        self._prototypes = None
     
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     def classify_text(self, text):
@@ -28,29 +35,83 @@ class NewsClassifier:
         )
         return results['ids'][0][0], results['distances'][0][0]
     
-    def classify_dataframe(self, df, text_column='text'):
+    def _category_prototypes(self):
+        """Load the category prototype vectors stored in the categories collection
+        
+        Returns:
+            tuple: (category names, prototype matrix of shape (n_categories, dim))
+        """
+        if self._prototypes is None:
+            stored = self.categories_collection.get(include=['embeddings'])
+            names = list(stored['ids'])
+            matrix = np.asarray(stored['embeddings'], dtype=np.float32)
+            self._prototypes = (names, matrix)
+        return self._prototypes
+    
+    def embed_texts(self, texts):
+        """Embed texts in token-budgeted batches of at most `batch_size`, several in flight at once
+        
+        Rows are L2-normalised here, once, for every later stage.
+        
+        Args:
+            texts: List of text strings
+            
+        Returns:
+            np.ndarray: float32 matrix with one unit-length embedding per text
+        """
+        runner = AsyncBatchRunner(self.embeddings, max_batch_size=self.batch_size)
+        return normalize_rows(run_async(runner.embed(texts)))
+    
+    def classify_embeddings(self, embeddings):
+        """Assign each embedding to its nearest category prototype
+        
+        Scores every embedding against every prototype with one matrix multiply.
+        The score `2 * e.p - |p|^2` is maximal for the prototype with the smallest
+        squared L2 distance, so `similarity` keeps the same meaning as the
+        distance returned by the Chroma query in `classify_text`.
+        
+        Args:
+            embeddings: float32 matrix of shape (n_articles, dim)
+            
+        Returns:
+            tuple: (list of categories, np.ndarray of squared L2 distances)
+        """
+        names, prototypes = self._category_prototypes()
+        scores = 2.0 * (embeddings @ prototypes.T) - np.einsum('ij,ij->i', prototypes, prototypes)
+        best = scores.argmax(axis=1)
+        distances = np.einsum('ij,ij->i', embeddings, embeddings) - scores[np.arange(len(best)), best]
+        return [names[i] for i in best], np.maximum(distances, 0.0)
+    
+    def classify_dataframe(self, df, text_column='text', return_embeddings=False):
         """Classify all articles in a dataframe
         
+        Texts are embedded once in batches and scored against the category
+        prototypes in a single vectorised step.
+        
         Args:
             df: DataFrame with articles
             text_column: Column containing the text to classify
+            return_embeddings: Also return the article embeddings so later stages can reuse them
             
         Returns:
-            DataFrame: Original dataframe with added predicted_category and similarity columns
+            DataFrame: Original dataframe with added predicted_category and similarity columns,
+                or a (DataFrame, embeddings) tuple when return_embeddings is True
         """
         logger.info(f"Classifying {len(df)} articles")
         
-        # Apply classification to each row
-        results = []
-        for text in df[text_column].tolist():
-            category, similarity = self.classify_text(text)
-            results.append((category, similarity))
+        with span("embed"):
+            embeddings = self.embed_texts(df[text_column].tolist())
         
         # Add results to dataframe
         df = df.copy()
-        df['predicted_category'], df['similarity'] = zip(*results)
+        if len(df):
+            df['predicted_category'], df['similarity'] = self.classify_embeddings(embeddings)
+        else:
+            df['predicted_category'], df['similarity'] = [], []
         
         logger.info(f"Classified {len(df)} articles into categories")
+        if return_embeddings:
+            return df, embeddings
         return df
     
     def batch_embed_texts(self, texts):
@@ -60,10 +121,10 @@ class NewsClassifier:
             texts: List of text strings
             
         Returns:
-            list: Embeddings for each text
+            np.ndarray: float32 matrix with one unit-length embedding per text
         """
         logger.info(f"Creating embeddings for {len(texts)} texts")
-        return self.embeddings.embed_documents(texts)
+        return normalize_rows(embed_matrix(self.embeddings, texts))
 
 def prepare_article_text(df):
     """Prepare article text by combining title and content
@@ -1,64 +1,191 @@
 import numpy as np
 import umap
 import hdbscan
+from sklearn.decomposition import PCA
+from sklearn.random_projection import GaussianRandomProjection
 from loguru import logger
 from config import Config
 
+ENGINES = ("exact", "fast", "sampled")
+
 class NewsClustering:
-    """Cluster news articles to detect duplicates and similar stories"""
+    """Cluster news articles to detect duplicates and similar stories
+    
+    Three engines trade exactness for speed as the corpus grows:
+    
+    - exact: UMAP over the full embeddings, then HDBSCAN (the original behaviour)
+    - fast: PCA or random-projection pre-reduction, then a parallel UMAP
+      (approximate nearest neighbours via pynndescent) and HDBSCAN
+    - sampled: the fast path fitted on a random sample, with the remaining
+      articles labelled in mini-batches by approximate_predict
+    
+    With engine="auto" the engine is chosen from the number of articles.
+    """
     
     def __init__(self, 
                  n_components=Config.UMAP_N_COMPONENTS,
                  random_state=Config.UMAP_RANDOM_STATE, 
-                 min_cluster_size=Config.HDBSCAN_MIN_CLUSTER_SIZE):
+                 min_cluster_size=Config.HDBSCAN_MIN_CLUSTER_SIZE,
+                 engine=Config.CLUSTERING_ENGINE):
         self.n_components = n_components
         self.random_state = random_state
         self.min_cluster_size = min_cluster_size
+        self.engine = engine
+        self.reducer = None
         self.umap_model = None
         self.clusterer = None
     
-    def fit_transform(self, embeddings):
-        """Fit UMAP and HDBSCAN models and transform embeddings
+    def select_engine(self, n_articles):
+        """Pick the clustering engine for a corpus of n_articles"""
+        if self.engine in ENGINES:
+            return self.engine
+        if n_articles > Config.CLUSTERING_SAMPLE_THRESHOLD:
+            return "sampled"
+        if n_articles > Config.CLUSTERING_FAST_THRESHOLD:
+            return "fast"
+        return "exact"
+    
+    def _pre_reduce(self, embeddings):
+        """Fit the linear pre-reduction used by the fast engines"""
+        n_components = min(Config.CLUSTERING_PRE_COMPONENTS, *embeddings.shape)
+        if Config.CLUSTERING_PRE_REDUCTION == "none" or n_components >= embeddings.shape[1]:
+            self.reducer = None
+            return embeddings
+        
+        if Config.CLUSTERING_PRE_REDUCTION == "random":
+            self.reducer = GaussianRandomProjection(n_components=n_components, random_state=self.random_state)
+        else:
+            self.reducer = PCA(n_components=n_components, svd_solver="randomized", random_state=self.random_state)
+        logger.info(f"Pre-reducing embeddings with {type(self.reducer).__name__} (n_components={n_components})")
+        return self.reducer.fit_transform(embeddings).astype(np.float32)
+    
+    def _fit(self, embeddings, engine):
+        """Fit the reduction and clustering models on embeddings"""
+        if engine == "exact":
+            self.reducer = None
+            logger.info(f"Running dimensionality reduction with UMAP (n_components={self.n_components})")
+            self.umap_model = umap.UMAP(
+                n_components=self.n_components,
+                random_state=self.random_state
+            )
+            reduced = self.umap_model.fit_transform(embeddings)
+        else:
+            features = self._pre_reduce(embeddings)
+            logger.info(f"Running parallel UMAP (n_components={self.n_components}, "
+                        f"n_jobs={Config.CLUSTERING_N_JOBS})")
+            # A fixed random_state forces UMAP to run single-threaded, so only the transform is seeded
+            self.umap_model = umap.UMAP(
+                n_components=self.n_components,
+                n_jobs=Config.CLUSTERING_N_JOBS,
+                transform_seed=self.random_state,
+                low_memory=True
+            )
+            reduced = self.umap_model.fit_transform(features)
+        
+        logger.info(f"Clustering with HDBSCAN (min_cluster_size={self.min_cluster_size})")
+        parallel = {} if engine == "exact" else {"core_dist_n_jobs": Config.CLUSTERING_N_JOBS}
+        self.clusterer = hdbscan.HDBSCAN(
+            min_cluster_size=self.min_cluster_size,
+            prediction_data=True,
+            **parallel
+        )
+        return self.clusterer.fit_predict(reduced)
+    
+    def fit_transform(self, embeddings, rows=None):
+        """Fit the clustering models and assign every article to a cluster
         
         Args:
-            embeddings: List of article embeddings
+            embeddings: Article embeddings, as a list, matrix or memory-mapped matrix
+            rows: Positions of the rows of embeddings to cluster (if None, all of them). On
+                the sampled path only the sample and one prediction batch are read at a time
             
         Returns:
             np.array: Cluster assignments for each article
         """
-        logger.info(f"Running dimensionality reduction with UMAP (n_components={self.n_components})")
-        self.umap_model = umap.UMAP(
-            n_components=self.n_components,
-            random_state=self.random_state
-        )
-        reduced = self.umap_model.fit_transform(embeddings)
+        if rows is None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_articles = len(embeddings) if rows is None else len(rows)
+        engine = self.select_engine(n_articles)
+        logger.info(f"Clustering {n_articles} articles with the {engine} engine")
         
-        logger.info(f"Clustering with HDBSCAN (min_cluster_size={self.min_cluster_size})")
-        self.clusterer = hdbscan.HDBSCAN(
-            min_cluster_size=self.min_cluster_size,
-            prediction_data=True
-        )
-        clusters = self.clusterer.fit_predict(reduced)
+        if engine == "sampled" and n_articles > Config.CLUSTERING_SAMPLE_SIZE:
+            rows = np.arange(n_articles) if rows is None else np.asarray(rows)
+            rng = np.random.default_rng(self.random_state)
+            sample = np.sort(rng.choice(n_articles, Config.CLUSTERING_SAMPLE_SIZE, replace=False))
+            clusters = np.empty(n_articles, dtype=int)
+            clusters[sample] = self._fit(np.asarray(embeddings[rows[sample]], dtype=np.float32), engine)
+            rest = np.setdiff1d(np.arange(n_articles), sample, assume_unique=True)
+            clusters[rest] = self.predict(embeddings, rows[rest])
+        else:
+            features = embeddings if rows is None else embeddings[np.asarray(rows)]
+            clusters = self._fit(np.asarray(features, dtype=np.float32), engine)
         
         logger.info(f"Found {len(np.unique(clusters))} clusters")
         return clusters
     
-    def add_clusters_to_df(self, df, embeddings):
-        """Add cluster assignments to DataFrame
+    def predict(self, embeddings, rows=None):
+        """Assign new articles to the clusters found by the last fit
+        
+        Uses the fitted reduction models to project the embeddings and
+        HDBSCAN's approximate_predict (enabled by prediction_data=True) to
+        label them, in batches of Config.CLUSTERING_PREDICT_BATCH_SIZE.
         
         Args:
-            df: DataFrame with articles
-            embeddings: List of article embeddings
+            embeddings: Article embeddings, as a list, matrix or memory-mapped matrix
+            rows: Positions of the rows of embeddings to label (if None, all of them)
             
         Returns:
-            DataFrame: Original DataFrame with added 'cluster' and 'cluster_size' columns
+            np.array: Cluster assignments for each article
         """
-        clusters = self.fit_transform(embeddings)
+        if self.umap_model is None or self.clusterer is None:
+            raise ValueError("Clustering models must be fitted before predicting")
+        
+        if rows is None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_articles = len(embeddings) if rows is None else len(rows)
+        # Models pickled before the fast engines existed have no reducer attribute
+        reducer = getattr(self, "reducer", None)
+        clusters = []
+        for start in range(0, n_articles, Config.CLUSTERING_PREDICT_BATCH_SIZE):
+            end = start + Config.CLUSTERING_PREDICT_BATCH_SIZE
+            batch = embeddings[start:end] if rows is None else embeddings[rows[start:end]]
+            batch = np.asarray(batch, dtype=np.float32)
+            if reducer is not None:
+                batch = reducer.transform(batch).astype(np.float32)
+            labels, _ = hdbscan.approximate_predict(self.clusterer, self.umap_model.transform(batch))
+            clusters.append(labels)
+        clusters = np.concatenate(clusters) if clusters else np.empty(0, dtype=int)
+        logger.info(f"Assigned {len(clusters)} articles to existing clusters")
+        return clusters
+    
+    @staticmethod
+    def assign_clusters(df, clusters):
+        """Set cluster assignments on a DataFrame and recompute cluster sizes
         
+        Args:
+            df: DataFrame with articles
+            clusters: Cluster assignment for each row
+            
+        Returns:
+            DataFrame: Copy of df with 'cluster' and 'cluster_size' columns
+        """
         df = df.copy()
-        df['cluster'] = clusters
+        df['cluster'] = np.asarray(clusters, dtype=int)
         
         # Add cluster size for each article
         df['cluster_size'] = df.groupby('cluster')['id'].transform('count')
         
-        return df 
\ No newline at end of file
+        return df
+    
+    def add_clusters_to_df(self, df, embeddings):
+        """Add cluster assignments to DataFrame
+        
+        Args:
+            df: DataFrame with articles
+            embeddings: List of article embeddings
+            
+        Returns:
+            DataFrame: Original DataFrame with added 'cluster' and 'cluster_size' columns
+        """
+        clusters = self.fit_transform(embeddings)
+        return self.assign_clusters(df, clusters) 
\ No newline at end of file
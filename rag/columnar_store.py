@@ -0,0 +1,236 @@
+import os
+import pandas as pd
+from loguru import logger
+from config import Config
+from .embedding_matrix import encode_embeddings
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+def columnar_path(csv_path):
+    """Path of the Arrow file stored next to a CSV output"""
+    return os.path.splitext(str(csv_path))[0] + ".arrow"
+
+def columnar_enabled():
+    """Whether pipeline outputs are stored as Arrow files"""
+    return Config.STORAGE_FORMAT == "arrow" and pa is not None
+
+def _replace_atomically(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _to_arrow(df):
+    """Convert a DataFrame to an Arrow table, storing mixed object columns as strings"""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        values = df[col]
+        df[col] = values.where(values.isna(), values.astype(str))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def _arrow_type(values):
+    """Arrow type of a column, null when it holds no values"""
+    if values.dtype == object:
+        return pa.string() if values.notna().any() else pa.null()
+    if values.dtype.kind == "f" and values.isna().all():
+        return pa.null()
+    try:
+        return pa.from_numpy_dtype(values.dtype)
+    except (TypeError, NotImplementedError, pa.ArrowNotImplementedError):
+        return pa.string()
+
+def _widen_type(a, b):
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (a, b)):
+        return pa.float64()
+    return pa.string()
+
+def widen_schema(schema, df):
+    """Arrow schema holding the rows of both `schema` and df, for tables written a chunk at a time
+
+    A column null on one side takes the other side's type, integer and floating
+    point columns widen to float64 and other mismatches to string.
+
+    Args:
+        schema: Schema so far (if None, df's own)
+        df: DataFrame chunk
+
+    Returns:
+        pa.Schema: The widened schema, or None without pyarrow
+    """
+    if pa is None:
+        return None
+    types = {field.name: field.type for field in schema} if schema is not None else {}
+    for col in df.columns:
+        column_type = _arrow_type(df[col])
+        types[col] = _widen_type(types[col], column_type) if col in types else column_type
+    return pa.schema(list(types.items()))
+
+def _write_ipc(table, path):
+    # Uncompressed IPC files can be memory-mapped without copying the buffers
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def read_arrow_table(path, columns=None):
+    """Memory-map an Arrow IPC file
+
+    Args:
+        path: Path to the .arrow file
+        columns: Optional list of columns to keep; columns missing from the file are ignored
+
+    Returns:
+        pa.Table: Table whose buffers point into the mapped file
+    """
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    if columns is not None:
+        table = table.select([col for col in columns if col in table.column_names])
+    return table
+
+def save_frame(df, csv_path):
+    """Save a pipeline output table
+
+    The Arrow file is written when columnar storage is enabled; the CSV is
+    kept as an export for compatibility unless Config.CSV_EXPORT is off. Both
+    are replaced atomically, the CSV first so the Arrow file is never older.
+
+    Args:
+        df: DataFrame to save
+        csv_path: Path of the CSV output; the Arrow file goes next to it
+    """
+    if Config.CSV_EXPORT or not columnar_enabled():
+        _replace_atomically(csv_path, lambda path: df.to_csv(path, index=False))
+    if columnar_enabled():
+        table = _to_arrow(df)
+        _replace_atomically(columnar_path(csv_path), lambda path: _write_ipc(table, path))
+
+class FrameWriter:
+    """Write a pipeline output table a chunk at a time, to the same files as `save_frame`
+
+    Chunks are appended to temporary files that replace the outputs on
+    `close`, the CSV first. The Arrow file's schema is fixed by the first
+    chunk, so every chunk is cast to `schema` widened with the first chunk;
+    columns still null then are stored as strings. Pass the schema of all the
+    chunks, built with `widen_schema`, when a later chunk may hold values of
+    a type the first one lacks.
+
+    Args:
+        csv_path: Path of the CSV output; the Arrow file goes next to it
+        schema: Arrow schema of the chunks (if None, the first chunk's)
+    """
+
+    def __init__(self, csv_path, schema=None):
+        self.csv_path = csv_path if Config.CSV_EXPORT or not columnar_enabled() else None
+        self.arrow_path = columnar_path(csv_path) if columnar_enabled() else None
+        self.schema = schema
+        self.rows = 0
+        self._sink = None
+        self._writer = None
+
+    def write(self, df):
+        """Append a chunk"""
+        if self.csv_path:
+            df.to_csv(f"{self.csv_path}.tmp", mode="a" if self.rows else "w", header=not self.rows, index=False)
+        if self.arrow_path:
+            if self._writer is None:
+                self.schema = pa.schema([
+                    pa.field(field.name, pa.string() if pa.types.is_null(field.type) else field.type)
+                    for field in widen_schema(self.schema, df)
+                ])
+                self._sink = pa.OSFile(f"{self.arrow_path}.tmp", "wb")
+                self._writer = pa.ipc.new_file(self._sink, self.schema)
+            self._writer.write_table(_to_arrow(df).select(self.schema.names).cast(self.schema))
+        self.rows += len(df)
+
+    def close(self):
+        """Replace the outputs with the chunks written"""
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+        if self.csv_path and self.rows:
+            os.replace(f"{self.csv_path}.tmp", self.csv_path)
+        if self._writer is not None:
+            os.replace(f"{self.arrow_path}.tmp", self.arrow_path)
+
+def load_frame(csv_path, columns=None, exclude=None):
+    """Load a pipeline output table, preferring its Arrow file
+
+    The Arrow file is used when columnar storage is enabled and it is at least
+    as new as the CSV; otherwise the CSV is parsed. Only the requested columns
+    are materialised.
+
+    Args:
+        csv_path: Path of the CSV output
+        columns: Optional list of columns to load (missing ones are ignored)
+        exclude: Optional list of columns to skip, e.g. ['text'] for listings
+
+    Returns:
+        DataFrame: The loaded table
+    """
+    arrow_file = columnar_path(csv_path)
+    use_arrow = columnar_enabled() and os.path.exists(arrow_file) and (
+        not os.path.exists(csv_path) or os.path.getmtime(arrow_file) >= os.path.getmtime(csv_path))
+
+    if use_arrow:
+        try:
+            table = read_arrow_table(arrow_file, columns)
+            if exclude:
+                table = table.drop_columns([col for col in exclude if col in table.column_names])
+            return table.to_pandas()
+        except Exception as e:
+            logger.warning(f"Could not read {arrow_file}, falling back to CSV: {str(e)}")
+
+    usecols = None
+    if columns is not None or exclude:
+        keep = set(columns) if columns is not None else None
+        skip = set(exclude or ())
+        usecols = lambda col: (keep is None or col in keep) and col not in skip
+    return pd.read_csv(csv_path, usecols=usecols)
+
+def save_embeddings(ids, embeddings, path=None):
+    """Save article embeddings as an Arrow file with `id` and fixed-size `embedding` columns
+
+    Embeddings are stored as Config.EMBEDDING_STORAGE_DTYPE, see `encode_embeddings`.
+
+    Args:
+        ids: Article ids, one per row
+        embeddings: Matrix with one row per article
+        path: Output path (if None, use Config.EMBEDDINGS_PATH)
+    """
+    if not columnar_enabled():
+        return
+    if path is None:
+        path = Config.EMBEDDINGS_PATH
+
+    matrix = encode_embeddings(embeddings)
+    dim = matrix.shape[1] if matrix.ndim == 2 else 0
+    vectors = pa.FixedSizeListArray.from_arrays(pa.array(matrix.reshape(-1)), dim)
+    table = pa.table({"id": pa.array([str(i) for i in ids]), "embedding": vectors})
+    _replace_atomically(path, lambda tmp_path: _write_ipc(table, tmp_path))
+    logger.info(f"Saved {len(matrix)} embeddings to {path}")
+
+def load_embeddings(path=None):
+    """Memory-map article embeddings saved with `save_embeddings`
+
+    Returns:
+        tuple: (list of ids, read-only matrix of the stored type backed by the mapped file),
+            or (None, None) if no embeddings are stored. int8 rows are scaled per row, so
+            they keep their direction only, which is all cosine similarity needs.
+    """
+    if path is None:
+        path = Config.EMBEDDINGS_PATH
+    if pa is None or not os.path.exists(path):
+        return None, None
+
+    table = read_arrow_table(path)
+    chunks = table.column("embedding").chunks
+    column = chunks[0] if len(chunks) == 1 else pa.concat_arrays(chunks)
+    values = column.flatten().to_numpy(zero_copy_only=True)
+    matrix = values.reshape(len(column), column.type.list_size)
+    return table.column("id").to_pylist(), matrix
@@ -0,0 +1,221 @@
+import re
+import zlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from loguru import logger
+from config import Config
+from .vector_store import get_langchain_embeddings
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Sentences longer than this many words are cut into pieces of this size
+MAX_SENTENCE_WORDS = 60
+
+@lru_cache(maxsize=1)
+def _token_counter():
+    """Return a function counting tokens the way the chat model does"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(Config.CONTEXT_TOKEN_ENCODING)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        # Roughly four characters per token for English text
+        return lambda text: len(text) // 4 + 1
+
+def count_tokens(text):
+    """Number of prompt tokens in a text"""
+    return _token_counter()(text)
+
+def split_sentences(text):
+    """Split text into sentences, cutting overly long ones into word windows"""
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY.split(str(text).strip()):
+        words = sentence.split()
+        for start in range(0, len(words), MAX_SENTENCE_WORDS):
+            sentences.append(' '.join(words[start:start + MAX_SENTENCE_WORDS]))
+    return sentences
+
+def _normalize(sentence):
+    return ' '.join(sentence.lower().split())
+
+def _strip_title(text, title):
+    """Drop the title from the start of an article body that repeats it"""
+    text = str(text).strip()
+    if title and text.lower().startswith(title.lower()):
+        return text[len(title):].lstrip(' .:-|')
+    return text
+
+class ArticleUnits:
+    """Sentences of one article with their token counts and (lazily) embeddings"""
+
+    def __init__(self, text):
+        self.sentences = split_sentences(text)
+        self.keys = [_normalize(sentence) for sentence in self.sentences]
+        self.tokens = np.array([count_tokens(sentence) for sentence in self.sentences], dtype=np.int32)
+        self.embeddings = None
+
+class SnippetCache:
+    """LRU cache of per-article sentence units, keyed on article id and text
+
+    Splitting, token counting and sentence embeddings only depend on the
+    article, so they are computed once and reused by every question the
+    article is retrieved for.
+    """
+
+    def __init__(self, max_entries=Config.CONTEXT_SNIPPET_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, article_id, text):
+        """Sentence units of an article, split on first use"""
+        key = (article_id, zlib.crc32(str(text).encode('utf-8')))
+        with self._lock:
+            units = self._entries.get(key)
+            if units is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return units
+        units = ArticleUnits(text)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = units
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return units
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class ContextBuilder:
+    """Assemble the prompt context for a chat answer within a token budget
+
+    Passages are taken in retrieval order. Sentences already present in an
+    earlier passage are dropped, so duplicate copies of a story add nothing.
+    When the remaining text still exceeds the budget, each passage keeps its
+    title and the sentences most similar to the question, within an even
+    share of the budget left; sentences nearly identical to one already kept
+    from a passage of the same cluster are skipped. Kept sentences stay in
+    their original order.
+    """
+
+    def __init__(self, embeddings, max_tokens=Config.CONTEXT_MAX_TOKENS,
+                 duplicate_similarity=Config.CONTEXT_DUPLICATE_SIMILARITY, cache=None):
+        self.embeddings = embeddings
+        self.max_tokens = max_tokens
+        self.duplicate_similarity = duplicate_similarity
+        self.cache = cache if cache is not None else SnippetCache()
+
+    def _embed_sentences(self, units_list):
+        """Fill in missing sentence embeddings with one batched call"""
+        pending = [units for units in units_list if units.embeddings is None and units.sentences]
+        if not pending:
+            return
+        texts = [sentence for units in pending for sentence in units.sentences]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        start = 0
+        for units in pending:
+            units.embeddings = vectors[start:start + len(units.sentences)]
+            start += len(units.sentences)
+
+    def build(self, question_embedding, passages):
+        """Build the context text
+
+        Args:
+            question_embedding: Embedding of the question
+            passages: Dicts with `id`, `title` (may be None), `text` and optional `group`
+                (cluster id; passages sharing one are checked for near-duplicate sentences),
+                best first
+
+        Returns:
+            tuple: (context text, positions of the passages that contributed to it)
+        """
+        seen = set()
+        candidates = []
+        for i, passage in enumerate(passages):
+            title = passage.get('title')
+            title_key = _normalize(title) if title else None
+            units = self.cache.get(passage['id'], _strip_title(passage['text'], title))
+            keep = []
+            for j, key in enumerate(units.keys):
+                if key and key not in seen and key != title_key:
+                    keep.append(j)
+                    seen.add(key)
+            if not keep and (title_key is None or title_key in seen):
+                continue
+            if title_key:
+                seen.add(title_key)
+            header = f"{title}. " if title else ""
+            candidates.append((i, passage, units, keep, header, count_tokens(header) if header else 0))
+
+        full_tokens = sum(header_tokens + int(units.tokens[keep].sum())
+                          for _, _, units, keep, _, header_tokens in candidates)
+        if full_tokens > self.max_tokens:
+            selections = self._compress(question_embedding, candidates)
+        else:
+            selections = [(i, header, [units.sentences[j] for j in keep])
+                          for i, _, units, keep, header, _ in candidates]
+
+        context = ""
+        used = []
+        for i, header, sentences in selections:
+            if not header and not sentences:
+                continue
+            context += f"{header}{' '.join(sentences)}".strip() + "\n\n"
+            used.append(i)
+        logger.debug(f"Context from {len(used)} of {len(passages)} passages "
+                     f"({'compressed from ' if full_tokens > self.max_tokens else ''}{full_tokens} tokens)")
+        return context, used
+
+    def _compress(self, question_embedding, candidates):
+        """Keep the sentences most similar to the question within each passage's share of the budget"""
+        self._embed_sentences([units for _, _, units, _, _, _ in candidates])
+        query = np.asarray(question_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        remaining = self.max_tokens
+        kept_by_group = {}
+        selections = []
+        for n, (i, passage, units, keep, header, header_tokens) in enumerate(candidates):
+            share = remaining // (len(candidates) - n)
+            if header_tokens > share:
+                continue
+            budget = share - header_tokens
+            group = passage.get('group')
+            group_vectors = kept_by_group.setdefault(group, []) if group is not None else []
+
+            # The best sentence may take more than the share, so long passages are never reduced to their title
+            chosen = []
+            scores = units.embeddings[keep] @ query if keep else np.empty(0)
+            for j in (keep[k] for k in np.argsort(-scores, kind='stable')):
+                if units.tokens[j] > (budget if chosen else remaining - share + budget):
+                    continue
+                vector = units.embeddings[j]
+                if group_vectors and max(float(v @ vector) for v in group_vectors) >= self.duplicate_similarity:
+                    continue
+                chosen.append(j)
+                budget -= int(units.tokens[j])
+                if group is not None:
+                    group_vectors.append(vector)
+
+            remaining -= share - budget
+            selections.append((i, header, [units.sentences[j] for j in sorted(chosen)]))
+        return selections
+
+_builder = None
+_builder_lock = threading.Lock()
+
+def get_context_builder():
+    """Get the process-wide context builder, sharing one snippet cache"""
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                _builder = ContextBuilder(get_langchain_embeddings())
+    return _builder
@@ -0,0 +1,200 @@
+import zlib
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import Config
+from .search_index import tokenize
+
+# Mersenne prime 2^61 - 1 for the universal hash family
+_PRIME = np.uint64((1 << 61) - 1)
+
+def shingle_hashes(text, size=Config.DEDUP_SHINGLE_SIZE):
+    """Hashes of the overlapping word shingles of a text
+
+    Args:
+        text: Article text
+        size: Number of words per shingle
+
+    Returns:
+        np.ndarray: Unique uint64 shingle hashes (texts shorter than `size` words form one shingle)
+    """
+    tokens = tokenize(text)
+    shingles = [' '.join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))]
+    return np.unique(np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                                 dtype=np.uint64, count=len(shingles)))
+
+class MinHasher:
+    """MinHash signatures estimating the Jaccard similarity of shingle sets"""
+
+    def __init__(self, num_perm=Config.DEDUP_NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        # a * h + b stays below 2^64 because a, b and the crc32 hashes are below 2^32
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        """MinHash signature of one set of shingle hashes"""
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def signatures(self, texts):
+        """Signature matrix with one row per text"""
+        return np.vstack([self.signature(shingle_hashes(text)) for text in texts]) if len(texts) \
+            else np.empty((0, self.num_perm), dtype=np.uint64)
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def _roots(parent, rows):
+    """Group root of each of rows, compressing parent to point at the roots"""
+    roots = parent[rows]
+    while True:
+        parent[rows] = roots
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+def _union(parent, i, j):
+    # The lower index becomes the root so the first copy is the canonical one
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        parent[max(ri, rj)] = min(ri, rj)
+
+def _merge_bucket(parent, unique_rows, signatures, members, threshold):
+    """Merge the members of one LSH bucket into the groups of the texts they are similar to
+
+    Each member is compared with one representative per group already found
+    in the bucket, skipping groups it already belongs to, so a bucket of m
+    copies of one story costs m comparisons rather than m^2.
+    """
+    representatives = []
+    for member in members:
+        row = unique_rows[member]
+        root = _find(parent, row)
+        others = [r for r in representatives if _find(parent, unique_rows[r]) != root]
+        grouped = len(others) < len(representatives)
+        if others:
+            matches = np.count_nonzero(signatures[others] == signatures[member], axis=1)
+            for other in np.asarray(others)[matches >= threshold * signatures.shape[1]]:
+                _union(parent, unique_rows[other], row)
+                grouped = True
+        if not grouped:
+            representatives.append(member)
+
+def find_duplicates(texts, threshold=Config.DEDUP_THRESHOLD, bands=Config.DEDUP_BANDS,
+                    num_perm=Config.DEDUP_NUM_PERM):
+    """Group exact and near-duplicate texts
+
+    Identical texts (after tokenisation) are collapsed first. The remaining
+    unique texts get MinHash signatures, which are split into `bands` bands
+    for locality-sensitive hashing: texts sharing any band bucket are
+    candidates, and a candidate is merged into a group of its bucket when its
+    estimated Jaccard similarity with the group's representative reaches
+    `threshold`.
+
+    Args:
+        texts: List of article texts
+        threshold: Minimum estimated Jaccard similarity of word shingles
+        bands: Number of LSH bands; must divide num_perm
+        num_perm: Number of MinHash permutations
+
+    Returns:
+        np.ndarray: Position of the canonical (first) copy for each text
+    """
+    n = len(texts)
+    parent = np.arange(n)
+
+    # Exact duplicates
+    first_seen = {}
+    unique_rows = []
+    for i, text in enumerate(texts):
+        key = ' '.join(tokenize(text))
+        if key in first_seen:
+            parent[i] = first_seen[key]
+        else:
+            first_seen[key] = i
+            unique_rows.append(i)
+
+    # Near duplicates among the unique texts
+    unique_rows = np.asarray(unique_rows, dtype=int)
+    signatures = MinHasher(num_perm).signatures([texts[i] for i in unique_rows])
+    rows_per_band = num_perm // bands
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        _, buckets, counts = np.unique(keys.view(np.dtype((np.void, keys.dtype.itemsize * rows_per_band))),
+                                       return_inverse=True, return_counts=True)
+        # Members of each bucket are consecutive in `order`, in row order
+        order = np.argsort(buckets.ravel(), kind='stable')
+        starts = np.cumsum(counts) - counts
+        # Skip the buckets whose members earlier bands already put in one group
+        roots = _roots(parent, unique_rows[order])
+        split = roots != np.repeat(roots[starts], counts)
+        for bucket in np.unique(np.repeat(np.arange(len(counts)), counts)[split]):
+            _merge_bucket(parent, unique_rows, signatures, order[starts[bucket]:starts[bucket] + counts[bucket]],
+                          threshold)
+
+    return np.array([_find(parent, i) for i in range(n)], dtype=int)
+
+def mark_duplicates(df, text_column='text'):
+    """Add a 'duplicate_of' column with the id of each duplicate's canonical article
+
+    Canonical articles (including every article that has no duplicate) get <NA>.
+
+    Args:
+        df: DataFrame with articles
+        text_column: Column containing the text to compare
+
+    Returns:
+        DataFrame: Copy of df with the 'duplicate_of' column
+    """
+    df = df.copy()
+    if Config.DEDUP_ENABLED and len(df):
+        canonical = find_duplicates(df[text_column].fillna('').astype(str).tolist())
+    else:
+        canonical = np.arange(len(df))
+
+    is_duplicate = canonical != np.arange(len(df))
+    duplicate_of = pd.Series(pd.NA, index=df.index, dtype=object)
+    duplicate_of[is_duplicate] = df['id'].to_numpy()[canonical[is_duplicate]]
+    df['duplicate_of'] = duplicate_of
+
+    logger.info(f"Found {int(is_duplicate.sum())} duplicate articles in {len(df)} "
+                f"({is_duplicate.mean() if len(df) else 0:.1%})")
+    return df
+
+def is_canonical(df):
+    """Boolean mask of the articles that are not a duplicate of another"""
+    return df['duplicate_of'].isna().to_numpy()
+
+def canonical_positions(df):
+    """Row position of each article's canonical copy (its own position for canonical articles)"""
+    positions = pd.Series(np.arange(len(df)), index=df['id'].astype(str))
+    positions = positions[~positions.index.duplicated()]
+    canonical = df['duplicate_of'].astype(str).map(positions)
+    own = np.arange(len(df))
+    return np.where(canonical.isna(), own, canonical.fillna(-1).to_numpy(dtype=int))
+
+def propagate_duplicates(df, embeddings=None, columns=('predicted_category', 'similarity', 'cluster')):
+    """Copy the results computed for canonical articles to their duplicates
+
+    Args:
+        df: DataFrame with a 'duplicate_of' column
+        embeddings: Optional embedding matrix aligned with df; duplicate rows are overwritten in place
+        columns: Columns to copy from the canonical article
+
+    Returns:
+        DataFrame: Copy of df with the columns filled for duplicates
+    """
+    positions = canonical_positions(df)
+    df = df.copy()
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].iloc[positions].to_numpy()
+    if embeddings is not None:
+        duplicates = positions != np.arange(len(df))
+        embeddings[duplicates] = embeddings[positions[duplicates]]
+    return df
@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import atexit
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from loguru import logger
+from chromadb.api.types import EmbeddingFunction
+from langchain_core.embeddings import Embeddings
+from config import Config
+from .embedding_matrix import as_matrix, embed_matrix
+from .metrics import inc
+
+class EmbeddingCache:
+    """Content-addressed, memory-mapped cache of embedding vectors for one model
+
+    Vectors live in a float32 matrix file (`vectors.f32`) that is memory-mapped,
+    with a JSON key index (`index.json`) mapping each key to its row. The index is
+    kept in least-recently-used order: when the cache is full the oldest entry's
+    row is reused. A small in-memory LRU tier sits in front of the memmap.
+    """
+
+    def __init__(self, model_name, cache_dir=Config.EMBEDDING_CACHE_DIR,
+                 max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES,
+                 memory_entries=Config.EMBEDDING_CACHE_MEMORY_ENTRIES, persistent=True):
+        self.model_name = model_name
+        self.persistent = persistent
+        self.cache_dir = Path(cache_dir) / re.sub(r'[^A-Za-z0-9._-]', '_', model_name)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.index_path = self.cache_dir / "index.json"
+        self.vectors_path = self.cache_dir / "vectors.f32"
+
+        self.hits = 0
+        self.misses = 0
+        self.dim = None
+        self._unflushed = 0
+        self._slots = OrderedDict()
+        self._memory = OrderedDict()
+        self._vectors = None
+        self._lock = threading.RLock()
+        if persistent:
+            self._load()
+
+    def make_key(self, text):
+        """Hash the model name and text into a cache key"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """Load the key index and map the vector file if they exist"""
+        if not self.index_path.exists() or not self.vectors_path.exists():
+            return
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get("capacity") != self.max_entries:
+                logger.info(f"Embedding cache capacity changed, discarding {self.cache_dir}")
+                return
+            self.dim = index["dim"]
+            self._slots = OrderedDict(index["slots"])
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(self.max_entries, self.dim))
+            logger.info(f"Loaded embedding cache with {len(self._slots)} entries from {self.cache_dir}")
+        except Exception as e:
+            logger.warning(f"Could not load embedding cache from {self.cache_dir}: {str(e)}")
+            self.dim = None
+            self._slots = OrderedDict()
+            self._vectors = None
+
+    def _open_vectors(self, dim):
+        """Create the memory-mapped vector file for vectors of size `dim`"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.dim = dim
+        self._slots = OrderedDict()
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="w+",
+                                  shape=(self.max_entries, dim))
+
+    def _remember(self, key, vector):
+        """Put a vector into the in-memory LRU tier"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remember_many(self, entries):
+        """Put copies of the vectors that fit into the in-memory LRU tier
+
+        Rows of a large batch are copied so the tier does not keep the whole batch alive.
+        """
+        for key, vector in entries[-self.memory_entries:] if self.memory_entries else []:
+            self._remember(key, np.array(vector))
+
+    def get(self, text):
+        """Look up a single text
+
+        Returns:
+            np.ndarray or None: The cached vector, or None on a miss
+        """
+        key = self.make_key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                if key in self._slots:
+                    self._slots.move_to_end(key)
+                self.hits += 1
+                return vector
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            vector = np.array(self._vectors[slot])
+            self._remember(key, vector)
+            self.hits += 1
+            return vector
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts, evicting least recently used entries when full"""
+        vectors = as_matrix(vectors)
+        if len(texts) == 0:
+            return
+        entries = OrderedDict((self.make_key(text), vector) for text, vector in zip(texts, vectors))
+        entries = list(entries.items())[-self.max_entries:]
+        with self._lock:
+            if not self.persistent:
+                self._remember_many(entries)
+                return
+            
+            if self._vectors is None or vectors.shape[1] != self.dim:
+                self._open_vectors(vectors.shape[1])
+            
+            fresh = []
+            for key, _ in entries:
+                if key in self._slots:
+                    self._slots.move_to_end(key)
+                else:
+                    fresh.append(key)
+            
+            # Reuse the rows of the least recently used entries once the matrix is full
+            free_slots = list(range(len(self._slots), self.max_entries))[:len(fresh)]
+            evicted = []
+            while len(free_slots) + len(evicted) < len(fresh):
+                evicted.append(self._slots.popitem(last=False)[1])
+            
+            # Drop evicted keys from the on-disk index before their rows are overwritten
+            if evicted:
+                self._write_index()
+            
+            for key, slot in zip(fresh, free_slots + evicted):
+                self._slots[key] = slot
+            for key, vector in entries:
+                self._vectors[self._slots[key]] = vector
+            self._remember_many(entries)
+            
+            self._unflushed += len(fresh)
+            if self._unflushed >= Config.EMBEDDING_CACHE_FLUSH_EVERY:
+                self.flush()
+
+    def get_or_compute(self, texts, compute_fn):
+        """Return embeddings for texts, computing only the ones not in the cache
+
+        Args:
+            texts: List of text strings
+            compute_fn: Callable that embeds a list of texts
+
+        Returns:
+            np.ndarray: float32 matrix with one row per text
+        """
+        found = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+        misses = sum(v is None for v in found)
+        inc("rag_embedding_cache_lookups_total", len(texts) - misses, result="hit")
+        inc("rag_embedding_cache_lookups_total", misses, result="miss")
+        computed = None
+        if missing:
+            computed = as_matrix(compute_fn(missing))
+            self.put_many(missing, computed)
+            # Every text was computed, once and in order
+            if len(missing) == len(texts):
+                return computed
+            position = {text: i for i, text in enumerate(missing)}
+        if not found:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+
+        dim = computed.shape[1] if computed is not None else len(next(v for v in found if v is not None))
+        matrix = np.empty((len(texts), dim), dtype=np.float32)
+        for i, (text, vector) in enumerate(zip(texts, found)):
+            matrix[i] = vector if vector is not None else computed[position[text]]
+        return matrix
+
+    def _write_index(self):
+        """Atomically replace the key index file"""
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "capacity": self.max_entries,
+                       "slots": list(self._slots.items())}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def flush(self):
+        """Write the vector file and the key index to disk"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._vectors.flush()
+            self._write_index()
+            self._unflushed = 0
+
+    def stats(self):
+        """Return cache statistics including the hit rate"""
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self._slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+_caches = {}
+_caches_lock = threading.Lock()
+_persistent = True
+
+def get_embedding_cache(model_name=Config.EMBEDDING_MODEL):
+    """Get the process-wide embedding cache for a model"""
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name, persistent=_persistent)
+        return _caches[model_name]
+
+def use_memory_caches():
+    """Keep embedding caches opened from now on in memory only
+
+    The on-disk cache has a single writer; gunicorn request workers call this
+    after forking so only the pipeline process reads and writes the files.
+    """
+    global _persistent
+    _persistent = False
+
+@atexit.register
+def flush_caches():
+    """Persist every embedding cache opened by this process"""
+    for cache in list(_caches.values()):
+        try:
+            cache.flush()
+        except Exception as e:
+            logger.warning(f"Failed to flush embedding cache {cache.model_name}: {str(e)}")
+
+def log_cache_stats():
+    """Log the hit rate of every embedding cache used by this process"""
+    for cache in list(_caches.values()):
+        stats = cache.stats()
+        logger.info(f"Embedding cache {stats['model']}: {stats['hits']} hits, "
+                    f"{stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+                    f"{stats['entries']} entries")
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that serves repeated texts from the embedding cache"""
+
+    def __init__(self, embeddings, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", Config.EMBEDDING_MODEL)
+        self.cache = get_embedding_cache(self.model_name)
+
+    def embed_documents(self, texts):
+        return self.embed_matrix(texts).tolist()
+
+    def embed_matrix(self, texts):
+        return self.cache.get_or_compute(texts, lambda missing: embed_matrix(self.embeddings, missing))
+
+    async def aembed_matrix(self, texts):
+        return await asyncio.to_thread(self.embed_matrix, texts)
+
+    def embed_query(self, text):
+        vectors = self.cache.get_or_compute([text], lambda t: [self.embeddings.embed_query(t[0])])
+        return vectors[0].tolist()
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """ChromaDB embedding function wrapper backed by the embedding cache
+
+    Name and config are delegated to the wrapped function so existing
+    collections keep validating against their stored embedding function.
+    """
+
+    def __init__(self, embedding_function, model_name=None):
+        self.embedding_function = embedding_function
+        self.model_name = model_name or getattr(embedding_function, "model_name", Config.EMBEDDING_MODEL)
+        self.cache = get_embedding_cache(self.model_name)
+
+    def __call__(self, input):
+        return list(self.cache.get_or_compute(list(input), self.embedding_function))
+
+    def name(self):
+        return self.embedding_function.name()
+
+    def get_config(self):
+        return self.embedding_function.get_config()
+
+    @staticmethod
+    def build_from_config(config):
+        if "provider" in config:
+            from .embedding_providers import ProviderEmbeddingFunction
+            return CachedEmbeddingFunction(ProviderEmbeddingFunction.build_from_config(config))
+        from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+        return CachedEmbeddingFunction(OpenAIEmbeddingFunction.build_from_config(config))
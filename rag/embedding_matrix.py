@@ -0,0 +1,94 @@
+import numpy as np
+from config import Config
+
+# Storage types for saved embeddings, selected by Config.EMBEDDING_STORAGE_DTYPE
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows converted to int8 at a time, bounding the float32 temporaries
+ENCODE_BATCH_SIZE = 8192
+
+def as_matrix(vectors, dim=0):
+    """C-contiguous float32 matrix of vectors, without a copy when they already are one
+
+    Args:
+        vectors: Matrix, memory-mapped matrix or list of vectors
+        dim: Number of columns of the empty matrix returned for no vectors
+
+    Returns:
+        np.ndarray: float32 matrix with one row per vector
+    """
+    if len(vectors) == 0:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+def normalize_rows(matrix):
+    """Scale the rows of a float32 matrix to unit L2 norm in place; zero rows are left as they are
+
+    Returns:
+        np.ndarray: matrix
+    """
+    if len(matrix):
+        norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+        matrix /= np.maximum(norms, 1e-12)[:, None]
+    return matrix
+
+def encode_embeddings(matrix, dtype=None):
+    """Convert embeddings to the storage type
+
+    int8 rows are scaled so their largest component is 127. The scale is not
+    kept: stored embeddings are only compared by cosine similarity, or decoded
+    back to unit length with `decode_embeddings`.
+
+    Args:
+        matrix: Embedding matrix
+        dtype: "float32", "float16" or "int8" (if None, use Config.EMBEDDING_STORAGE_DTYPE)
+
+    Returns:
+        np.ndarray: Matrix of the storage type
+    """
+    dtype = dtype or Config.EMBEDDING_STORAGE_DTYPE
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown embedding storage type: {dtype}")
+    if dtype == "float32":
+        return as_matrix(matrix)
+    if dtype == "float16":
+        return np.asarray(matrix, dtype=np.float16)
+
+    encoded = np.empty(np.shape(matrix), dtype=np.int8)
+    for start in range(0, len(encoded), ENCODE_BATCH_SIZE):
+        batch = np.asarray(matrix[start:start + ENCODE_BATCH_SIZE], dtype=np.float32)
+        scale = 127.0 / np.maximum(np.abs(batch).max(axis=1), 1e-12)
+        encoded[start:start + ENCODE_BATCH_SIZE] = np.rint(batch * scale[:, None])
+    return encoded
+
+def decode_embeddings(stored):
+    """float32 embeddings from stored ones; float16 and int8 rows are scaled back to unit length"""
+    if stored.dtype == np.float32:
+        return as_matrix(stored)
+    return normalize_rows(np.asarray(stored, dtype=np.float32))
+
+def embed_matrix(embeddings, texts):
+    """Embed texts into a float32 matrix
+
+    LangChain embeddings return lists of Python floats. The local providers,
+    the embedding cache and the metering wrapper have an `embed_matrix` method
+    that hands the matrix over without the round trip through lists.
+
+    Args:
+        embeddings: LangChain embeddings
+        texts: List of text strings
+
+    Returns:
+        np.ndarray: float32 matrix with one row per text
+    """
+    embed = getattr(embeddings, "embed_matrix", None)
+    if embed is not None:
+        return embed(texts)
+    return as_matrix(embeddings.embed_documents(texts))
+
+async def aembed_matrix(embeddings, texts):
+    """Async `embed_matrix`"""
+    embed = getattr(embeddings, "aembed_matrix", None)
+    if embed is not None:
+        return await embed(texts)
+    return as_matrix(await embeddings.aembed_documents(texts))
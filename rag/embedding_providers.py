@@ -0,0 +1,210 @@
+import os
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from config import Config
+from .embedding_matrix import as_matrix
+
+def length_buckets(lengths, batch_tokens, max_batch_size=256):
+    """Group sequences of similar length so batches are padded as little as possible
+
+    Sequences are sorted by length and cut into consecutive batches whose
+    padded size (batch size x longest sequence) stays within batch_tokens.
+
+    Args:
+        lengths: Token count of each sequence
+        batch_tokens: Maximum number of padded tokens per batch
+        max_batch_size: Maximum number of sequences per batch
+
+    Returns:
+        list: Arrays of sequence positions, one per batch
+    """
+    order = np.argsort(lengths, kind='stable')
+    batches, start = [], 0
+    for end in range(1, len(order) + 1):
+        longest = lengths[order[end - 1]]
+        if end - start > 1 and ((end - start) * longest > batch_tokens or end - start > max_batch_size):
+            batches.append(order[start:end - 1])
+            start = end - 1
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+class EmbeddingProvider:
+    """Base class for embedding backends
+
+    Subclasses implement `embed`, returning a float32 matrix with one row per
+    text, and set `name` to a value identifying the model in the embedding cache.
+    `get_provider` sets `key` to the PROVIDERS entry the instance was created from.
+    """
+
+    name = None
+    key = None
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """Sentence-transformer exported to ONNX, run on the CPU
+
+    Texts are tokenised in one call, grouped into length buckets and run as
+    batches on a thread pool. Each ONNX Runtime session call uses a single
+    thread, so throughput scales with the number of pool threads. Token
+    embeddings are mean-pooled over the attention mask and L2-normalised,
+    unless the model already outputs a `sentence_embedding`.
+
+    Preparing the model (once, on a machine with network access):
+
+        optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 models/all-MiniLM-L6-v2
+        python -m rag.embedding_providers quantize models/all-MiniLM-L6-v2/model.onnx models/all-MiniLM-L6-v2/model.int8.onnx
+    """
+
+    def __init__(self, model_path=Config.LOCAL_EMBEDDING_MODEL_PATH,
+                 tokenizer_path=Config.LOCAL_EMBEDDING_TOKENIZER_PATH,
+                 max_length=Config.LOCAL_EMBEDDING_MAX_LENGTH,
+                 batch_tokens=Config.LOCAL_EMBEDDING_BATCH_TOKENS,
+                 threads=Config.LOCAL_EMBEDDING_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("The onnx embedding provider requires the onnxruntime and tokenizers packages") from e
+
+        self.name = f"onnx:{Config.LOCAL_EMBEDDING_MODEL}"
+        self.batch_tokens = batch_tokens
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.pad_id = 0 if pad_id is None else pad_id
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        output_names = [o.name for o in self.session.get_outputs()]
+        self.output_name = "sentence_embedding" if "sentence_embedding" in output_names else output_names[0]
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="onnx-embed")
+        logger.info(f"Loaded local embedding model {model_path} with {threads} threads")
+
+    def _run_batch(self, encodings):
+        """Embed one length bucket"""
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.full((len(encodings), width), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for i, encoding in enumerate(encodings):
+            input_ids[i, :len(encoding.ids)] = encoding.ids
+            attention_mask[i, :len(encoding.ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        output = self.session.run([self.output_name], feeds)[0].astype(np.float32)
+
+        if output.ndim == 3:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return output / np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+
+    def embed(self, texts):
+        """Embed texts
+
+        Returns:
+            np.ndarray: float32 matrix of unit vectors, in input order
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch([str(text) for text in texts])
+        lengths = np.array([len(e.ids) for e in encodings])
+        batches = length_buckets(lengths, self.batch_tokens)
+
+        results = self.pool.map(lambda batch: self._run_batch([encodings[i] for i in batch]), batches)
+        embeddings = None
+        for batch, vectors in zip(batches, results):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[batch] = vectors
+        return embeddings
+
+PROVIDERS = {
+    "onnx": OnnxEmbeddingProvider
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_provider(name=None):
+    """Get the process-wide instance of a local embedding provider
+
+    Args:
+        name: Provider name (if None, use Config.EMBEDDING_PROVIDER)
+    """
+    name = name or Config.EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown local embedding provider: {name}")
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name]()
+            _providers[name].key = name
+        return _providers[name]
+
+class ProviderEmbeddings(Embeddings):
+    """LangChain embeddings backed by a local provider"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.model = provider.name
+
+    def embed_documents(self, texts):
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text):
+        return self.provider.embed([text])[0].tolist()
+
+    def embed_matrix(self, texts):
+        return as_matrix(self.provider.embed(list(texts)))
+
+    async def aembed_matrix(self, texts):
+        return await asyncio.to_thread(self.embed_matrix, texts)
+
+class ProviderEmbeddingFunction(EmbeddingFunction):
+    """ChromaDB embedding function backed by a local provider"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.model_name = provider.name
+
+    def __call__(self, input):
+        return list(self.provider.embed(list(input)))
+
+    @staticmethod
+    def name():
+        return "local_provider"
+
+    def get_config(self):
+        return {"provider": self.provider.key, "model": self.model_name}
+
+    @staticmethod
+    def build_from_config(config):
+        return ProviderEmbeddingFunction(get_provider(config.get("provider")))
+
+def quantize_model(model_path, output_path):
+    """Quantise an ONNX model's weights to int8 with dynamic quantisation"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(model_path), str(output_path), weight_type=QuantType.QInt8)
+    logger.info(f"Saved int8 model to {output_path} "
+                f"({os.path.getsize(model_path) / 1e6:.1f} MB -> {os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "quantize":
+        sys.exit("Usage: python -m rag.embedding_providers quantize <model.onnx> <model.int8.onnx>")
+    quantize_model(sys.argv[2], sys.argv[3])
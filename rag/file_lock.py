@@ -0,0 +1,51 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class FileLock:
+    """Exclusive, re-entrant lock shared by all processes through an advisory lock on a file
+
+    Instances for the same path share one thread lock and one descriptor, so
+    threads of a process queue on the thread lock and only the outermost
+    acquisition takes the file lock. Without fcntl (Windows) only the thread
+    lock is taken.
+    """
+
+    _states = {}
+    _states_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with FileLock._states_lock:
+            self._state = FileLock._states.setdefault(self.path, {"lock": threading.RLock(), "depth": 0, "file": None})
+
+    def __enter__(self):
+        state = self._state
+        state["lock"].acquire()
+        if state["depth"] == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                state["file"] = open(self.path, "a+")
+                fcntl.flock(state["file"].fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if state["file"] is not None:
+                    state["file"].close()
+                    state["file"] = None
+                state["lock"].release()
+                raise
+        state["depth"] += 1
+        return self
+
+    def __exit__(self, *exc):
+        state = self._state
+        state["depth"] -= 1
+        if state["depth"] == 0 and state["file"] is not None:
+            fcntl.flock(state["file"].fileno(), fcntl.LOCK_UN)
+            state["file"].close()
+            state["file"] = None
+        state["lock"].release()
+        return False
@@ -1,38 +1,52 @@
-import re
+import numpy as np
 import pandas as pd
 from loguru import logger
 from config import Config
+from .keyword_matcher import KeywordMatcher
 
 class HighlightExtractor:
     """Extract important news highlights based on priority keywords and clustering"""
     
     def __init__(self, priority_keywords=Config.PRIORITY_KEYWORDS):
         self.priority_keywords = priority_keywords
-        self._compile_patterns()
+        self.matcher = KeywordMatcher(priority_keywords)
     
-    def _compile_patterns(self):
-        """Compile regex patterns for each category's priority keywords"""
-        self.keyword_patterns = {}
-        for cat, keywords in self.priority_keywords.items():
-            pattern = r'\b(' + '|'.join(map(re.escape, keywords)) + r')\b'
-            self.keyword_patterns[cat] = re.compile(pattern)
-    
-    def _is_priority(self, row):
-        """Check if an article is a priority based on keywords in title
+    def score_keywords(self, df):
+        """Match the priority keywords of all categories against titles and summaries
         
         Args:
-            row: DataFrame row with 'title_lc' and 'predicted_category'
+            df: DataFrame with 'Title', 'news_summary' and 'predicted_category' columns
             
         Returns:
-            bool: True if article contains priority keywords
+            DataFrame: Copy of df with 'is_priority' (title hit for the article's own category),
+                'keyword_hits' (own-category hits in title and summary), 'keyword_score'
+                (hits weighted by field), 'keyword_category' (category with the most weighted hits)
+                and 'matched_keywords' (all matched keywords, '; '-separated) columns
         """
-        category = row['predicted_category']
-        title = row['title_lc']
+        df = df.copy()
+        titles = df['Title'].fillna('').astype(str).tolist()
+        if 'news_summary' in df.columns:
+            summaries = df['news_summary'].fillna('').astype(str).replace('nil', '').tolist()
+        else:
+            summaries = [''] * len(df)
+        
+        title_matches = self.matcher.match(titles)
+        summary_matches = self.matcher.match(summaries)
+        categories = df['predicted_category'].tolist()
+        title_hits = title_matches.category_hits(categories)
+        summary_hits = summary_matches.category_hits(categories)
+        
+        weighted = title_matches.hits + Config.HIGHLIGHT_SUMMARY_WEIGHT * summary_matches.hits
+        best = weighted.argmax(axis=1) if weighted.size else np.zeros(len(df), dtype=int)
+        has_hits = weighted.max(axis=1) > 0 if weighted.size else np.zeros(len(df), dtype=bool)
         
-        pattern = self.keyword_patterns.get(category)
-        if pattern:
-            return bool(pattern.search(title))
-        return False
+        df['is_priority'] = title_hits > 0
+        df['keyword_hits'] = title_hits + summary_hits
+        df['keyword_score'] = title_hits + Config.HIGHLIGHT_SUMMARY_WEIGHT * summary_hits
+        df['keyword_category'] = np.where(has_hits, np.asarray(self.matcher.categories + [''])[best], '')
+        df['matched_keywords'] = ['; '.join(dict.fromkeys(t + s))
+                                  for t, s in zip(title_matches.keywords, summary_matches.keywords)]
+        return df
     
     def extract_highlights(self, df, highlights_per_category=Config.HIGHLIGHTS_PER_CATEGORY):
         """Extract top highlights for each category
@@ -46,14 +60,17 @@ class HighlightExtractor:
         """
         df = df.copy()
         
-        # Lower-case titles for keyword matching
+        # Lower-case titles, kept in the output for compatibility
         df['title_lc'] = df['Title'].str.lower()
         
-        # Flag priority articles
-        df['is_priority'] = df.apply(self._is_priority, axis=1)
+        # Match priority keywords in one pass over titles and summaries
+        df = self.score_keywords(df)
         
-        # Compute highlight score: keyword hits get highest priority, then cluster size
-        df['highlight_score'] = df['is_priority'].astype(int) * 1000 + df['cluster_size']
+        # Compute highlight score: a title keyword hit gets highest priority, then weighted
+        # keyword hits, then cluster size
+        df['highlight_score'] = (df['is_priority'].astype(int) * Config.HIGHLIGHT_PRIORITY_WEIGHT
+                                 + df['keyword_score'] * Config.HIGHLIGHT_KEYWORD_WEIGHT
+                                 + df['cluster_size'])
         
         # Extract top highlights per category
         highlights = (
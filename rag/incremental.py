@@ -0,0 +1,171 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from loguru import logger
+from config import Config
+from .embedding_matrix import as_matrix, encode_embeddings, decode_embeddings
+
+# Columns computed by the classification and clustering stages
+DERIVED_COLUMNS = ['predicted_category', 'similarity', 'cluster']
+
+# Key of the vector store entries the state was saved against; states keyed otherwise need a full run
+VECTOR_STORE_KEY = "fingerprint"
+
+def fingerprint_articles(df):
+    """Fingerprint each article by its Link, Title and summary
+
+    Args:
+        df: DataFrame with articles
+
+    Returns:
+        pd.Series: Hex digest per row
+    """
+    parts = [df[col].fillna('').astype(str) if col in df.columns else pd.Series('', index=df.index)
+             for col in ('Link', 'Title', 'news_summary')]
+    joined = parts[0] + '\x1f' + parts[1] + '\x1f' + parts[2]
+    return joined.map(lambda s: hashlib.sha1(s.encode('utf-8')).hexdigest())
+
+class PipelineState:
+    """State of the previous pipeline run, persisted between incremental runs
+
+    Holds the processed articles (with their fingerprints), their embeddings,
+    the fitted clustering model and drift bookkeeping since the last full refit.
+    """
+
+    def __init__(self, state_dir=Config.PIPELINE_STATE_DIR):
+        self.state_dir = Path(state_dir)
+        self.articles = None
+        self.embeddings = None
+        self.clustering = None
+        self.fitted_rows = 0
+        self.changed_since_fit = 0
+
+    @property
+    def exists(self):
+        return self.articles is not None and self.clustering is not None
+
+    def load(self):
+        """Load the state from disk if a previous run saved one
+
+        Returns:
+            PipelineState: self
+        """
+        try:
+            with open(self.state_dir / "meta.json") as f:
+                meta = json.load(f)
+            if meta.get("vector_store_key") != VECTOR_STORE_KEY:
+                logger.info(f"Pipeline state in {self.state_dir} predates {VECTOR_STORE_KEY}-keyed vector store "
+                            f"entries, a full run is required")
+                return self
+            self.articles = pd.read_pickle(self.state_dir / "articles.pkl")
+            self.embeddings = decode_embeddings(np.load(self.state_dir / "embeddings.npy"))
+            with open(self.state_dir / "clustering.pkl", "rb") as f:
+                self.clustering = pickle.load(f)
+            self.fitted_rows = meta["fitted_rows"]
+            self.changed_since_fit = meta["changed_since_fit"]
+            logger.info(f"Loaded pipeline state with {len(self.articles)} articles from {self.state_dir}")
+        except FileNotFoundError:
+            logger.info(f"No pipeline state found in {self.state_dir}, a full run is required")
+        except Exception as e:
+            logger.warning(f"Could not load pipeline state from {self.state_dir}: {str(e)}")
+            self.articles = None
+            self.clustering = None
+        return self
+
+    def save(self, articles, embeddings, clustering):
+        """Persist the state of the current run"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.articles = articles
+        self.embeddings = as_matrix(embeddings)
+        self.clustering = clustering
+
+        articles.to_pickle(self.state_dir / "articles.pkl")
+        np.save(self.state_dir / "embeddings.npy", encode_embeddings(self.embeddings))
+        with open(self.state_dir / "clustering.pkl", "wb") as f:
+            pickle.dump(clustering, f)
+        with open(self.state_dir / "meta.json", "w") as f:
+            json.dump({
+                "fitted_rows": self.fitted_rows,
+                "changed_since_fit": self.changed_since_fit,
+                "vector_store_key": VECTOR_STORE_KEY
+            }, f)
+        logger.info(f"Saved pipeline state with {len(articles)} articles to {self.state_dir}")
+
+    def clear(self):
+        """Remove the saved state so the next incremental run is a full one"""
+        # meta.json goes first: without it the rest is never loaded
+        for name in ("meta.json", "articles.pkl", "embeddings.npy", "clustering.pkl"):
+            try:
+                os.remove(self.state_dir / name)
+            except FileNotFoundError:
+                pass
+        self.articles = None
+        self.embeddings = None
+        self.clustering = None
+        logger.info(f"Cleared pipeline state in {self.state_dir}")
+
+    def drift(self, n_changed):
+        """Fraction of the corpus changed since the clustering model was last fitted"""
+        if not self.fitted_rows:
+            return 1.0
+        return (self.changed_since_fit + n_changed) / self.fitted_rows
+
+def reuse_previous_results(df, state):
+    """Copy classification, clustering and embeddings from the previous run
+
+    Args:
+        df: Prepared DataFrame with a 'fingerprint' column
+        state: Loaded PipelineState
+
+    Returns:
+        tuple: (df with derived columns filled for known articles,
+                boolean mask of rows that are new or changed,
+                embeddings matrix with rows filled for known articles)
+    """
+    previous = state.articles.reset_index(drop=True)
+    previous['_row'] = np.arange(len(previous))
+    previous = previous.drop_duplicates('fingerprint').set_index('fingerprint')
+
+    rows = df['fingerprint'].map(previous['_row'])
+    is_new = rows.isna().to_numpy()
+    known_rows = rows[~is_new].astype(int).to_numpy()
+
+    df = df.copy()
+    for col in DERIVED_COLUMNS:
+        df[col] = df['fingerprint'].map(previous[col])
+
+    embeddings = np.zeros((len(df), state.embeddings.shape[1]), dtype=np.float32)
+    embeddings[~is_new] = state.embeddings[known_rows]
+
+    return df, is_new, embeddings
+
+def vector_store_delta(df, previous):
+    """Work out which vector store entries need an upsert or a delete
+    
+    Entries are keyed on the article fingerprint, so rows that only moved in
+    the news CSV are left alone. An article is upserted when its fingerprint
+    is new or its category or cluster changed since the previous run; exact
+    copies share the entry of their first copy. Fingerprints that disappeared
+    are deleted.
+    
+    Args:
+        df: Processed DataFrame of the current run
+        previous: Processed DataFrame of the previous run
+        
+    Returns:
+        tuple: (boolean mask of rows in df to upsert, list of fingerprints to delete)
+    """
+    fingerprints = df['fingerprint']
+    previous = previous.drop_duplicates('fingerprint').set_index('fingerprint')
+    
+    changed = ~fingerprints.isin(previous.index).to_numpy()
+    for col in ('predicted_category', 'cluster'):
+        changed |= df[col].astype(str).to_numpy() != fingerprints.map(previous[col].astype(str)).to_numpy()
+    changed &= ~fingerprints.duplicated().to_numpy()
+    
+    removed = sorted(set(previous.index) - set(fingerprints))
+    return changed, removed
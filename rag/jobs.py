@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import threading
+from loguru import logger
+from config import Config
+from .file_lock import FileLock
+
+class Job:
+    """One requested run of the news processing pipeline"""
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = "queued"
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def start_stage(self, name):
+        """Mark the current stage done and start timing the next one"""
+        now = time.time()
+        self._finish_stage(now)
+        self.stages.append({"name": name, "status": "running", "started_at": now, "duration": None})
+
+    def _finish_stage(self, now, status="succeeded"):
+        if self.stages and self.stages[-1]["status"] == "running":
+            stage = self.stages[-1]
+            stage["status"] = status
+            stage["duration"] = round(now - stage["started_at"], 3)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a job from its `to_dict` representation"""
+        job = cls(data["params"])
+        job.id = data["job_id"]
+        job.status = data["status"]
+        job.stages = data["stages"]
+        job.result = data["result"]
+        job.error = data["error"]
+        job.created_at = data["created_at"]
+        job.started_at = data["started_at"]
+        job.finished_at = data["finished_at"]
+        return job
+
+    def to_dict(self):
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "stage": self.stages[-1]["name"] if self.stages else None,
+            "stages": [dict(stage) for stage in self.stages],
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": duration
+        }
+
+class JobManager:
+    """Queue of pipeline runs executed one at a time by a single worker thread
+
+    Submitting the same parameters while an identical job is still queued or
+    running returns that job instead of enqueueing a duplicate. Readers keep
+    being served from the last completed run because the pipeline only swaps
+    in new results once it finishes.
+    """
+
+    def __init__(self, run_fn, max_history=100):
+        self.run_fn = run_fn
+        self.max_history = max_history
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run_forever, name="pipeline-worker", daemon=True)
+            self._worker.start()
+
+    def submit(self, params):
+        """Enqueue a pipeline run
+
+        Args:
+            params: Keyword arguments for the run function
+
+        Returns:
+            tuple: (Job, coalesced) where coalesced is True if an identical active job was reused
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active and job.params == params:
+                    logger.info(f"Coalescing pipeline request into active job {job.id}")
+                    return job, True
+
+            job = Job(params)
+            self._jobs[job.id] = job
+            self._prune()
+            self._ensure_worker()
+        self._queue.put(job)
+        logger.info(f"Queued pipeline job {job.id}")
+        return job, False
+
+    def get(self, job_id):
+        """Look up a job by id (None if unknown)"""
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond `max_history`"""
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(len(self._jobs) - self.max_history, 0)]:
+            del self._jobs[job.id]
+
+    def _run_forever(self):
+        while True:
+            job = self._queue.get()
+            self._run(job)
+            self._queue.task_done()
+
+    def _update(self, job):
+        """Called whenever a job changes status or stage"""
+
+    def _run(self, job):
+        def progress(stage):
+            job.start_stage(stage)
+            self._update(job)
+
+        job.status = "running"
+        job.started_at = time.time()
+        self._update(job)
+        logger.info(f"Running pipeline job {job.id}")
+        try:
+            job.result = self.run_fn(progress=progress, **job.params)
+            job._finish_stage(time.time())
+            job.status = "succeeded"
+            logger.info(f"Pipeline job {job.id} finished in {time.time() - job.started_at:.2f}s")
+        except Exception as e:
+            job._finish_stage(time.time(), status="failed")
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Pipeline job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            self._update(job)
+
+class FileJobManager(JobManager):
+    """Queue of pipeline runs shared by processes, one JSON file per job
+
+    The gunicorn request workers submit jobs and read their status from
+    `jobs_dir`; the pipeline process runs them one at a time in submission
+    order with `serve_forever`. Identical active jobs are coalesced across
+    all processes.
+    """
+
+    def __init__(self, run_fn=None, jobs_dir=None, max_history=100, poll_interval=Config.JOB_POLL_INTERVAL):
+        super().__init__(run_fn, max_history)
+        self.jobs_dir = jobs_dir or Config.JOBS_DIR
+        self.poll_interval = poll_interval
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(self.jobs_dir, ".lock"))
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _update(self, job):
+        """Write the job's file atomically"""
+        tmp_path = f"{self._path(job.id)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, self._path(job.id))
+
+    def _load_jobs(self):
+        """All jobs on disk, oldest first"""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith(".json"):
+                job = self.get(name[:-len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda j: j.created_at)
+
+    def submit(self, params):
+        """Enqueue a pipeline run for the pipeline process
+
+        Returns:
+            tuple: (Job, coalesced) where coalesced is True if an identical active job was reused
+        """
+        with self._file_lock:
+            jobs = self._load_jobs()
+            for job in jobs:
+                if job.active and job.params == params:
+                    logger.info(f"Coalescing pipeline request into active job {job.id}")
+                    return job, True
+
+            job = Job(params)
+            self._update(job)
+            finished = [j for j in jobs if not j.active]
+            for old in finished[:max(len(jobs) + 1 - self.max_history, 0)]:
+                os.remove(self._path(old.id))
+        logger.info(f"Queued pipeline job {job.id}")
+        return job, False
+
+    def get(self, job_id):
+        """Look up a job by id (None if unknown)"""
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return Job.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def serve_forever(self):
+        """Run queued jobs as they arrive; jobs left running by a previous process are marked failed"""
+        with self._file_lock:
+            for job in self._load_jobs():
+                if job.status == "running":
+                    job._finish_stage(time.time(), status="failed")
+                    job.status = "failed"
+                    job.error = "Interrupted by a restart of the pipeline process"
+                    job.finished_at = time.time()
+                    self._update(job)
+
+        while True:
+            with self._file_lock:
+                job = next((j for j in self._load_jobs() if j.status == "queued"), None)
+                if job is not None:
+                    job.status = "running"
+                    self._update(job)
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            self._run(job)
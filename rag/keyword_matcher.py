@@ -0,0 +1,116 @@
+from collections import deque
+import numpy as np
+from .search_index import tokenize
+
+class KeywordMatches:
+    """Keyword hits for a batch of texts
+
+    Attributes:
+        categories: Category names, in column order of `hits`
+        hits: int32 matrix with the number of keyword occurrences per text and category
+        keywords: List with the distinct matched keywords of each text, in order of first occurrence
+    """
+
+    def __init__(self, categories, hits, keywords):
+        self.categories = categories
+        self.hits = hits
+        self.keywords = keywords
+
+    def category_hits(self, categories):
+        """Hits of each text for its own category (0 for categories without keywords)"""
+        columns = {category: i for i, category in enumerate(self.categories)}
+        index = np.array([columns.get(category, -1) for category in categories], dtype=int)
+        padded = np.hstack([self.hits, np.zeros((len(self.hits), 1), dtype=self.hits.dtype)])
+        return padded[np.arange(len(index)), index]
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over word tokens for all categories' keywords at once
+
+    Keywords and texts are tokenised the same way as the search index, so
+    keywords only match whole words (like a `\\b` regex) and multi-word
+    keywords match across any whitespace or punctuation. Each text is scanned
+    once regardless of how many keywords there are.
+    """
+
+    def __init__(self, keywords_by_category):
+        self.categories = list(keywords_by_category)
+        self.keywords = []
+        keyword_ids = {}
+        keyword_categories = []
+
+        # Trie of keyword token sequences
+        self._goto = [{}]
+        self._output = [[]]
+        for c, category in enumerate(self.categories):
+            for keyword in keywords_by_category[category]:
+                tokens = tokenize(keyword)
+                if not tokens:
+                    continue
+                key = ' '.join(tokens)
+                if key not in keyword_ids:
+                    keyword_ids[key] = len(self.keywords)
+                    self.keywords.append(key)
+                    keyword_categories.append(set())
+                    node = 0
+                    for token in tokens:
+                        if token not in self._goto[node]:
+                            self._goto[node][token] = len(self._goto)
+                            self._goto.append({})
+                            self._output.append([])
+                        node = self._goto[node][token]
+                    self._output[node].append(keyword_ids[key])
+                keyword_categories[keyword_ids[key]].add(c)
+
+        # Category membership of each keyword as a matrix row
+        self._keyword_categories = np.zeros((len(self.keywords), len(self.categories)), dtype=np.int32)
+        for k, members in enumerate(keyword_categories):
+            self._keyword_categories[k, sorted(members)] = 1
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        """Breadth-first pass linking each node to its longest proper suffix in the trie"""
+        self._fail = [0] * len(self._goto)
+        # Nodes at depth one fail to the root
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """Ids of the keywords occurring in text, one per occurrence"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        found = []
+        for token in tokenize(text):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if output[node]:
+                found.extend(output[node])
+        return found
+
+    def match(self, texts):
+        """Match every text against all keywords
+
+        Args:
+            texts: Iterable of strings
+
+        Returns:
+            KeywordMatches: Per-category hit counts and matched keywords of each text
+        """
+        occurrences = [self.find(text) for text in texts]
+        rows = np.repeat(np.arange(len(occurrences)), [len(found) for found in occurrences])
+        keyword_ids = np.fromiter((k for found in occurrences for k in found), dtype=int, count=len(rows))
+        # Fold each occurrence's category row into its text's counts, so thousands of
+        # keywords cost nothing for texts without hits
+        hits = np.zeros((len(occurrences), len(self.categories)), dtype=np.int32)
+        np.add.at(hits, rows, self._keyword_categories[keyword_ids])
+        keywords = [[self.keywords[k] for k in dict.fromkeys(found)] for found in occurrences]
+        return KeywordMatches(self.categories, hits, keywords)
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from loguru import logger
+from config import Config
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Every metric with its type and help text; recording an unknown name is a bug
+METRICS = {
+    "rag_http_requests_total": ("counter", "HTTP requests by endpoint, method and status"),
+    "rag_http_request_duration_seconds": ("histogram", "HTTP request latency by endpoint and method, streaming included"),
+    "rag_stage_duration_seconds": ("histogram", "Duration of request and pipeline stages"),
+    "rag_pipeline_runs_total": ("counter", "Pipeline runs by outcome"),
+    "rag_embedding_calls_total": ("counter", "Calls to the embedding backend, cache misses only"),
+    "rag_embedding_texts_total": ("counter", "Texts sent to the embedding backend"),
+    "rag_embedding_tokens_total": ("counter", "Tokens sent to the embedding backend"),
+    "rag_embedding_call_duration_seconds": ("histogram", "Latency of calls to the embedding backend"),
+    "rag_embedding_cache_lookups_total": ("counter", "Embedding cache lookups by result"),
+    "rag_answer_cache_lookups_total": ("counter", "Semantic answer cache lookups by result"),
+    "rag_llm_calls_total": ("counter", "Chat model calls by mode"),
+    "rag_llm_prompt_tokens_total": ("counter", "Prompt tokens sent to the chat model"),
+    "rag_llm_completion_tokens_total": ("counter", "Completion tokens received from the chat model"),
+}
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms of one process
+
+    Series are keyed on the metric name and a sorted tuple of label pairs.
+    Under the multi-process server each process writes a snapshot to
+    Config.METRICS_DIR now and then, and /metrics sums the snapshots of all
+    processes, request workers and pipeline process alike.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric {name}")
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram"""
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, the last one for values above every bound, then sum and count
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+            self._dirty = True
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """JSON-serialisable copy of every series"""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()]
+            }
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(Config.METRICS_FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush(force=True)
+
+    def flush(self, force=False):
+        """Write this process's snapshot for the other processes to read
+
+        Unless forced, the write is left to a background thread of the
+        process that writes changes every Config.METRICS_FLUSH_INTERVAL.
+        """
+        if not Config.MULTIPROCESS_SERVING:
+            return
+        if not force:
+            # Threads do not survive a fork, so each process starts its own
+            with self._lock:
+                if self._flusher_pid == os.getpid():
+                    return
+                self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_periodically, name="metrics-flusher", daemon=True).start()
+            return
+        self._dirty = False
+        try:
+            os.makedirs(Config.METRICS_DIR, exist_ok=True)
+            path = os.path.join(Config.METRICS_DIR, f"{os.getpid()}.json")
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {str(e)}")
+
+def _load_snapshots():
+    """Snapshots of every process that has written one"""
+    snapshots = []
+    try:
+        names = [name for name in os.listdir(Config.METRICS_DIR) if name.endswith(".json")]
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        try:
+            with open(os.path.join(Config.METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render(snapshots, buckets=LATENCY_BUCKETS):
+    """Sum snapshots and render them in the Prometheus text exposition format"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+_registry = MetricsRegistry()
+atexit.register(lambda: _registry.flush(force=True))
+
+def get_registry():
+    """Get the registry of this process"""
+    return _registry
+
+def inc(name, amount=1, **labels):
+    """Add to a counter of the process registry"""
+    if Config.METRICS_ENABLED:
+        _registry.inc(name, amount, **labels)
+
+def observe(name, value, **labels):
+    """Record a value in a histogram of the process registry"""
+    if Config.METRICS_ENABLED:
+        _registry.observe(name, value, **labels)
+
+def render_metrics():
+    """Text for the /metrics endpoint, summed over all processes under the multi-process server"""
+    if not Config.MULTIPROCESS_SERVING:
+        return render([_registry.snapshot()])
+    _registry.flush(force=True)
+    return render(_load_snapshots())
+
+def clear_shared_metrics():
+    """Remove the snapshots of a previous server run"""
+    try:
+        names = os.listdir(Config.METRICS_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(Config.METRICS_DIR, name))
+        except OSError:
+            pass
+
+class RequestTrace:
+    """Spans recorded while serving one request, in the order they finished"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.spans = []
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans)
+
+_current_trace = contextvars.ContextVar("rag_request_trace", default=None)
+
+def begin_request():
+    """Start collecting the spans of the request served by the current thread"""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+def end_request(trace, endpoint, method, status):
+    """Record the latency of a finished request"""
+    _current_trace.set(None)
+    inc("rag_http_requests_total", endpoint=endpoint, method=method, status=status)
+    observe("rag_http_request_duration_seconds", time.perf_counter() - trace.started_at,
+            endpoint=endpoint, method=method)
+    _registry.flush()
+
+@contextmanager
+def span(stage):
+    """Time a block as a stage, in the stage histogram and the current request's trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe("rag_stage_duration_seconds", seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, seconds))
+
+class StageTimer:
+    """Progress callback that times consecutive pipeline stages
+
+    Each call ends the running stage, records it in the stage histogram and
+    passes the new stage name on to the wrapped callback.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress or (lambda stage: None)
+        self._stage = None
+        self._started_at = None
+
+    def __call__(self, stage):
+        self.close()
+        self._stage, self._started_at = stage, time.perf_counter()
+        self.progress(stage)
+
+    def close(self):
+        """End the running stage"""
+        if self._stage is not None:
+            observe("rag_stage_duration_seconds", time.perf_counter() - self._started_at, stage=self._stage)
+            self._stage = None
+        _registry.flush()
+
+class MeteredEmbeddings:
+    """Embeddings wrapper counting the calls, texts and tokens that reach the embedding backend
+
+    Sits under the embedding cache, so only cache misses are counted. Other
+    attributes are delegated to the wrapped embeddings.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+    @staticmethod
+    def _record(texts, seconds):
+        from .async_pipeline import _token_counter
+
+        inc("rag_embedding_calls_total")
+        inc("rag_embedding_texts_total", len(texts))
+        count_tokens = _token_counter()
+        inc("rag_embedding_tokens_total", sum(count_tokens(text) for text in texts))
+        observe("rag_embedding_call_duration_seconds", seconds)
+
+    def embed_documents(self, texts):
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self._record(texts, time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self._record([text], time.perf_counter() - start)
+        return vector
+
+    async def aembed_documents(self, texts):
+        start = time.perf_counter()
+        vectors = await self.embeddings.aembed_documents(texts)
+        self._record(texts, time.perf_counter() - start)
+        return vectors
+
+    def embed_matrix(self, texts):
+        from .embedding_matrix import embed_matrix
+
+        start = time.perf_counter()
+        vectors = embed_matrix(self.embeddings, texts)
+        self._record(texts, time.perf_counter() - start)
+        return vectors
+
+    async def aembed_matrix(self, texts):
+        from .embedding_matrix import aembed_matrix
+
+        start = time.perf_counter()
+        vectors = await aembed_matrix(self.embeddings, texts)
+        self._record(texts, time.perf_counter() - start)
+        return vectors
+
+    async def aembed_query(self, text):
+        start = time.perf_counter()
+        vector = await self.embeddings.aembed_query(text)
+        self._record([text], time.perf_counter() - start)
+        return vector
+
+class SamplingProfiler:
+    """Sample the stack of one thread at a fixed interval from a background thread
+
+    Stacks are counted in the collapsed format read by flamegraph.pl and
+    speedscope: one line per distinct stack, frames outermost first and
+    separated by semicolons, followed by the number of samples.
+    """
+
+    def __init__(self, thread_id=None, interval=Config.PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dump(self, path):
+        """Write the collapsed stacks, most sampled first"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def profile_path(endpoint):
+    """File for the profile of one request to an endpoint"""
+    name = endpoint.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+    return os.path.join(Config.PROFILE_DIR, f"{stamp}-{os.getpid()}-{threading.get_ident()}-{name}.folded")
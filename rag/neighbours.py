@@ -0,0 +1,135 @@
+import os
+import numpy as np
+from loguru import logger
+from config import Config
+from .ann_index import row_norms, BATCH_SIZE
+
+# Entries of the query-by-group similarity matrix computed at once
+SIMILARITY_BUDGET = 1 << 24
+
+def _unit_rows(matrix, norms, rows):
+    return np.asarray(matrix[rows], dtype=np.float32) / norms[rows, None]
+
+def neighbours_by_group(embeddings, norms, groups, queries, n):
+    """The n rows of the same group most similar to each query row
+
+    Args:
+        embeddings: Matrix with one row per article
+        norms: Norm of each row of embeddings
+        groups: Group label of each row; rows labelled -1 are left out
+        queries: Boolean mask of the rows to find neighbours for
+        n: Neighbours per row
+
+    Returns:
+        ndarray: int32 matrix of neighbour rows, best first, padded with -1
+    """
+    result = np.full((len(groups), n), -1, dtype=np.int32)
+    grouped = np.flatnonzero(groups >= 0)
+    order = grouped[np.argsort(groups[grouped], kind='stable')]
+    for members in np.split(order, np.flatnonzero(np.diff(groups[order])) + 1):
+        targets = members[queries[members]]
+        if len(targets) == 0 or len(members) < 2:
+            continue
+        candidates = _unit_rows(embeddings, norms, members)
+        k = min(n, len(members) - 1)
+        # Query batches of a large group are smaller, bounding the similarity matrix
+        batch_size = max(1, min(BATCH_SIZE, SIMILARITY_BUDGET // len(members)))
+        for start in range(0, len(targets), batch_size):
+            batch = targets[start:start + batch_size]
+            similarity = _unit_rows(embeddings, norms, batch) @ candidates.T
+            similarity[batch[:, None] == members[None, :]] = -np.inf
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            ranked = np.argsort(-np.take_along_axis(similarity, top, axis=1), axis=1, kind='stable')
+            result[batch, :k] = members[np.take_along_axis(top, ranked, axis=1)]
+    return result
+
+def _split_large_groups(groups, parts, max_size):
+    """Relabel the rows of groups larger than max_size by (group, part), keeping the other labels"""
+    labelled = groups >= 0
+    if not labelled.any():
+        return groups
+    sizes = np.bincount(groups[labelled])
+    large = labelled & (sizes[np.maximum(groups, 0)] > max_size)
+    if not large.any():
+        return groups
+    _, split = np.unique(np.stack([groups[large], parts[large]]), axis=1, return_inverse=True)
+    groups = groups.copy()
+    groups[large] = groups.max() + 1 + split.ravel()
+    return groups
+
+def build_related(embeddings, clusters, canonical=None, index=None, n=Config.RELATED_ARTICLES_NEIGHBOURS,
+                  max_group_size=Config.RELATED_MAX_GROUP_SIZE):
+    """Precompute the related articles of every article
+
+    Each article gets the n most similar canonical articles of its story
+    cluster. Articles in noise or in clusters too small to fill the list are
+    topped up with the most similar articles of their ANN index list, the
+    neighbourhood the index would have searched. Duplicates share the list of
+    their canonical copy.
+
+    Comparing all pairs of a cluster grows quadratically, so clusters larger
+    than max_group_size are split by ANN index list (or into blocks of
+    consecutive rows without an index) first.
+
+    Args:
+        embeddings: Matrix with one row per article
+        clusters: Cluster label of each article (-1 for noise)
+        canonical: Row position of each article's canonical copy (if None, every row is canonical)
+        index: ANNIndex over the same rows, for the cross-cluster top-up (if None, none is done)
+        n: Related articles per article
+        max_group_size: Largest cluster compared as a whole
+
+    Returns:
+        ndarray: int32 matrix with the related rows of each row, best first, padded with -1
+    """
+    n_rows = len(embeddings)
+    own = np.arange(n_rows)
+    canonical = own if canonical is None else np.asarray(canonical)
+    norms = row_norms(embeddings)
+    indexed = (canonical == own) & (norms > 0)
+
+    clusters = np.nan_to_num(np.asarray(clusters, dtype=np.float64), nan=-1).astype(np.int64)
+    lists = np.where(indexed, index.lists_of(own), -1) if index is not None else own // max_group_size
+    stories = _split_large_groups(np.where(indexed, clusters, -1), lists, max_group_size)
+    related = neighbours_by_group(embeddings, norms, stories, indexed, n)
+
+    if index is not None and n:
+        short = indexed & (related[:, -1] < 0)
+        nearby = neighbours_by_group(embeddings, norms, lists, short, n)
+        for row in np.flatnonzero(short):
+            kept = related[row][related[row] >= 0]
+            extra = [r for r in nearby[row] if r >= 0 and r not in kept][:n - len(kept)]
+            related[row, len(kept):len(kept) + len(extra)] = extra
+
+    duplicates = (canonical != own) & (canonical >= 0)
+    related[duplicates] = related[canonical[duplicates]]
+
+    logger.info(f"Precomputed related articles for {n_rows} articles, "
+                f"{int((related[:, -1] >= 0).sum()) if n else 0} with a full list of {n}")
+    return related
+
+def save_related(related, path=None):
+    """Save precomputed related articles as an .npy file, replacing any previous one atomically"""
+    if path is None:
+        path = Config.RELATED_ARTICLES_PATH
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(related, dtype=np.int32))
+    os.replace(tmp_path, path)
+    logger.info(f"Saved related articles to {path}")
+
+def load_related(path=None):
+    """Memory-map the related articles saved by the pipeline
+
+    Returns:
+        ndarray: Read-only int32 matrix, or None if they are disabled, missing or unreadable
+    """
+    if path is None:
+        path = Config.RELATED_ARTICLES_PATH
+    if not Config.RELATED_ARTICLES_NEIGHBOURS or not os.path.exists(path):
+        return None
+    try:
+        return np.load(path, mmap_mode='r')
+    except Exception as e:
+        logger.warning(f"Could not load related articles from {path}: {str(e)}")
+        return None
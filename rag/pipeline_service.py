@@ -0,0 +1,59 @@
+import os
+from loguru import logger
+from config import Config
+from .jobs import FileJobManager
+from .rag_context import read_published_state, publish_highlights, highlights_collection_name
+from .utils import process_news_pipeline
+from .vector_store import init_chroma_client
+
+def run_pipeline_job(progress=None, **params):
+    """Run the pipeline for a queued job and summarise the result"""
+    df, highlights_df = process_news_pipeline(progress=progress, **params)
+    return {
+        "articles_count": len(df),
+        "highlights_count": len(highlights_df),
+        "categories": df["predicted_category"].value_counts().to_dict()
+    }
+
+def publish_initial_state():
+    """Make sure processed articles and an indexed highlights generation are published
+
+    Runs the pipeline if nothing was processed yet, re-indexes the published
+    generation if its collection is missing and drops highlights collections
+    of other generations left over from earlier runs.
+    """
+    if not os.path.exists(Config.HIGHLIGHTS_CSV_PATH):
+        logger.info("Running initial news processing...")
+        process_news_pipeline()
+
+    client = init_chroma_client()
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    state = read_published_state()
+    if state is None or highlights_collection_name(state["generation"]) not in names:
+        publish_highlights(Config.HIGHLIGHTS_CSV_PATH)
+        state = read_published_state()
+
+    current = highlights_collection_name(state["generation"])
+    for name in names:
+        if name != current and (name == Config.HIGHLIGHTS_COLLECTION
+                                or name.startswith(f"{Config.HIGHLIGHTS_COLLECTION}-")):
+            client.delete_collection(name=name)
+    logger.info(f"Serving highlights generation {state['generation']}")
+
+def run_pipeline_service():
+    """Entry point of the pipeline process of the multi-process server
+
+    Publishes the initial state, then runs the pipeline jobs submitted by the
+    request workers one at a time. Started by gunicorn.conf.py, or on its own
+    with `python -m rag.pipeline_service` when run as a separate container.
+    """
+    Config.MULTIPROCESS_SERVING = True
+    try:
+        publish_initial_state()
+    except Exception as e:
+        # Keep accepting jobs so a run requested through /api/process can recover
+        logger.error(f"Failed to publish the initial state: {str(e)}")
+    FileJobManager(run_pipeline_job).serve_forever()
+
+if __name__ == "__main__":
+    run_pipeline_service()
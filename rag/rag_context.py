@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import threading
+from loguru import logger
+from config import Config
+from .answer_cache import get_answer_cache
+from .vector_store import init_chroma_client, get_langchain_embeddings, get_openai_ef
+
+PROMPT_TEMPLATE = """
+    You are a helpful assistant that answers questions about today's news headlines.
+    Use the following context to answer the question. If you don't know the answer, just say you don't know.
+    Don't refer to "Document 1" or other document numbers in your answer.
+    Provide a natural, conversational response based on the information provided.
+    
+    Context:
+    {context}
+    
+    Question: {question}
+    
+    Answer:
+    """
+
+def highlights_collection_name(generation):
+    """Name of the highlights collection for a generation of published highlights"""
+    return Config.HIGHLIGHTS_COLLECTION if generation == 0 else f"{Config.HIGHLIGHTS_COLLECTION}-{generation}"
+
+def read_published_state(path=None):
+    """Read the state last published by a pipeline run
+
+    Returns:
+        dict: {"generation": int, "published_at": float}, or None if nothing was published
+    """
+    path = path or Config.PUBLISHED_STATE_PATH
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def write_published_state(generation, path=None):
+    """Record the highlights generation and article outputs now being served
+
+    Other processes (the gunicorn request workers) watch this file and switch
+    to the new generation, reloading the article store, when it changes.
+    """
+    path = path or Config.PUBLISHED_STATE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"generation": generation, "published_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+class RAGContext:
+    """Warm state for answering chat questions
+
+    Holds the persistent Chroma client, the highlights collection handle, the
+    question embeddings, the prompt and the LLM chain so a chat request only
+    pays for the query embedding, the vector search and one LLM call.
+    """
+
+    def __init__(self, collection, client=None, llm=None, generation=0):
+        from langchain_openai import ChatOpenAI
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+        
+        self.client = client
+        self.collection = collection
+        self.generation = generation
+        self.embeddings = get_langchain_embeddings()
+        self.prompt = PromptTemplate(
+            template=PROMPT_TEMPLATE,
+            input_variables=["context", "question"]
+        )
+        self.llm = llm if llm is not None else ChatOpenAI(temperature=Config.LLM_TEMPERATURE)
+        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
+
+_context = None
+_context_lock = threading.Lock()
+
+def build_rag_context(highlights_path=None, generation=0, llm=None):
+    """Index the highlights into a fresh collection and build a context around it
+
+    Args:
+        highlights_path: Path to highlights CSV (if None, use Config.HIGHLIGHTS_CSV_PATH)
+        generation: Generation number of the highlights, used to name the collection
+        llm: Optional chat model to use instead of ChatOpenAI
+
+    Returns:
+        RAGContext: Context ready to serve questions
+    """
+    from .utils import init_vector_store
+
+    collection = init_vector_store(highlights_path, collection_name=highlights_collection_name(generation))
+    return RAGContext(collection, client=init_chroma_client(), llm=llm, generation=generation)
+
+def open_rag_context(generation, llm=None):
+    """Build a context around an already indexed highlights generation
+
+    Args:
+        generation: Published generation whose collection to open
+        llm: Optional chat model to use instead of ChatOpenAI
+
+    Returns:
+        RAGContext: Context ready to serve questions
+    """
+    client = init_chroma_client()
+    collection = client.get_collection(name=highlights_collection_name(generation), embedding_function=get_openai_ef())
+    return RAGContext(collection, client=client, llm=llm, generation=generation)
+
+def get_rag_context():
+    """Get the process-wide RAG context, building it on first use
+
+    Request workers of the multi-process server open the published
+    generation instead of indexing the highlights themselves.
+    """
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                if Config.MULTIPROCESS_SERVING:
+                    state = read_published_state()
+                    if state is None:
+                        raise RuntimeError("No highlights have been published yet")
+                    _context = open_rag_context(state["generation"])
+                else:
+                    _context = build_rag_context()
+    return _context
+
+def current_generation():
+    """Generation of the RAG context this process serves, or None before one is loaded"""
+    return _context.generation if _context is not None else None
+
+def set_rag_context(context, drop_stale=True):
+    """Swap in a new RAG context
+
+    The collection from two generations back is dropped; the previous one is
+    kept so requests still holding it can finish.
+
+    Args:
+        context: The new context
+        drop_stale: Delete the stale collection (False in processes that only read)
+    """
+    global _context
+    with _context_lock:
+        previous, _context = _context, context
+    get_answer_cache().invalidate()
+    if drop_stale and previous is not None and previous.generation > 0 and context.client is not None:
+        stale = highlights_collection_name(previous.generation - 1)
+        try:
+            context.client.delete_collection(name=stale)
+        except Exception as e:
+            logger.info(f"Could not delete stale highlights collection {stale}: {str(e)}")
+    return context
+
+def init_rag_context(highlights_path=None, llm=None):
+    """Build the RAG context at startup and make it current
+
+    Highlights collections left over from generations of earlier processes
+    are removed first.
+    """
+    client = init_chroma_client()
+    for name in client.list_collections():
+        name = getattr(name, "name", name)
+        if name.startswith(f"{Config.HIGHLIGHTS_COLLECTION}-"):
+            client.delete_collection(name=name)
+    context = set_rag_context(build_rag_context(highlights_path, llm=llm))
+    write_published_state(context.generation)
+    return context
+
+def publish_highlights(highlights_path=None):
+    """Index newly produced highlights into a new generation and swap it in
+
+    Requests in flight keep answering from the previous collection. Does
+    nothing if this process never built a context, unless it is the pipeline
+    process of the multi-process server, which publishes for the request
+    workers through the published state file.
+    """
+    current = _context
+    if current is None and not Config.MULTIPROCESS_SERVING:
+        return None
+    if current is not None:
+        generation = current.generation + 1
+    else:
+        state = read_published_state()
+        generation = state["generation"] + 1 if state is not None else 0
+    context = build_rag_context(highlights_path, generation=generation, llm=current.llm if current else None)
+    logger.info(f"Published highlights generation {context.generation}")
+    set_rag_context(context)
+    write_published_state(context.generation)
+    return context
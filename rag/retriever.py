@@ -0,0 +1,189 @@
+import threading
+import numpy as np
+from loguru import logger
+from config import Config
+from .article_store import get_article_store
+from .columnar_store import load_frame, load_embeddings
+from .context_builder import get_context_builder
+from .metrics import span
+from .search_index import tokenize
+from .vector_store import init_articles_collection
+
+def detect_category(question):
+    """Category named in the question, if any"""
+    words = set(tokenize(question))
+    for category in Config.NEWS_CATEGORIES:
+        if category in words:
+            return category
+    return None
+
+def reciprocal_rank_fusion(rankings, k=Config.RRF_K):
+    """Fuse ranked lists of document ids with reciprocal rank fusion
+
+    Args:
+        rankings: Lists of document ids, best first
+        k: Rank offset damping the weight of the top ranks
+
+    Returns:
+        list: (document id, fused score) pairs, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+class HybridRetriever:
+    """Chat retrieval over all processed articles
+
+    Combines BM25 over the article store's inverted index with vector search
+    over its ANN index (or the news_articles collection without one), both
+    prefiltered by the category named in the question. The two rankings are
+    fused with reciprocal rank fusion and the fused candidates are reranked by
+    cosine similarity to the question plus the share of question words found
+    in the title.
+    """
+
+    def __init__(self, store, collection):
+        self.store = store
+        self.collection = collection
+
+        # Article embeddings saved by the pipeline, to rerank lexical-only hits without a round trip
+        ids, matrix = load_embeddings()
+        self.embedding_rows = {article_id: row for row, article_id in enumerate(ids or [])}
+        self.embeddings = matrix
+
+        # Cluster of each article, so the context builder can drop text repeated across cluster-mates
+        self.clusters = {}
+        try:
+            clusters = load_frame(Config.CLASSIFIED_ARTICLES_CSV_PATH, columns=['id', 'cluster'])
+            if 'cluster' in clusters.columns:
+                self.clusters = {str(article_id): int(cluster)
+                                 for article_id, cluster in zip(clusters['id'], clusters['cluster'])
+                                 if cluster == cluster and cluster >= 0}
+        except Exception as e:
+            logger.warning(f"Could not load article clusters: {str(e)}")
+
+    def lexical(self, question, category=None, limit=Config.RETRIEVAL_CANDIDATES):
+        """Store positions of the best BM25 matches"""
+        candidates = self.store.category_offsets.get(category, self.store.all_offsets[:0]) if category else None
+        docs, _ = self.store.search_index.rank(question, candidates=candidates, limit=limit)
+        return docs.tolist()
+
+    def vector(self, question_embedding, category=None, limit=Config.RETRIEVAL_CANDIDATES):
+        """Store positions of the nearest articles, with the embeddings the search returned
+
+        Searches the article store's ANN index, or the news_articles collection
+        when there is none.
+        """
+        index = self.store.ann_index
+        if index is not None:
+            rows, _ = index.search(question_embedding, limit, category=category, refine=self.store.embeddings)
+            return rows.tolist(), {}
+
+        results = self.collection.query(
+            query_embeddings=[question_embedding],
+            n_results=limit,
+            where={"predicted_category": category} if category else None,
+            include=["embeddings"]
+        )
+        positions, vectors = [], {}
+        embeddings = results.get("embeddings")
+        for i, fingerprint in enumerate(results["ids"][0]):
+            position = self.store.fingerprint_positions.get(fingerprint)
+            if position is not None:
+                positions.append(position)
+                if embeddings is not None:
+                    vectors[position] = np.asarray(embeddings[0][i], dtype=np.float32)
+        return positions, vectors
+
+    def _embeddings_for(self, positions, known, dim):
+        """Embedding matrix for store positions, from vector hits, the saved embeddings or the collection
+
+        Articles whose embedding is not found get a zero row.
+        """
+        vectors = dict(known)
+        missing = []
+        for position in positions:
+            if position in vectors:
+                continue
+            row = self.embedding_rows.get(self.store.ids[position])
+            if row is not None:
+                vectors[position] = np.asarray(self.embeddings[row], dtype=np.float32)
+            else:
+                missing.append(position)
+        if missing:
+            fingerprints = [self.store.fingerprints[p] for p in missing]
+            fetched = self.collection.get(ids=list(dict.fromkeys(fingerprints)), include=["embeddings"])
+            found = dict(zip(fetched["ids"], fetched["embeddings"]))
+            for position, fingerprint in zip(missing, fingerprints):
+                if fingerprint in found:
+                    vectors[position] = np.asarray(found[fingerprint], dtype=np.float32)
+        return np.vstack([vectors.get(p, np.zeros(dim, dtype=np.float32)) for p in positions])
+
+    def rerank(self, question, question_embedding, positions, known_embeddings, k):
+        """Keep the k candidates scoring best on cosine similarity and title word coverage"""
+        if not positions:
+            return []
+        query = np.asarray(question_embedding, dtype=np.float32)
+        matrix = self._embeddings_for(positions, known_embeddings, len(query))
+        norms = np.linalg.norm(matrix, axis=1) * max(np.linalg.norm(query), 1e-12)
+        cosine = matrix @ query / np.maximum(norms, 1e-12)
+
+        words = set(tokenize(question))
+        coverage = np.array([len(words & set(tokenize(self.store.records[p]['title']))) / max(len(words), 1)
+                             for p in positions])
+        scores = cosine + Config.RERANK_TITLE_WEIGHT * coverage
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [positions[i] for i in order]
+
+    def retrieve(self, question, question_embedding, k=5):
+        """Store positions of the k articles to answer a question from, best first"""
+        category = detect_category(question)
+        with span("lexical_search"):
+            lexical = self.lexical(question, category)
+        with span("vector_search"):
+            vector, known_embeddings = self.vector(question_embedding, category)
+        fused = [doc for doc, _ in reciprocal_rank_fusion([lexical, vector])][:Config.RETRIEVAL_CANDIDATES]
+        with span("rerank"):
+            return self.rerank(question, question_embedding, fused, known_embeddings, k)
+
+    def retrieve_context(self, question, question_embedding, k=5):
+        """Retrieve the documents used to answer a question
+
+        Returns:
+            tuple: (context text for the prompt, list of sources)
+        """
+        records = [self.store.records[position] for position in self.retrieve(question, question_embedding, k)]
+        if Config.CONTEXT_COMPRESSION:
+            passages = [{
+                "id": record['id'],
+                "title": record['title'],
+                "text": record['content'],
+                "group": self.clusters.get(record['id'])
+            } for record in records]
+            with span("context"):
+                context, used = get_context_builder().build(question_embedding, passages)
+            records = [records[i] for i in used]
+        else:
+            context = "".join(f"{record['title']}. {record['content']}\n\n" for record in records)
+
+        sources = [{
+            "id": record['id'],
+            "title": record['title'],
+            "category": record['category']
+        } for record in records]
+        return context, sources
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever():
+    """Get a retriever over the current article store, rebuilding it after the store is reloaded"""
+    global _retriever
+    store = get_article_store()
+    with _retriever_lock:
+        if _retriever is None or _retriever.store is not store:
+            _retriever = HybridRetriever(store, init_articles_collection())
+            logger.info(f"Hybrid retriever ready over {len(store)} articles")
+        return _retriever
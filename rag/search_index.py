@@ -0,0 +1,286 @@
+import os
+import re
+import bisect
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import Config
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# Gap left between the title and summary positions so phrases never span both fields
+FIELD_GAP = 1
+
+# Function words skipped when ranking chat questions, unless they are rare or the question has nothing else
+STOP_WORDS = frozenset("""
+a about after all also am an and any are as at be been but by can could did do does for from had has have he her
+his how i if in into is it its me my no not of on or our over she so than that the their them then there these
+they this to up us was we were what when where which who why will with would you your
+""".split())
+
+def tokenize(text):
+    """Split text into lower-cased word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def article_fields(df):
+    """Title and summary text of each article, with 'nil' summaries treated as empty"""
+    titles = df['Title'].fillna('').astype(str) if 'Title' in df.columns else pd.Series('', index=df.index)
+    summaries = (df['news_summary'].fillna('').astype(str).replace('nil', '')
+                 if 'news_summary' in df.columns else pd.Series('', index=df.index))
+    return titles.tolist(), summaries.tolist()
+
+def parse_query(q):
+    """Parse a search query into term and phrase clauses
+
+    Quoted text is a phrase. A trailing `*` makes a term a prefix, and the last
+    bare term of the query is always matched as a prefix so partially typed
+    words still find results.
+
+    Returns:
+        list: (kind, value) tuples where kind is 'term', 'prefix' or 'phrase'
+    """
+    clauses = []
+    for phrase, word in QUERY_PATTERN.findall(q):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) == 1:
+                clauses.append(('term', tokens[0]))
+            elif tokens:
+                clauses.append(('phrase', tokens))
+            continue
+        is_prefix = word.endswith('*')
+        for token in tokenize(word):
+            clauses.append(('prefix' if is_prefix else 'term', token))
+
+    # Search-as-you-type: the last bare word may be incomplete
+    if clauses and clauses[-1][0] == 'term' and not q.rstrip().endswith('"'):
+        clauses[-1] = ('prefix', clauses[-1][1])
+    return clauses
+
+class InvertedIndex:
+    """Positional inverted index over article titles and summaries with BM25 ranking
+
+    Postings are stored in flat arrays: `term_offsets[t]:term_offsets[t + 1]`
+    slices `post_docs` and `post_tf` for term `t`, and `pos_offsets[p]:pos_offsets[p + 1]`
+    slices `positions` for posting `p`. Document ids are row positions in
+    classified_articles.csv.
+    """
+
+    def __init__(self, terms, term_offsets, post_docs, post_tf, pos_offsets, positions, doc_len,
+                 k1=Config.SEARCH_BM25_K1, b=Config.SEARCH_BM25_B):
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.term_offsets = term_offsets
+        self.post_docs = post_docs
+        self.post_tf = post_tf
+        self.pos_offsets = pos_offsets
+        self.positions = positions
+        self.doc_len = doc_len
+        self.n_docs = len(doc_len)
+        self.avgdl = float(doc_len.mean()) if self.n_docs else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, df):
+        """Build an index over the Title and news_summary columns of df"""
+        postings = defaultdict(list)
+        doc_len = np.zeros(len(df), dtype=np.float32)
+
+        for doc_id, (title, summary) in enumerate(zip(*article_fields(df))):
+            title_tokens = tokenize(title)
+            tokens = title_tokens + tokenize(summary)
+            doc_len[doc_id] = len(tokens)
+            term_positions = defaultdict(list)
+            for pos, token in enumerate(tokens):
+                term_positions[token].append(pos if pos < len(title_tokens) else pos + FIELD_GAP)
+            for token, token_positions in term_positions.items():
+                postings[token].append((doc_id, token_positions))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        post_docs, post_tf, pos_lengths, positions = [], [], [], []
+        for i, term in enumerate(terms):
+            for doc_id, token_positions in postings[term]:
+                post_docs.append(doc_id)
+                post_tf.append(len(token_positions))
+                pos_lengths.append(len(token_positions))
+                positions.extend(token_positions)
+            term_offsets[i + 1] = len(post_docs)
+
+        pos_offsets = np.zeros(len(pos_lengths) + 1, dtype=np.int64)
+        np.cumsum(pos_lengths, out=pos_offsets[1:])
+
+        index = cls(terms, term_offsets, np.asarray(post_docs, dtype=np.int32),
+                    np.asarray(post_tf, dtype=np.int32), pos_offsets,
+                    np.asarray(positions, dtype=np.int32), doc_len)
+        logger.info(f"Built search index with {len(terms)} terms over {index.n_docs} articles")
+        return index
+
+    def save(self, path):
+        """Persist the index as an uncompressed .npz file, replacing any previous one atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, terms=np.asarray(self.terms, dtype=str), term_offsets=self.term_offsets,
+                     post_docs=self.post_docs, post_tf=self.post_tf, pos_offsets=self.pos_offsets,
+                     positions=self.positions, doc_len=self.doc_len)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved search index to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with `save`"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['terms'].tolist(), data['term_offsets'], data['post_docs'], data['post_tf'],
+                       data['pos_offsets'], data['positions'], data['doc_len'])
+
+    def _term_range(self, term_id):
+        return self.term_offsets[term_id], self.term_offsets[term_id + 1]
+
+    def _doc_freq(self, term_id):
+        return int(self.term_offsets[term_id + 1] - self.term_offsets[term_id])
+
+    def _expand_prefix(self, prefix):
+        """Term ids starting with prefix, most frequent first, capped by Config.SEARCH_MAX_PREFIX_EXPANSIONS"""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\U0010ffff')
+        term_ids = np.arange(start, end)
+        if len(term_ids) > Config.SEARCH_MAX_PREFIX_EXPANSIONS:
+            doc_freq = self.term_offsets[term_ids + 1] - self.term_offsets[term_ids]
+            term_ids = term_ids[np.argsort(-doc_freq, kind='stable')[:Config.SEARCH_MAX_PREFIX_EXPANSIONS]]
+        return term_ids.tolist()
+
+    def _bm25(self, term_id, docs):
+        """BM25 contribution of one term for each of the given (sorted) documents"""
+        lo, hi = self._term_range(term_id)
+        term_docs = self.post_docs[lo:hi]
+        idx = np.minimum(np.searchsorted(term_docs, docs), len(term_docs) - 1)
+        present = term_docs[idx] == docs
+        tf = np.where(present, self.post_tf[lo:hi][idx], 0).astype(np.float32)
+
+        idf = np.log(1.0 + (self.n_docs - len(term_docs) + 0.5) / (len(term_docs) + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[docs] / max(self.avgdl, 1e-9))
+        return idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+    def _phrase_docs(self, tokens):
+        """Documents containing the tokens as consecutive words"""
+        term_ids = [self.term_ids.get(token) for token in tokens]
+        if any(term_id is None for term_id in term_ids):
+            return np.empty(0, dtype=np.int32)
+
+        # Intersect the sorted doc ids first, rarest term first, and read positions only for the survivors
+        ranges = [self._term_range(term_id) for term_id in term_ids]
+        candidates = None
+        for lo, hi in sorted(ranges, key=lambda r: r[1] - r[0]):
+            term_docs = self.post_docs[lo:hi]
+            candidates = term_docs if candidates is None else np.intersect1d(candidates, term_docs, assume_unique=True)
+            if len(candidates) == 0:
+                return np.empty(0, dtype=np.int32)
+
+        postings = [lo + np.searchsorted(self.post_docs[lo:hi], candidates) for lo, hi in ranges]
+        matches = []
+        for i, doc in enumerate(candidates):
+            starts = None
+            for offset, term_postings in enumerate(postings):
+                p = term_postings[i]
+                shifted = set((self.positions[self.pos_offsets[p]:self.pos_offsets[p + 1]] - offset).tolist())
+                starts = shifted if starts is None else starts & shifted
+                if not starts:
+                    break
+            if starts:
+                matches.append(doc)
+        return np.asarray(matches, dtype=np.int32)
+
+    def search(self, q, candidates=None):
+        """Find documents matching every clause of the query, best BM25 score first
+
+        Only the postings of the query terms are touched, so latency depends on
+        how selective the query is rather than on the size of the corpus.
+
+        Args:
+            q: Query string
+            candidates: Optional array of document ids to restrict results to,
+                e.g. the offsets of a category
+
+        Returns:
+            np.ndarray: Matching document ids ordered by descending score
+        """
+        matched = None
+        scored_terms = []
+        for kind, value in parse_query(q):
+            if kind == 'phrase':
+                docs = self._phrase_docs(value)
+                scored_terms.extend(self.term_ids[token] for token in value if token in self.term_ids)
+            else:
+                if kind == 'prefix':
+                    term_ids = self._expand_prefix(value)
+                else:
+                    term_ids = [self.term_ids[value]] if value in self.term_ids else []
+                postings = [self.post_docs[slice(*self._term_range(t))] for t in term_ids]
+                docs = np.unique(np.concatenate(postings)) if postings else np.empty(0, dtype=np.int32)
+                scored_terms.extend(term_ids)
+            matched = docs if matched is None else np.intersect1d(matched, docs, assume_unique=True)
+            if len(matched) == 0:
+                break
+
+        if matched is None or len(matched) == 0:
+            return np.empty(0, dtype=np.int32)
+
+        if candidates is not None:
+            matched = np.intersect1d(matched, candidates, assume_unique=True)
+
+        scores = np.zeros(len(matched), dtype=np.float32)
+        for term_id in set(scored_terms):
+            scores += self._bm25(term_id, matched)
+
+        order = np.lexsort((matched, -scores))
+        return matched[order].astype(np.int32)
+
+    def rank(self, q, candidates=None, limit=100):
+        """Rank documents containing any of the query words by BM25
+
+        Unlike `search`, every word is optional, which suits natural-language
+        questions. Stop words are ignored unless they are rare or the question
+        has no other word, in which case its rarest word is used. Words in more
+        than Config.SEARCH_MAX_DF_RATIO of the documents still count towards the
+        score, but only their best postings up to that share join the
+        candidates, which bounds the work for very common words.
+
+        Args:
+            q: Query string
+            candidates: Optional array of document ids to restrict results to
+            limit: Maximum number of documents to return
+
+        Returns:
+            tuple: (document ids, BM25 scores), best first
+        """
+        max_df = int(max(Config.SEARCH_MAX_DF_RATIO * self.n_docs, 1))
+        known = [self.term_ids[token] for token in dict.fromkeys(tokenize(q)) if token in self.term_ids]
+        if not known:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        term_ids = [t for t in known if self.terms[t] not in STOP_WORDS or self._doc_freq(t) <= max_df]
+        if not term_ids:
+            term_ids = [min(known, key=self._doc_freq)]
+
+        postings = []
+        for term_id in term_ids:
+            term_docs = self.post_docs[slice(*self._term_range(term_id))]
+            if candidates is not None:
+                term_docs = np.intersect1d(term_docs, candidates, assume_unique=True)
+            if len(term_docs) > max_df:
+                # Frequent words keep scoring every candidate, but only add their best postings
+                best = np.argpartition(-self._bm25(term_id, term_docs), max_df - 1)[:max_df]
+                term_docs = np.sort(term_docs[best])
+            postings.append(term_docs)
+        docs = np.unique(np.concatenate(postings))
+        scores = np.zeros(len(docs), dtype=np.float32)
+        for term_id in term_ids:
+            scores += self._bm25(term_id, docs)
+
+        if len(docs) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))
+        return docs[order].astype(np.int32), scores[order]
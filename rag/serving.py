@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from loguru import logger
+from config import Config
+from .article_store import get_article_store, reload_article_store, article_store_loaded
+from .rag_context import read_published_state, open_rag_context, set_rag_context, current_generation
+from .vector_store import reset_chroma_client
+from .metrics import get_registry
+
+# Published state this process serves from, and when the state file was last checked
+_synced = {"generation": None, "mtime": None, "checked_at": 0.0}
+_sync_lock = threading.Lock()
+
+def preload_shared_state():
+    """Load the read-only serving state in the gunicorn master, before the workers fork
+
+    Only the article store is loaded: its records, serialised JSON and search
+    index are plain Python and numpy objects the workers share copy-on-write.
+    Chroma clients do not survive a fork, so the vector store and the RAG
+    context are opened by each worker on first use. The modules they need are
+    imported here, though, so workers neither pay for nor duplicate them.
+    """
+    import chromadb
+    import langchain_openai
+    import langchain.chains
+    
+    state = read_published_state()
+    if state is None:
+        logger.info("Nothing published yet, workers will load the articles once the pipeline process has")
+        return
+    get_article_store()
+    _synced["generation"] = state["generation"]
+    _synced["mtime"] = os.path.getmtime(Config.PUBLISHED_STATE_PATH)
+
+def init_worker():
+    """Set up a request worker right after it is forked"""
+    from .embedding_cache import use_memory_caches
+    
+    # Only the pipeline process writes the on-disk embedding cache
+    use_memory_caches()
+    # Anything the master recorded before forking is in its own snapshot already
+    get_registry().reset()
+
+def sync_published_state():
+    """Switch this worker to state published since the last check
+
+    Checks the published state file at most every Config.STATE_CHECK_INTERVAL
+    seconds. When a new generation was published, the article store is
+    reloaded and the RAG context reopened on a fresh Chroma client; requests
+    in flight finish on the previous ones.
+    """
+    if time.monotonic() - _synced["checked_at"] < Config.STATE_CHECK_INTERVAL:
+        return
+    with _sync_lock:
+        now = time.monotonic()
+        if now - _synced["checked_at"] < Config.STATE_CHECK_INTERVAL:
+            return
+        _synced["checked_at"] = now
+        try:
+            mtime = os.path.getmtime(Config.PUBLISHED_STATE_PATH)
+        except FileNotFoundError:
+            return
+        if mtime == _synced["mtime"]:
+            return
+        state = read_published_state()
+        if state is None:
+            return
+        if state["generation"] != _synced["generation"]:
+            logger.info(f"Switching to published generation {state['generation']}")
+            try:
+                reload_article_store()
+                reset_chroma_client()
+                if current_generation() is not None:
+                    set_rag_context(open_rag_context(state["generation"]), drop_stale=False)
+            except Exception as e:
+                # Keep serving the previous state and retry on a later request
+                logger.error(f"Failed to switch to generation {state['generation']}: {str(e)}")
+                return
+            _synced["generation"] = state["generation"]
+        _synced["mtime"] = mtime
+
+def readiness():
+    """Whether this process can serve requests
+
+    Returns:
+        tuple: (ready, dict of the individual checks)
+    """
+    checks = {
+        "articles": article_store_loaded(),
+        "highlights": current_generation() is not None or (
+            Config.MULTIPROCESS_SERVING and read_published_state() is not None)
+    }
+    return all(checks.values()), checks
@@ -0,0 +1,245 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import Config
+from .categorizer import NewsClassifier, prepare_article_text
+from .clustering import NewsClustering
+from .columnar_store import FrameWriter, widen_schema
+from .dedup import find_duplicates
+from .highlights import HighlightExtractor
+from .incremental import fingerprint_articles
+from .metrics import span
+from .search_index import tokenize
+from .vector_store import upsert_articles, update_article_clusters, delete_articles, stale_article_ids
+
+def text_hashes(texts):
+    """64-bit hash of each text's tokens, equal for texts that find_duplicates treats as identical"""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(' '.join(tokenize(text)).encode('utf-8'), digest_size=8).digest(), 'little')
+        for text in texts
+    ], dtype=np.uint64)
+
+def prepare_chunk(chunk):
+    """Add the 'text', 'id' and 'fingerprint' columns to a chunk of the news CSV"""
+    chunk = prepare_article_text(chunk)
+    chunk['fingerprint'] = fingerprint_articles(chunk)
+    return chunk
+
+class StreamingIngest:
+    """Full pipeline run over a news CSV read in chunks, for inputs larger than memory
+
+    The first pass sends each chunk through generator stages: prepare, dedup,
+    classify and embed, upsert. Per article only its canonical row, category
+    and similarity stay in memory; embeddings are written to a float32 matrix
+    preallocated for the whole input and memory-mapped from
+    Config.INGEST_EMBEDDINGS_PATH. Clustering, the one stage that needs every
+    article at once, reads them from there. A second pass over the CSV writes
+    the classified articles with their clusters and picks the highlights, a
+    chunk at a time.
+
+    Near-duplicates are detected within a chunk, exact duplicates (same text
+    tokens) across the whole input.
+
+    Args:
+        news_csv_path: Path to the input news CSV
+        chunk_size: Rows per chunk
+        embeddings_path: Path of the memory-mapped embedding matrix, removed by `close`
+    """
+
+    def __init__(self, news_csv_path, chunk_size=Config.INGEST_CHUNK_SIZE,
+                 embeddings_path=Config.INGEST_EMBEDDINGS_PATH):
+        self.news_csv_path = news_csv_path
+        self.chunk_size = chunk_size
+        self.embeddings_path = embeddings_path
+        self.n_rows = 0
+        self.embeddings = None
+        self.ids = None
+        # Fingerprints of the articles, which key their vector store entries
+        self.fingerprints = None
+        self.canonical = None
+        self.categories = []
+        self.category_codes = None
+        self.similarity = None
+        self.clusters = None
+        # Arrow schema of the prepared chunks, for writing them in the second pass
+        self.schema = None
+        # Sorted text hashes of the canonical articles seen so far, with their rows
+        self._seen_hashes = np.empty(0, dtype=np.uint64)
+        self._seen_rows = np.empty(0, dtype=np.int64)
+
+    def chunks(self):
+        """Read the news CSV a chunk at a time; each chunk's index holds its row positions"""
+        yield from pd.read_csv(self.news_csv_path, chunksize=self.chunk_size)
+
+    def prepared(self, chunks):
+        for chunk in chunks:
+            with span("prepare"):
+                chunk = prepare_chunk(chunk)
+            yield chunk
+
+    def deduplicated(self, chunks):
+        """Record the canonical row of each article of the chunks"""
+        for chunk in chunks:
+            rows = chunk.index.to_numpy()
+            if not Config.DEDUP_ENABLED:
+                self.canonical[rows] = rows
+                yield chunk
+                continue
+
+            with span("dedup"):
+                texts = chunk['text'].fillna('').astype(str).tolist()
+                local = find_duplicates(texts)
+                first = np.flatnonzero(local == np.arange(len(chunk)))
+                canonical = rows.copy()
+
+                # Chunk canonicals whose text was already seen are duplicates of the earlier article
+                hashes = text_hashes([texts[i] for i in first])
+                positions = np.searchsorted(self._seen_hashes, hashes)
+                seen = positions < len(self._seen_hashes)
+                seen[seen] = self._seen_hashes[positions[seen]] == hashes[seen]
+                canonical[first[seen]] = self._seen_rows[positions[seen]]
+                self.canonical[rows] = canonical[local]
+
+                new = np.argsort(hashes[~seen], kind='stable')
+                new_hashes, new_rows = hashes[~seen][new], rows[first[~seen]][new]
+                at = np.searchsorted(self._seen_hashes, new_hashes)
+                self._seen_hashes = np.insert(self._seen_hashes, at, new_hashes)
+                self._seen_rows = np.insert(self._seen_rows, at, new_rows)
+            yield chunk
+
+    def _category_code(self, category):
+        if category not in self.categories:
+            self.categories.append(category)
+        return self.categories.index(category)
+
+    def classified(self, chunks, classifier):
+        """Classify and embed the canonical articles of the chunks; duplicates copy their canonical's results"""
+        for chunk in chunks:
+            rows = chunk.index.to_numpy()
+            own = self.canonical[rows] == rows
+            if own.any():
+                classified, embeddings = classifier.classify_dataframe(chunk[own], return_embeddings=True)
+                if self.embeddings is None:
+                    os.makedirs(os.path.dirname(self.embeddings_path) or '.', exist_ok=True)
+                    self.embeddings = np.lib.format.open_memmap(self.embeddings_path, mode='w+', dtype=np.float32,
+                                                                shape=(self.n_rows, embeddings.shape[1]))
+                self.embeddings[rows[own]] = embeddings
+                self.similarity[rows[own]] = classified['similarity'].to_numpy()
+                self.category_codes[rows[own]] = [self._category_code(c) for c in classified['predicted_category']]
+
+            duplicates = rows[~own]
+            if len(duplicates):
+                sources = self.canonical[duplicates]
+                self.embeddings[duplicates] = self.embeddings[sources]
+                self.similarity[duplicates] = self.similarity[sources]
+                self.category_codes[duplicates] = self.category_codes[sources]
+            yield chunk
+
+    def upserted(self, chunks):
+        """Upsert the articles of the chunks to the vector store, before their clusters are known"""
+        for chunk in chunks:
+            rows = chunk.index.to_numpy()
+            with span("upsert"):
+                categories = np.asarray(self.categories, dtype=object)[self.category_codes[rows]]
+                upsert_articles(chunk.assign(predicted_category=categories, cluster=-1),
+                                self.embeddings[rows[0]:rows[-1] + 1])
+                # Write the chunk's pages back so they can be evicted instead of accumulating
+                self.embeddings.flush()
+            yield chunk
+
+    def ingest(self, progress):
+        """First pass: classify, embed and upsert every article"""
+        progress("load")
+        self.n_rows = sum(len(chunk) for chunk in pd.read_csv(self.news_csv_path, usecols=[0],
+                                                              chunksize=self.chunk_size))
+        logger.info(f"Streaming {self.n_rows} articles from {self.news_csv_path} "
+                    f"in chunks of {self.chunk_size}")
+        self.canonical = np.arange(self.n_rows)
+        self.category_codes = np.zeros(self.n_rows, dtype=np.int8)
+        self.similarity = np.zeros(self.n_rows, dtype=np.float32)
+
+        progress("ingest")
+        classifier = NewsClassifier()
+        ids, fingerprints = [], []
+        stages = self.upserted(self.classified(self.deduplicated(self.prepared(self.chunks())), classifier))
+        for chunk in stages:
+            ids.append(chunk['id'].to_numpy())
+            fingerprints.append(chunk['fingerprint'].to_numpy(dtype='S40'))
+            self.schema = widen_schema(self.schema, chunk)
+            logger.info(f"Ingested {chunk.index[-1] + 1} of {self.n_rows} articles")
+        self.ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        self.fingerprints = np.concatenate(fingerprints) if fingerprints else np.empty(0, dtype='S40')
+        n_duplicates = int((self.canonical != np.arange(self.n_rows)).sum())
+        logger.info(f"Ingested {self.n_rows} articles, {n_duplicates} of them duplicates")
+
+    def cluster(self):
+        """Cluster the canonical articles, copy the clusters to duplicates and update the vector store
+
+        Entries of articles no longer in the news CSV are deleted from the vector store.
+        """
+        canonical_rows = np.flatnonzero(self.canonical == np.arange(self.n_rows))
+        clusters = np.full(self.n_rows, -1, dtype=np.int64)
+        clusters[canonical_rows] = NewsClustering().fit_transform(self.embeddings, canonical_rows)
+        self.clusters = clusters[self.canonical]
+        # Exact copies share one entry
+        _, first = np.unique(self.fingerprints, return_index=True)
+        update_article_clusters(self.fingerprints[first], self.clusters[first])
+        delete_articles(stale_article_ids(self.fingerprints))
+
+    def annotated(self, chunks):
+        """Chunks with the columns the pipeline adds to the classified articles"""
+        names = np.asarray(self.categories, dtype=object)
+        sizes = pd.Series(self.clusters).value_counts()
+        for chunk in chunks:
+            rows = chunk.index.to_numpy()
+            canonical = self.canonical[rows]
+            duplicate_of = pd.Series(pd.NA, index=chunk.index, dtype=object)
+            duplicate_of[canonical != rows] = self.ids[canonical[canonical != rows]]
+            chunk['duplicate_of'] = duplicate_of
+            chunk['predicted_category'] = names[self.category_codes[rows]]
+            chunk['similarity'] = self.similarity[rows]
+            chunk['cluster'] = self.clusters[rows]
+            chunk['cluster_size'] = sizes.reindex(self.clusters[rows]).to_numpy()
+            yield chunk
+
+    def write_outputs(self, csv_path=None, highlights_per_category=Config.HIGHLIGHTS_PER_CATEGORY):
+        """Second pass: write the classified articles and pick the highlights
+
+        Each chunk's best articles per category are kept as candidates, and the
+        highlights are picked among the candidates of all chunks.
+
+        Args:
+            csv_path: Output path of the classified articles (if None, they are not written)
+            highlights_per_category: Number of highlights per category
+
+        Returns:
+            DataFrame: Top highlights
+        """
+        writer = FrameWriter(csv_path, self.schema) if csv_path else None
+        highlighter = HighlightExtractor()
+        candidates = []
+        for chunk in self.annotated(self.prepared(self.chunks())):
+            if writer is not None:
+                writer.write(chunk)
+            candidates.append(highlighter.extract_highlights(chunk, highlights_per_category))
+        if writer is not None:
+            writer.close()
+            logger.info(f"Saved {writer.rows} classified articles to {csv_path}")
+        return highlighter.extract_highlights(pd.concat(candidates, ignore_index=True), highlights_per_category)
+
+    def summary(self):
+        """Compact frame of the processed articles: id, predicted category, similarity and cluster"""
+        return pd.DataFrame({
+            'id': self.ids,
+            'predicted_category': pd.Categorical.from_codes(self.category_codes, self.categories),
+            'similarity': self.similarity,
+            'cluster': self.clusters
+        })
+
+    def close(self):
+        """Remove the memory-mapped embedding matrix"""
+        if self.embeddings is not None:
+            self.embeddings = None
+            os.remove(self.embeddings_path)
@@ -1,79 +1,317 @@
 import os
+import time
+import numpy as np
 import pandas as pd
-from pathlib import Path
 from loguru import logger
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from config import Config
-from .categorizer import NewsClassifier, prepare_article_text
-from .clustering import NewsClustering
-from .highlights import HighlightExtractor
-from .vector_store import get_langchain_embeddings, init_chroma_client, get_openai_ef, upsert_articles
+from .article_store import refresh_article_store
+from .columnar_store import save_frame, load_frame, save_embeddings
+from .dedup import mark_duplicates, is_canonical, propagate_duplicates, canonical_positions
+from .search_index import InvertedIndex
+from .ann_index import ANNIndex
+from .neighbours import build_related, save_related
+from .answer_cache import get_answer_cache
+from .file_lock import FileLock
+from .metrics import StageTimer, span, inc, get_registry
+from .context_builder import get_context_builder, count_tokens
+from .async_pipeline import AsyncBatchRunner, run_async
+from .rag_context import get_rag_context, publish_highlights
+from .retriever import get_retriever
+from .incremental import PipelineState, fingerprint_articles, reuse_previous_results, vector_store_delta
+from .vector_store import (get_langchain_embeddings, init_chroma_client, get_openai_ef, upsert_articles,
+                           delete_articles, stale_article_ids)
 
-def process_news_pipeline(news_csv_path=None, highlights_csv_path=None, save_results=True):
+# Serialises pipeline runs so concurrent callers, in this or any other process, never interleave writes
+_pipeline_lock = FileLock(Config.PIPELINE_LOCK_PATH)
+
+def _process_incremental(df, state, progress):
+    """Classify, embed and cluster only the articles that are new or changed
+    
+    Only canonical articles are embedded; duplicates take their canonical
+    copy's results.
+    
+    Args:
+        df: Prepared DataFrame with 'fingerprint' and 'duplicate_of' columns
+        state: PipelineState loaded from the previous run
+        progress: Callback receiving the name of each stage as it starts
+        
+    Returns:
+        tuple: (processed_df, embeddings, clustering)
+    """
+    from .categorizer import NewsClassifier
+    from .clustering import NewsClustering
+    
+    df, is_new, embeddings = reuse_previous_results(df, state)
+    canonical = is_canonical(df)
+    to_embed = is_new & canonical
+    n_new = int(is_new.sum())
+    n_removed = len(set(state.articles['fingerprint']) - set(df['fingerprint']))
+    logger.info(f"Incremental run: {n_new} new or changed articles ({int(to_embed.sum())} to embed), "
+                f"{n_removed} removed")
+    
+    # Classify and embed the canonical delta only
+    progress("classify")
+    if to_embed.any():
+        classifier = NewsClassifier()
+        classified, new_embeddings = classifier.classify_dataframe(df[to_embed], return_embeddings=True)
+        df.loc[to_embed, 'predicted_category'] = classified['predicted_category'].to_numpy()
+        df.loc[to_embed, 'similarity'] = classified['similarity'].to_numpy()
+        embeddings[to_embed] = new_embeddings
+    df = propagate_duplicates(df, embeddings, columns=('predicted_category', 'similarity'))
+    
+    # Refit the clusters once drift crosses the threshold, otherwise label new points
+    progress("cluster")
+    clustering = state.clustering
+    drift = state.drift(n_new + n_removed)
+    if drift > Config.INCREMENTAL_REFIT_THRESHOLD:
+        logger.info(f"Cluster drift {drift:.1%} exceeds threshold, refitting clustering")
+        clustering = NewsClustering()
+        clusters = np.full(len(df), -1)
+        clusters[canonical] = clustering.fit_transform(embeddings[canonical])
+        state.fitted_rows = len(df)
+        state.changed_since_fit = 0
+    else:
+        clusters = df['cluster'].fillna(-1).to_numpy(dtype=int, copy=True)
+        if to_embed.any():
+            clusters[to_embed] = clustering.predict(embeddings[to_embed])
+        state.changed_since_fit += n_new + n_removed
+    
+    df['cluster'] = clusters
+    df = propagate_duplicates(df, columns=('cluster',))
+    df = NewsClustering.assign_clusters(df, df['cluster'])
+    return df, embeddings, clustering
+
+def process_news_pipeline(news_csv_path=None, highlights_csv_path=None, save_results=True, incremental=None,
+                          progress=None, streaming=None):
     """Run the complete news processing pipeline
     
+    Only one run executes at a time across processes; concurrent calls wait for the running one.
+    
     Args:
         news_csv_path: Path to input news CSV (if None, use Config.NEWS_CSV_PATH)
         highlights_csv_path: Path to save highlights (if None, use Config.HIGHLIGHTS_CSV_PATH)
         save_results: Whether to save results to CSV
+        incremental: Only process articles that are new or changed since the previous run
+            (if None, use Config.INCREMENTAL_PROCESSING)
+        progress: Optional callback receiving the name of each stage as it starts
+        streaming: Read the news CSV in chunks and keep the embeddings in a memory-mapped file,
+            for inputs larger than memory (if None, use Config.STREAMING_INGEST). processed_df
+            then only holds the id, predicted_category, similarity and cluster columns.
         
     Returns:
         tuple: (processed_df, highlights_df)
     """
+    # Each stage is timed into the stage histogram on its way to the progress callback
+    stages = StageTimer(progress)
+    status = "failed"
+    try:
+        with _pipeline_lock, span("pipeline"):
+            result = _run_pipeline(news_csv_path, highlights_csv_path, save_results, incremental, streaming,
+                                   stages)
+        status = "succeeded"
+        return result
+    finally:
+        stages.close()
+        inc("rag_pipeline_runs_total", status=status)
+        get_registry().flush(force=True)
+
+def _run_pipeline(news_csv_path, highlights_csv_path, save_results, incremental, streaming, progress):
+    """Body of process_news_pipeline, called with the pipeline lock held"""
+    # Classification, clustering (umap, hdbscan, numba) and LangChain load on the first run only,
+    # so processes that just serve requests never import them
+    from .categorizer import NewsClassifier, prepare_article_text
+    from .clustering import NewsClustering
+    from .highlights import HighlightExtractor
+    from .embedding_cache import log_cache_stats
+    
     if news_csv_path is None:
         news_csv_path = Config.NEWS_CSV_PATH
     
     if highlights_csv_path is None:
         highlights_csv_path = Config.HIGHLIGHTS_CSV_PATH
     
+    if incremental is None:
+        incremental = Config.INCREMENTAL_PROCESSING
+    
+    if streaming is None:
+        streaming = Config.STREAMING_INGEST
+    
+    if streaming:
+        if incremental:
+            logger.warning("Incremental processing is not supported by the streaming ingest, running a full pass")
+        result = _run_streaming(news_csv_path, save_results, progress)
+        log_cache_stats()
+        return result
+    
     # 1. Load and prepare data
+    progress("load")
     logger.info(f"Loading news data from {news_csv_path}")
     df = pd.read_csv(news_csv_path)
     df = prepare_article_text(df)
+    df['fingerprint'] = fingerprint_articles(df)
     
-    # 2. Initialize components
-    classifier = NewsClassifier()
-    clustering = NewsClustering()
-    highlighter = HighlightExtractor()
+    # Collapse exact and near-duplicate copies so each story is embedded once
+    progress("dedup")
+    df = mark_duplicates(df)
     
-    # 3. Classify articles
-    logger.info("Classifying articles")
-    df = classifier.classify_dataframe(df)
-    
-    # 4. Create embeddings for clustering
-    logger.info("Creating embeddings for clustering")
-    embeddings = classifier.batch_embed_texts(df['text'].tolist())
-    
-    # 5. Cluster articles
-    logger.info("Clustering articles to detect duplicates")
-    df = clustering.add_clusters_to_df(df, embeddings)
+    state = PipelineState().load() if incremental else None
+    highlighter = HighlightExtractor()
     
-    # 6. Extract highlights
+    if state is not None and state.exists:
+        # 2-4. Classify, embed and cluster the new or changed articles only
+        df, embeddings, clustering = _process_incremental(df, state, progress)
+        upsert_mask, removed_ids = vector_store_delta(df, state.articles)
+    else:
+        # 2. Initialize components
+        classifier = NewsClassifier()
+        clustering = NewsClustering()
+        
+        # 3. Classify canonical articles, keeping the embeddings for clustering and indexing
+        progress("classify")
+        logger.info("Classifying articles")
+        canonical = is_canonical(df)
+        classified, canonical_embeddings = classifier.classify_dataframe(df[canonical], return_embeddings=True)
+        df.loc[canonical, 'predicted_category'] = classified['predicted_category'].to_numpy()
+        df.loc[canonical, 'similarity'] = classified['similarity'].to_numpy()
+        
+        # 4. Cluster canonical articles and copy the results to their duplicates
+        progress("cluster")
+        logger.info("Clustering articles to detect duplicates")
+        df['cluster'] = -1
+        df.loc[canonical, 'cluster'] = clustering.fit_transform(canonical_embeddings)
+        # One float32 matrix for every later stage; without duplicates it is the classifier's own
+        if canonical.all():
+            embeddings = canonical_embeddings
+        else:
+            embeddings = np.zeros((len(df), canonical_embeddings.shape[1]), dtype=np.float32)
+            embeddings[canonical] = canonical_embeddings
+        del canonical_embeddings
+        df = propagate_duplicates(df, embeddings)
+        df = NewsClustering.assign_clusters(df, df['cluster'])
+        upsert_mask, removed_ids = None, []
+        if state is not None:
+            state.fitted_rows = len(df)
+            state.changed_since_fit = 0
+    
+    # 5. Extract highlights
+    progress("highlights")
     logger.info("Extracting important highlights")
     highlights_df = highlighter.extract_highlights(df)
     
-    # 7. Index articles in vector store
+    # 6. Index articles in vector store
+    progress("index")
     logger.info("Indexing articles in vector store")
-    upsert_articles(df, embeddings)
-    
-    # 8. Save results if requested
+    if upsert_mask is None:
+        upsert_articles(df, embeddings)
+        # A full run rewrites every entry; drop those of articles no longer in the news CSV
+        removed_ids = stale_article_ids(df['fingerprint'])
+    elif upsert_mask.any():
+        upsert_articles(df[upsert_mask], embeddings[upsert_mask])
+    delete_articles(removed_ids)
+    
+    # 7. Save results if requested
+    progress("save")
     if save_results:
         logger.info(f"Saving classified news to {Config.CLASSIFIED_ARTICLES_CSV_PATH}")
-        df.to_csv(Config.CLASSIFIED_ARTICLES_CSV_PATH, index=False)
+        save_frame(df, Config.CLASSIFIED_ARTICLES_CSV_PATH)
         
         logger.info(f"Saving highlights to {Config.HIGHLIGHTS_CSV_PATH}")
-        highlights_df.to_csv(Config.HIGHLIGHTS_CSV_PATH, index=False)
+        save_frame(highlights_df, Config.HIGHLIGHTS_CSV_PATH)
+        _save_article_indexes(df['id'], embeddings, df['predicted_category'], df['cluster'],
+                              canonical_positions(df), df)
+        
+        # Serve the new articles and highlights from the resident store and RAG context
+        refresh_article_store()
+        publish_highlights(Config.HIGHLIGHTS_CSV_PATH)
+    
+    if state is not None:
+        state.save(df, embeddings, clustering)
+    
+    log_cache_stats()
     
     return df, highlights_df
 
-def init_vector_store(highlights_path=None):
+def _run_streaming(news_csv_path, save_results, progress):
+    """Pipeline run over the news CSV a chunk at a time, see StreamingIngest"""
+    from .streaming import StreamingIngest
+    
+    # The run rewrites the vector store entries, outputs and cluster labels an incremental run would
+    # diff against, so the state of the previous run is dropped before anything is written
+    PipelineState().clear()
+    
+    ingest = StreamingIngest(news_csv_path)
+    try:
+        # 1-3. Load, deduplicate, classify, embed and index the articles a chunk at a time
+        ingest.ingest(progress)
+        
+        # 4. Cluster canonical articles from the memory-mapped embeddings
+        progress("cluster")
+        logger.info("Clustering articles to detect duplicates")
+        ingest.cluster()
+        
+        # 5. Write the classified articles and extract highlights in a second pass over the CSV
+        progress("save")
+        logger.info("Extracting important highlights")
+        highlights_df = ingest.write_outputs(Config.CLASSIFIED_ARTICLES_CSV_PATH if save_results else None)
+        
+        if save_results:
+            logger.info(f"Saving highlights to {Config.HIGHLIGHTS_CSV_PATH}")
+            save_frame(highlights_df, Config.HIGHLIGHTS_CSV_PATH)
+            
+            search_frame = None
+            if ingest.n_rows <= Config.STREAMING_SEARCH_INDEX_MAX_ROWS:
+                search_frame = load_frame(Config.CLASSIFIED_ARTICLES_CSV_PATH, columns=['Title', 'news_summary'])
+            else:
+                logger.warning(f"Not building the search index over {ingest.n_rows} articles "
+                               f"(STREAMING_SEARCH_INDEX_MAX_ROWS={Config.STREAMING_SEARCH_INDEX_MAX_ROWS})")
+            categories = np.asarray(ingest.categories, dtype=object)[ingest.category_codes]
+            _save_article_indexes(ingest.ids, ingest.embeddings, categories, ingest.clusters, ingest.canonical,
+                                  search_frame)
+            
+            refresh_article_store()
+            publish_highlights(Config.HIGHLIGHTS_CSV_PATH)
+        
+        return ingest.summary(), highlights_df
+    finally:
+        ingest.close()
+
+def _save_article_indexes(ids, embeddings, categories, clusters, canonical, search_frame=None):
+    """Save the embeddings and the search, ANN and related-article indexes of the classified articles
+    
+    Args:
+        ids: Article ids, in classified articles order
+        embeddings: Embedding matrix aligned with ids
+        categories: Predicted category per article
+        clusters: Cluster label per article
+        canonical: Row position of each article's canonical copy
+        search_frame: DataFrame with the Title and news_summary columns to build the search index
+            from (if None, the previous search index is removed and the article store builds its own)
+    """
+    save_embeddings(ids, embeddings)
+    
+    if search_frame is not None:
+        logger.info(f"Saving search index to {Config.SEARCH_INDEX_PATH}")
+        InvertedIndex.build(search_frame).save(Config.SEARCH_INDEX_PATH)
+    elif os.path.exists(Config.SEARCH_INDEX_PATH):
+        os.remove(Config.SEARCH_INDEX_PATH)
+    
+    ann_index = None
+    if Config.ANN_INDEX_ENABLED:
+        logger.info(f"Saving ANN index to {Config.ANN_INDEX_PATH}")
+        ann_index = ANNIndex.build(embeddings, categories, clusters, canonical)
+        ann_index.save(Config.ANN_INDEX_PATH)
+    
+    if Config.RELATED_ARTICLES_NEIGHBOURS:
+        with span("related"):
+            related = build_related(embeddings, clusters, canonical, ann_index)
+        save_related(related)
+
+def init_vector_store(highlights_path=None, collection_name=Config.HIGHLIGHTS_COLLECTION):
     """Initialize vector store with highlights for RAG using ChromaDB directly
     
     Args:
         highlights_path: Path to highlights CSV (if None, use Config.HIGHLIGHTS_CSV_PATH)
+        collection_name: Name of the collection to (re)create
         
     Returns:
         collection: ChromaDB collection with highlights
@@ -89,14 +327,14 @@ def init_vector_store(highlights_path=None):
     
     # Check if collection exists and delete it to ensure fresh data
     try:
-        chroma_client.delete_collection(name="highlights")
-        logger.info("Deleted existing highlights collection to refresh data")
+        chroma_client.delete_collection(name=collection_name)
+        logger.info(f"Deleted existing {collection_name} collection to refresh data")
     except Exception as e:
         logger.info(f"No existing collection found or error deleting: {str(e)}")
     
     # Create a fresh collection
     highlights_collection = chroma_client.create_collection(
-        name="highlights",
+        name=collection_name,
         embedding_function=openai_ef,
         metadata={"description": "News highlights for RAG"}
     )
@@ -104,7 +342,7 @@ def init_vector_store(highlights_path=None):
     # Load highlights data
     logger.info(f"Loading highlights data from {highlights_path}")
     try:
-        highlights_df = pd.read_csv(highlights_path)
+        highlights_df = load_frame(highlights_path)
     except FileNotFoundError:
         logger.warning(f"Highlights file {highlights_path} not found. Vector store will be empty.")
         return highlights_collection
@@ -128,46 +366,41 @@ def init_vector_store(highlights_path=None):
         }
         metadatas.append(metadata)
     
-    # Upsert documents to collection
+    # Embed and upsert documents batch by batch
     if ids and docs and metadatas:
-        highlights_collection.upsert(
-            ids=ids,
-            documents=docs,
-            metadatas=metadatas
-        )
+        runner = AsyncBatchRunner(get_langchain_embeddings())
+        with span("index_highlights"):
+            run_async(runner.embed_and_upsert(highlights_collection, ids, docs, metadatas=metadatas))
         logger.info(f"Added {len(ids)} highlights to vector store")
     else:
         logger.warning("No documents to add to vector store")
     
     # No need to call persist - PersistentClient writes automatically
     
+    # Answers cached against the previous highlights are stale now
+    get_answer_cache().invalidate()
+    
     return highlights_collection
 
-def answer_question(question, vector_store=None, k=5):
-    """Answer a question using RAG
+def retrieve_context(question, question_embedding, vector_store, k=5):
+    """Retrieve the documents used to answer a question
     
     Args:
         question: User question
-        vector_store: ChromaDB collection (if None, will be initialized)
+        question_embedding: Embedding of the question
+        vector_store: ChromaDB collection to query
         k: Number of documents to retrieve
         
     Returns:
-        dict: {"answer": str, "sources": list}
+        tuple: (context text for the prompt, list of sources)
     """
-    from langchain_openai import ChatOpenAI
-    from langchain.chains import LLMChain
-    from langchain.prompts import PromptTemplate
-    
-    # Get or initialize vector store
-    if vector_store is None:
-        vector_store = init_vector_store()
-    
     # Query for similar documents
-    results = vector_store.query(
-        query_texts=[question],
-        n_results=k,
-        include=["documents", "metadatas"]
-    )
+    with span("vector_search"):
+        results = vector_store.query(
+            query_embeddings=[question_embedding],
+            n_results=k,
+            include=["documents", "metadatas"]
+        )
     
     # Format context for prompt
     context = ""
@@ -177,9 +410,19 @@ def answer_question(question, vector_store=None, k=5):
     documents = results.get("documents", [[]])[0]
     metadatas = results.get("metadatas", [[]])[0]
     
+    # Fit the documents into the prompt token budget
+    if Config.CONTEXT_COMPRESSION:
+        passages = [{"id": (metadata or {}).get("source_id", f"source-{i}"), "title": None, "text": doc}
+                    for i, (doc, metadata) in enumerate(zip(documents, metadatas))]
+        with span("context"):
+            context, used = get_context_builder().build(question_embedding, passages)
+        documents = [documents[i] for i in used]
+        metadatas = [metadatas[i] for i in used]
+    
     for i, (doc, metadata) in enumerate(zip(documents, metadatas)):
         # Add document to context without the "Document X:" prefix
-        context += f"{doc}\n\n"
+        if not Config.CONTEXT_COMPRESSION:
+            context += f"{doc}\n\n"
         if metadata:
             source = {
                 "id": metadata.get("source_id", f"source-{i}"),
@@ -207,38 +450,119 @@ def answer_question(question, vector_store=None, k=5):
         if len(filtered_sources) >= 2:
             sources = filtered_sources
     
-    # Create prompt template
-    prompt_template = """
-    You are a helpful assistant that answers questions about today's news headlines.
-    Use the following context to answer the question. If you don't know the answer, just say you don't know.
-    Don't refer to "Document 1" or other document numbers in your answer.
-    Provide a natural, conversational response based on the information provided.
+    return context, sources
+
+def _retrieve(question, question_embedding, vector_store, k):
+    """Hybrid retrieval over all articles by default, or vector search over an explicit collection"""
+    with span("retrieve"):
+        if vector_store is None and Config.HYBRID_RETRIEVAL:
+            return get_retriever().retrieve_context(question, question_embedding, k)
+        if vector_store is None:
+            vector_store = get_rag_context().collection
+        return retrieve_context(question, question_embedding, vector_store, k)
+
+def _record_llm_call(mode, prompt_text, answer):
+    """Count a chat model call and its tokens, in the chat model's encoding"""
+    inc("rag_llm_calls_total", mode=mode)
+    inc("rag_llm_prompt_tokens_total", count_tokens(prompt_text))
+    inc("rag_llm_completion_tokens_total", count_tokens(answer))
+
+def answer_question(question, vector_store=None, k=5, stream=False):
+    """Answer a question using RAG
     
-    Context:
-    {context}
+    Args:
+        question: User question
+        vector_store: ChromaDB collection to retrieve from (if None, use hybrid retrieval over all
+            articles, or the highlights collection of the current RAG context when
+            Config.HYBRID_RETRIEVAL is off)
+        k: Number of documents to retrieve
+        stream: Return a generator of (event, payload) tuples instead of a dict
+        
+    Returns:
+        dict: {"answer": str, "sources": list}, or when stream is True a generator yielding
+            ("sources", list) once retrieval finishes, ("token", str) for each generated token
+            and finally ("done", {"answer": str, "sources": list})
+    """
+    if stream:
+        return _stream_answer(question, vector_store, k)
     
-    Question: {question}
+    start_time = time.perf_counter()
     
-    Answer:
-    """
+    # Reuse the warm collection and LLM chain
+    rag_context = get_rag_context()
+    use_cache = vector_store is None and Config.ANSWER_CACHE_ENABLED
     
-    prompt = PromptTemplate(
-        template=prompt_template,
-        input_variables=["context", "question"]
-    )
+    # Serve near-identical questions from the semantic answer cache
+    with span("embed"):
+        question_embedding = rag_context.embeddings.embed_query(question)
+    if use_cache:
+        cached = get_answer_cache().lookup(question_embedding, rag_context.generation)
+        if cached is not None:
+            return cached
     
-    # Create LLM chain
-    llm = ChatOpenAI(temperature=0.1)
-    chain = LLMChain(llm=llm, prompt=prompt)
+    context, sources = _retrieve(question, question_embedding, vector_store, k)
     
     # Generate answer - replace deprecated run method with invoke
     chain_input = {"context": context, "question": question}
-    result = chain.invoke(chain_input)
+    with span("generate"):
+        result = rag_context.chain.invoke(chain_input)
     
     # Extract the text from the result
     answer = result.get("text", "") if isinstance(result, dict) else str(result)
+    if Config.METRICS_ENABLED:
+        _record_llm_call("invoke", rag_context.prompt.format(**chain_input), answer)
     
-    return {
+    result = {
         "answer": answer,
         "sources": sources
-    } 
\ No newline at end of file
+    }
+    
+    if use_cache:
+        get_answer_cache().store(question_embedding, rag_context.generation, result,
+                                 time.perf_counter() - start_time)
+    
+    return result
+
+def _stream_answer(question, vector_store=None, k=5):
+    """Generator behind answer_question(stream=True)"""
+    start_time = time.perf_counter()
+    
+    rag_context = get_rag_context()
+    use_cache = vector_store is None and Config.ANSWER_CACHE_ENABLED
+    
+    with span("embed"):
+        question_embedding = rag_context.embeddings.embed_query(question)
+    if use_cache:
+        cached = get_answer_cache().lookup(question_embedding, rag_context.generation)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            yield "done", cached
+            return
+    
+    # Send the sources before generation starts
+    context, sources = _retrieve(question, question_embedding, vector_store, k)
+    yield "sources", sources
+    
+    # Relay tokens as the LLM produces them
+    prompt_text = rag_context.prompt.format(context=context, question=question)
+    tokens = []
+    with span("generate"):
+        for chunk in rag_context.llm.stream(prompt_text):
+            token = getattr(chunk, "content", chunk)
+            if token:
+                tokens.append(token)
+                yield "token", token
+    
+    result = {
+        "answer": "".join(tokens),
+        "sources": sources
+    }
+    if Config.METRICS_ENABLED:
+        _record_llm_call("stream", prompt_text, result["answer"])
+    
+    if use_cache:
+        get_answer_cache().store(question_embedding, rag_context.generation, result,
+                                 time.perf_counter() - start_time)
+    
+    yield "done", result
\ No newline at end of file
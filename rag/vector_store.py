@@ -1,25 +1,78 @@
 import os
-import chromadb
-from chromadb.utils import embedding_functions
-from langchain_openai import OpenAIEmbeddings
+import numpy as np
 from loguru import logger
 from config import Config
+from .async_pipeline import AsyncBatchRunner, run_async
+from .metrics import MeteredEmbeddings
+
+# chromadb, LangChain and the embedding wrappers are imported on first use, keeping them
+# off the import path of the API until a request needs the vector store
 
 def init_chroma_client():
     """Initialize ChromaDB client with persistent storage"""
+    import chromadb
+    
     os.makedirs(Config.VECTOR_STORE_PATH, exist_ok=True)
     return chromadb.PersistentClient(path=Config.VECTOR_STORE_PATH)
 
+def reset_chroma_client():
+    """Make the next client read the store afresh
+
+    Chroma shares one system per path within a process and keeps the vector
+    indexes it has loaded, so writes by another process only become visible
+    to clients created after the cache is cleared. Collections obtained
+    earlier keep working against the old system.
+    """
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+
 def get_openai_ef():
-    """Get OpenAI embedding function for ChromaDB"""
-    return embedding_functions.OpenAIEmbeddingFunction(
+    """Get the embedding function for ChromaDB, wrapped by the embedding cache
+    
+    Uses OpenAI, or the local provider selected by Config.EMBEDDING_PROVIDER.
+    """
+    from .embedding_cache import CachedEmbeddingFunction
+    
+    if Config.EMBEDDING_PROVIDER != "openai":
+        from .embedding_providers import ProviderEmbeddingFunction, get_provider
+        local_ef = ProviderEmbeddingFunction(get_provider())
+        if Config.EMBEDDING_CACHE_ENABLED:
+            return CachedEmbeddingFunction(local_ef, model_name=local_ef.model_name)
+        return local_ef
+    
+    from chromadb.utils import embedding_functions
+    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
         api_key=Config.OPENAI_API_KEY,
-        model_name="text-embedding-ada-002"
+        model_name=Config.EMBEDDING_MODEL,
+        api_base=Config.OPENAI_BASE_URL
     )
+    if Config.EMBEDDING_CACHE_ENABLED:
+        return CachedEmbeddingFunction(openai_ef, model_name=Config.EMBEDDING_MODEL)
+    return openai_ef
 
 def get_langchain_embeddings():
-    """Get LangChain OpenAI embeddings for compatibility with other modules"""
-    return OpenAIEmbeddings(api_key=Config.OPENAI_API_KEY)
+    """Get LangChain embeddings for compatibility with other modules
+    
+    Uses OpenAI, or the local provider selected by Config.EMBEDDING_PROVIDER.
+    """
+    from .embedding_cache import CachedEmbeddings
+    
+    if Config.EMBEDDING_PROVIDER != "openai":
+        from .embedding_providers import ProviderEmbeddings, get_provider
+        embeddings = MeteredEmbeddings(ProviderEmbeddings(get_provider()))
+        if Config.EMBEDDING_CACHE_ENABLED:
+            return CachedEmbeddings(embeddings, model_name=embeddings.model)
+        return embeddings
+    
+    from langchain_openai import OpenAIEmbeddings
+    embeddings = MeteredEmbeddings(OpenAIEmbeddings(
+        api_key=Config.OPENAI_API_KEY,
+        model=Config.EMBEDDING_MODEL,
+        base_url=Config.OPENAI_BASE_URL
+    ))
+    if Config.EMBEDDING_CACHE_ENABLED:
+        return CachedEmbeddings(embeddings, model_name=Config.EMBEDDING_MODEL)
+    return embeddings
 
 def init_categories_collection():
     """Initialize (or get) the categories collection using the direct ChromaDB approach"""
@@ -63,28 +116,82 @@ def init_articles_collection():
 def upsert_articles(articles_df, embeddings):
     """Upsert articles to the vector store
     
+    Entries are keyed on the article fingerprint rather than the row id, so
+    rows shifting position in the news CSV leave them in place. Exact copies
+    share one entry, stored for the first copy.
+    
     Args:
-        articles_df: DataFrame with articles (must contain id, text, Title, predicted_category, cluster)
-        embeddings: List of embeddings for each article
+        articles_df: DataFrame with articles (must contain fingerprint, text, Title, predicted_category, cluster)
+        embeddings: Embedding matrix with one row per article
     """
     collection = init_articles_collection()
     
-    # Ensure IDs are strings
-    articles_df = articles_df.copy()
-    articles_df['id'] = articles_df['id'].astype(str)
+    first = ~articles_df['fingerprint'].duplicated().to_numpy()
+    if not first.all():
+        articles_df, embeddings = articles_df[first], embeddings[first]
     
     # Prepare payload
     docs = articles_df['text'].tolist()
-    ids = articles_df['id'].tolist()
+    ids = articles_df['fingerprint'].astype(str).tolist()
     metas = articles_df[['Title', 'predicted_category', 'cluster']].to_dict(orient='records')
     
-    # Upsert articles
-    collection.upsert(
-        documents=docs,
-        embeddings=embeddings,
+    # Upsert articles in batches
+    run_async(AsyncBatchRunner().upsert(
+        collection,
         ids=ids,
+        embeddings=embeddings,
+        documents=docs,
         metadatas=metas
-    )
+    ))
     
     logger.info(f"Upserted {len(ids)} articles to the vector store")
-    return collection 
\ No newline at end of file
+    return collection 
+
+def delete_articles(ids, batch_size=Config.EMBEDDING_BATCH_SIZE):
+    """Delete articles from the vector store
+    
+    Args:
+        ids: List of article fingerprints to remove
+    """
+    if not len(ids):
+        return
+    collection = init_articles_collection()
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=[str(i) for i in ids[start:start + batch_size]])
+    logger.info(f"Deleted {len(ids)} articles from the vector store")
+
+def stale_article_ids(fingerprints, batch_size=Config.EMBEDDING_BATCH_SIZE):
+    """Ids in the vector store that belong to none of the given articles
+    
+    Args:
+        fingerprints: Fingerprints of the current articles
+    
+    Returns:
+        list: Ids to delete after a full run
+    """
+    collection = init_articles_collection()
+    stored = []
+    while True:
+        batch = collection.get(include=[], limit=batch_size, offset=len(stored))["ids"]
+        stored.extend(batch)
+        if len(batch) < batch_size:
+            break
+    stored = np.asarray(stored, dtype=object)
+    return stored[~np.isin(stored, np.asarray(fingerprints).astype(str).astype(object))].tolist()
+
+def update_article_clusters(ids, clusters, batch_size=Config.EMBEDDING_BATCH_SIZE):
+    """Set the cluster metadata of articles already in the vector store
+    
+    Their other metadata, documents and embeddings are kept.
+    
+    Args:
+        ids: Article fingerprints
+        clusters: Cluster of each article
+    """
+    collection = init_articles_collection()
+    for start in range(0, len(ids), batch_size):
+        collection.update(
+            ids=np.asarray(ids[start:start + batch_size]).astype(str).tolist(),
+            metadatas=[{"cluster": int(c)} for c in clusters[start:start + batch_size]]
+        )
+    logger.info(f"Updated the cluster of {len(ids)} articles in the vector store")
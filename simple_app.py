@@ -13,6 +13,7 @@ import umap
 import hdbscan
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from dotenv import load_dotenv
+from rag.embedding_cache import CachedEmbeddings, CachedEmbeddingFunction
 
 # Load environment variables
 load_dotenv()
@@ -61,7 +62,7 @@ PRIORITY_KEYWORDS = {
 
 # Initialize ChromaDB
 chroma_client = chromadb.PersistentClient(path="./chroma_db")
-embeddings = OpenAIEmbeddings()
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-ada-002"))
 
 # Initialize keyword patterns
 keyword_patterns = {
@@ -71,10 +72,10 @@ keyword_patterns = {
 
 def init_category_collection():
     """Initialize the categories collection in ChromaDB"""
-    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
+    openai_ef = CachedEmbeddingFunction(embedding_functions.OpenAIEmbeddingFunction(
         api_key=OPENAI_API_KEY,
         model_name="text-embedding-ada-002"
-    )
+    ))
     
     cat_coll = chroma_client.get_or_create_collection(
         name="news_categories",
@@ -171,10 +172,10 @@ def process_news(csv_path='datasets/Aggregated News Dataset - Sheet1.csv'):
     logger.info("Indexing articles for retrieval")
     art_coll = chroma_client.get_or_create_collection(
         name="news_articles",
-        embedding_function=embedding_functions.OpenAIEmbeddingFunction(
+        embedding_function=CachedEmbeddingFunction(embedding_functions.OpenAIEmbeddingFunction(
             api_key=OPENAI_API_KEY,
             model_name="text-embedding-ada-002"
-        ),
+        )),
         metadata={"description": "All articles indexed for retrieval"}
     )
     
@@ -202,10 +203,10 @@ def init_highlights_collection():
     highlights_path = 'datasets/daily_highlights.csv'
     
     # Get embedding function
-    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
+    openai_ef = CachedEmbeddingFunction(embedding_functions.OpenAIEmbeddingFunction(
         api_key=OPENAI_API_KEY,
         model_name="text-embedding-ada-002"
-    )
+    ))
     
     # Create or get collection
     highlights_coll = chroma_client.get_or_create_collection(
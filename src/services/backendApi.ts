@@ -113,16 +113,27 @@ export const askQuestion = async (question: string) => {
 /**
  * Trigger reprocessing of news data
  * @param params Optional parameters for processing
- * @returns Promise with processing result
+ * @returns Promise with the queued job id and status
  */
-export const processNews = async (params?: { news_csv_path?: string; highlights_csv_path?: string }) => {
+export const processNews = async (params?: { news_csv_path?: string; highlights_csv_path?: string; incremental?: boolean }) => {
   const { data } = await apiClient.post('/api/process', params || {});
   return data;
 };
 
+/**
+ * Get the status of a news processing job
+ * @param jobId Job id returned by processNews
+ * @returns Promise with job status, stage timings and result
+ */
+export const getProcessStatus = async (jobId: string) => {
+  const { data } = await apiClient.get(`/api/process/${jobId}`);
+  return data;
+};
+
 export default {
   getHighlights,
   getArticles,
   askQuestion,
   processNews,
+  getProcessStatus,
 }; 
\ No newline at end of file